@@ -0,0 +1,313 @@
+import csv
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for .arrow/.parquet output
+    pyarrow = None
+
+
+#Typed columns for the replay extractor
+#
+#A ColumnTable is a dict of numpy arrays of equal length plus, for categorical
+#columns (unit_type, killing_unit_type, replay), the list of names the integer codes
+#point into. Unit and killer ids are int64 (-1 when nobody killed the unit), game
+#seconds int32 and coordinates float32.
+#
+#ColumnWriter picks the format from the output path:
+#    *.csv              CSV export with the old "name:" headers
+#    *.arrow, *.parquet through pyarrow, when it is installed
+#    *.npz              one uncompressed .npz written on close
+#    anything else      a directory of uncompressed part-NNNNN.npz chunks
+#load_columns()/iter_chunks() read .npz files back as read-only memory maps of the
+#file, nothing is parsed or copied until a column is used.
+
+NO_KILLER = -1
+CHUNK_ROWS = 1 << 16
+
+#column, dtype, csv header; the csv keeps the column order the old string rows had
+LIFESPAN_COLUMNS = [
+    ('life_span', np.int32, 'life_span:'),
+    ('killing_unit_id', np.int64, 'killing_unit_id:'),
+    ('death_x', np.float32, 'death_x_coordinate:'),
+    ('death_y', np.float32, 'death_y_coordinate:'),
+    ('death_game_second', np.int32, 'death_game_second:'),
+    ('purchase_x', np.float32, 'purchase_x_coordinate:'),
+    ('purchase_y', np.float32, 'purchase_y_coordinate:'),
+    ('purchase_game_second', np.int32, 'purchase_game_second:'),
+    ('unit_id', np.int64, 'unit_id:'),
+    ('unit_type', np.int32, 'unit_type:'),
+]
+CSV_HEADERS = dict((name, header) for name, dtype, header in LIFESPAN_COLUMNS)
+CSV_HEADERS['replay'] = 'replay:'
+CSV_HEADERS['killing_unit_type'] = 'killing_unit_type:'  # newer than the old rows, written after them
+
+_CATEGORIES = 'categories.'
+
+
+class ColumnTable:
+    def __init__(self, columns, categories=None):
+        self.columns = columns  # name -> array, all the same length
+        self.categories = categories or {}  # categorical column -> list of names
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def decode(self, name):
+        #names of a categorical column as an object array
+        return np.asarray(self.categories[name], dtype=object)[self.columns[name]]
+
+    def with_category(self, name, value):
+        #adds a categorical column holding the same value on every row, e.g. the replay path
+        columns = dict(self.columns)
+        columns[name] = np.zeros(len(self), dtype=np.int32)
+        categories = dict(self.categories)
+        categories[name] = [value]
+        return ColumnTable(columns, categories)
+
+    def csv_names(self):
+        #columns in csv order: replay, the old lifespan columns, then the rest
+        names = [name for name, dtype, header in LIFESPAN_COLUMNS if name in self.columns]
+        names += [name for name in self.columns if name not in names and name != 'replay']
+        if 'replay' in self.columns:
+            names.insert(0, 'replay')
+        return names
+
+    def csv_headers(self):
+        return [CSV_HEADERS.get(name, name) for name in self.csv_names()]
+
+    def rows(self):
+        #dicts with the csv headers and string values, for the csv export
+        names = self.csv_names()
+        values = []
+        for name in names:
+            if name in self.categories:
+                values.append(self.decode(name).tolist())
+            elif name == 'killing_unit_id':
+                values.append([str(None) if value == NO_KILLER else str(value) for value in self.columns[name].tolist()])
+            else:
+                values.append(self.columns[name].tolist())
+        headers = self.csv_headers()
+        for row in zip(*values):
+            yield dict(zip(headers, (str(value) for value in row)))
+
+
+def concat(tables):
+    #one table out of several, categorical codes are remapped onto the union of the names
+    nonempty = [table for table in tables if len(table)]
+    if len(nonempty) <= 1:
+        return nonempty[0] if nonempty else tables[0] if tables else ColumnTable({})
+    tables = nonempty
+    columns, categories = {}, {}
+    for name in tables[0].columns:
+        if name not in tables[0].categories:
+            columns[name] = np.concatenate([table.columns[name] for table in tables])
+            continue
+        positions, parts = {}, []
+        for table in tables:
+            lookup = np.array([positions.setdefault(value, len(positions)) for value in table.categories[name]],
+                              dtype=np.int32)
+            parts.append(lookup[table.columns[name]])
+        columns[name] = np.concatenate(parts)
+        categories[name] = sorted(positions, key=positions.get)
+    return ColumnTable(columns, categories)
+
+
+def save_npz(path, table):
+    #uncompressed so the members stay memory mappable
+    arrays = dict(table.columns)
+    for name, names in table.categories.items():
+        arrays[_CATEGORIES + name] = np.array(names, dtype=str)
+    with open(path, 'wb') as out:
+        np.savez(out, **arrays)
+
+
+def map_npz(path):
+    #ColumnTable whose columns are read-only memory maps of the stored .npy members
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as raw:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(archive.open(info))
+                continue
+            # the local file header is 30 bytes plus the name and an extra field
+            raw.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', raw.read(4))
+            raw.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(raw)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(raw)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(raw)
+            if 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=raw.tell(), shape=shape,
+                                         order='F' if fortran else 'C')
+    columns, categories = {}, {}
+    for name, array in arrays.items():
+        if name.startswith(_CATEGORIES):
+            categories[name[len(_CATEGORIES):]] = array.tolist()
+        else:
+            columns[name] = array
+    return ColumnTable(columns, categories)
+
+
+def read_npz(path):
+    #ColumnTable read into memory, nothing keeps the file open afterwards
+    columns, categories = {}, {}
+    with np.load(path) as arrays:
+        for name in arrays.files:
+            if name.startswith(_CATEGORIES):
+                categories[name[len(_CATEGORIES):]] = arrays[name].tolist()
+            else:
+                columns[name] = arrays[name]
+    return ColumnTable(columns, categories)
+
+
+def _to_arrow(table):
+    names, arrays = [], []
+    for name, column in table.columns.items():
+        names.append(name)
+        if name in table.categories:
+            arrays.append(pyarrow.DictionaryArray.from_arrays(column, table.categories[name]).cast(pyarrow.string()))
+        else:
+            arrays.append(pyarrow.array(column))
+    return pyarrow.Table.from_arrays(arrays, names=names)
+
+
+def _from_arrow(arrow):
+    columns, categories = {}, {}
+    for name in arrow.column_names:
+        column = arrow.column(name).combine_chunks()
+        if pyarrow.types.is_string(column.type) or pyarrow.types.is_dictionary(column.type):
+            encoded = column.dictionary_encode() if pyarrow.types.is_string(column.type) else column
+            columns[name] = encoded.indices.to_numpy().astype(np.int32)
+            categories[name] = encoded.dictionary.to_pylist()
+        else:
+            columns[name] = column.to_numpy()  # zero-copy for the numeric columns without nulls
+    return ColumnTable(columns, categories)
+
+
+def chunk_paths(path):
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.startswith('part-') and name.endswith('.npz')]
+    return [path]
+
+
+def iter_chunks(path):
+    #ColumnTable per stored chunk
+    if path.endswith('.arrow') or path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError('reading %s needs pyarrow' % path)
+        if path.endswith('.arrow'):
+            with pyarrow.memory_map(path) as source:
+                reader = pyarrow.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield _from_arrow(pyarrow.Table.from_batches([reader.get_batch(i)]))
+        else:
+            parquet = pyarrow.parquet.ParquetFile(path)
+            for i in range(parquet.num_row_groups):
+                yield _from_arrow(parquet.read_row_group(i))
+        return
+    for chunk in chunk_paths(path):
+        yield map_npz(chunk)
+
+
+def load_columns(path):
+    #the whole output as one ColumnTable, zero-copy when it is a single chunk
+    return concat(list(iter_chunks(path)))
+
+
+class ColumnWriter:
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.chunks = 0
+        self.rows = 0
+        self.csv = None
+        self.arrow = None
+        self.empty = None  # the first empty table, written on close when no rows ever came
+        if path.endswith('.csv'):
+            self.format = 'csv'
+            # the file is there from the start, empty results still leave a csv behind
+            self.csv_file = open(path, 'w', newline='')
+        elif path.endswith('.arrow') or path.endswith('.parquet'):
+            if pyarrow is None:
+                raise ImportError('%s output needs pyarrow, use .npz or a directory instead' % path)
+            self.format = path.rsplit('.', 1)[1]
+        elif path.endswith('.npz'):
+            self.format = 'npz'
+        else:
+            self.format = 'parts'
+            os.makedirs(path, exist_ok=True)
+            for old in chunk_paths(path):
+                os.remove(old)
+
+    def write(self, table):
+        if self.format == 'csv':
+            self.writeCsv(table)  # the first table gives the header, even without rows
+            self.rows += len(table)
+            return
+        if not len(table):
+            if self.empty is None:
+                self.empty = table
+            return
+        self.rows += len(table)
+        self.pending.append(table)
+        self.pending_rows += len(table)
+        if self.format != 'npz' and self.pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def writeCsv(self, table):
+        if self.csv is None:
+            self.csv = csv.DictWriter(self.csv_file, table.csv_headers())
+            self.csv.writeheader()
+        self.csv.writerows(table.rows())
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = concat(self.pending)
+        self.pending = []
+        self.pending_rows = 0
+        if self.format == 'parts':
+            save_npz(os.path.join(self.path, 'part-%05d.npz' % self.chunks), table)
+        elif self.format == 'npz':
+            save_npz(self.path, table)
+        else:
+            arrow = _to_arrow(table)
+            if self.arrow is None:
+                self.arrow = pyarrow.parquet.ParquetWriter(self.path, arrow.schema) if self.format == 'parquet' \
+                    else pyarrow.ipc.new_file(self.path, arrow.schema)
+            self.arrow.write_table(arrow)
+        self.chunks += 1
+
+    def close(self):
+        if self.format != 'csv' and not self.chunks and not self.pending and self.empty is not None:
+            self.pending.append(self.empty)  # an empty result still gets its columns written
+        self.flush()
+        if self.format == 'csv':
+            self.csv_file.close()
+        if self.arrow is not None:
+            self.arrow.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
@@ -0,0 +1,244 @@
+import json
+
+import numpy as np
+import sc2reader
+
+from columns import NO_KILLER, ColumnTable
+from lifecycle import NO_VALUE, UnitLifecycleIndex
+
+
+#What to pull out of a replay, as a spec compiled into a dispatch table
+#
+#A spec maps output names to options, e.g.
+#
+#    {"lifespans": {"unit_types": ["Marine", "Reaper", "SCV"]},
+#     "structures": {"unit_types": ["Barracks", "SupplyDepot", "Refinery"]},
+#     "births": {},
+#     "player_stats": {}}
+#
+#The output kind is the name unless the options give a "kind", so one spec can hold two
+#tables of the same kind ({"bio": {"kind": "lifespans", ...}}). A missing or null
+#unit_types means every unit type. Kinds:
+#    lifespans     units that died: born/init joined with their death and killer
+#    births        every UnitBornEvent (trained or spawned units)
+#    structures    UnitInitEvent joined with its UnitDoneEvent, -1 while unfinished
+#    player_stats  PlayerStatsEvent resources, supply, workers and collection rates
+#
+#Extraction(spec) builds one collector per output and a dict from event class to the
+#collector methods that want it. run(events) makes a single pass, looks up each event's
+#class once and hands it to those methods only, yielding (output name, ColumnTable)
+#batches as collectors fill up. Every output gets at least one table, even if empty.
+
+BATCH_ROWS = 4096
+DEFAULT_SPEC = {'lifespans': {'unit_types': ['Marine']}}
+
+_tracker = sc2reader.events.tracker
+
+
+def categorical(names):
+    #(int32 codes, category list) for a list of strings
+    categories, codes = np.unique(np.array(names, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), categories.tolist()
+
+
+def lifespan_table(index, rows):
+    #typed columns for the given lifecycle index rows
+    rows = np.array(rows, dtype=np.intp)
+
+    def column(values, dtype):
+        return np.frombuffer(values, dtype=values.typecode)[rows].astype(dtype)
+
+    born_second = column(index.born_second, np.int32)
+    died_second = column(index.died_second, np.int32)
+    killer_id = column(index.killer_id, np.int64)
+    killer_id[killer_id == NO_VALUE] = NO_KILLER
+    # only the unit types that actually occur become categories
+    types, unit_type = np.unique(column(index.unit_type, np.int32), return_inverse=True)
+    # the killer's type at the time of the kill, 'None' when there was no killer or it was never born
+    killer_types, killer_type = np.unique(column(index.killer_type, np.int32), return_inverse=True)
+    return ColumnTable({
+        'unit_type': unit_type.astype(np.int32),
+        'unit_id': column(index.unit_id, np.int64),
+        'purchase_game_second': born_second,
+        'purchase_x': column(index.born_x, np.float32),
+        'purchase_y': column(index.born_y, np.float32),
+        'death_game_second': died_second,
+        'death_x': column(index.died_x, np.float32),
+        'death_y': column(index.died_y, np.float32),
+        'killing_unit_id': killer_id,
+        'killing_unit_type': killer_type.astype(np.int32),
+        'life_span': died_second - born_second,
+    }, {'unit_type': [index.type_names[code] for code in types.tolist()],
+        'killing_unit_type': [str(None) if code == NO_VALUE else index.type_names[code]
+                              for code in killer_types.tolist()]})
+
+
+class Collector:
+    #one output; handlers maps event classes to method names, a handler returns True once
+    #batch_rows rows are waiting
+    handlers = {}
+
+    def __init__(self, name, batch_rows, unit_types=None):
+        self.name = name
+        self.batch_rows = batch_rows
+        self.unit_types = None if unit_types is None else frozenset(unit_types)
+        self.reset()
+
+    def wants(self, type_name):
+        return self.unit_types is None or type_name in self.unit_types
+
+
+class ColumnCollector(Collector):
+    #rows kept as one list per column until take() turns them into arrays
+    columns = []  # (name, dtype), dtype None for a categorical column of strings
+
+    def reset(self):
+        self.values = [[] for column in self.columns]
+
+    def append(self, *row):
+        for values, value in zip(self.values, row):
+            values.append(value)
+        return len(self.values[0]) >= self.batch_rows
+
+    def take(self):
+        columns, categories = {}, {}
+        for (name, dtype), values in zip(self.columns, self.values):
+            if dtype is None:
+                columns[name], categories[name] = categorical(values)
+            else:
+                columns[name] = np.array(values, dtype=dtype)
+        self.reset()
+        return ColumnTable(columns, categories)
+
+
+class Lifespans(Collector):
+    handlers = {_tracker.UnitBornEvent: 'born', _tracker.UnitInitEvent: 'born',
+                _tracker.UnitTypeChangeEvent: 'changed', _tracker.UnitDiedEvent: 'died'}
+
+    def reset(self):
+        self.index = UnitLifecycleIndex()
+        self.rows = []
+
+    def born(self, event):
+        self.index.born(event.unit_id, event.unit_type_name, event.second, event.location)
+
+    def changed(self, event):
+        self.index.changed(event.unit_id, event.unit_type_name)
+
+    def died(self, event):
+        index = self.index
+        row = index.died(event.unit_id, event.second, event.location, event.killing_unit_id)
+        # filtered by the type the unit was born as
+        if row is not None and self.wants(index.type_names[index.unit_type[row]]):
+            self.rows.append(row)
+            return len(self.rows) >= self.batch_rows
+        return False
+
+    def take(self):
+        table = lifespan_table(self.index, self.rows)
+        self.rows = []  # the index stays, later deaths still need the births
+        return table
+
+
+class Births(ColumnCollector):
+    handlers = {_tracker.UnitBornEvent: 'born'}
+    columns = [('unit_type', None), ('unit_id', np.int64), ('player', np.int32), ('game_second', np.int32),
+               ('x', np.float32), ('y', np.float32)]
+
+    def born(self, event):
+        if self.wants(event.unit_type_name):
+            return self.append(event.unit_type_name, event.unit_id, event.control_pid, event.second,
+                               event.x, event.y)
+        return False
+
+
+class Structures(ColumnCollector):
+    handlers = {_tracker.UnitInitEvent: 'started', _tracker.UnitDoneEvent: 'done'}
+    columns = [('unit_type', None), ('unit_id', np.int64), ('player', np.int32), ('start_game_second', np.int32),
+               ('done_game_second', np.int32), ('x', np.float32), ('y', np.float32)]
+
+    def reset(self):
+        ColumnCollector.reset(self)
+        self.pending = {}  # unit_id -> row, a structure is only complete once its UnitDoneEvent is in
+
+    def started(self, event):
+        # never reports a full batch, rows have to stay put until their UnitDoneEvent, the
+        # whole table comes out at the end with -1 for structures that were never finished
+        if self.wants(event.unit_type_name):
+            self.pending[event.unit_id] = len(self.values[0])
+            self.append(event.unit_type_name, event.unit_id, event.control_pid, event.second, NO_VALUE,
+                        event.x, event.y)
+        return False
+
+    def done(self, event):
+        row = self.pending.pop(event.unit_id, None)
+        if row is not None:
+            self.values[4][row] = event.second
+        return False
+
+
+class PlayerStats(ColumnCollector):
+    handlers = {_tracker.PlayerStatsEvent: 'stats'}
+    columns = [('player', np.int32), ('game_second', np.int32), ('minerals', np.int32), ('vespene', np.int32),
+               ('minerals_rate', np.int32), ('vespene_rate', np.int32), ('workers', np.int32),
+               ('food_used', np.float32), ('food_made', np.float32)]
+
+    def __init__(self, name, batch_rows, unit_types=None):
+        if unit_types is not None:
+            raise ValueError('%s: player_stats takes no unit_types' % name)
+        ColumnCollector.__init__(self, name, batch_rows)
+
+    def stats(self, event):
+        return self.append(event.pid, event.second, event.minerals_current, event.vespene_current,
+                           event.minerals_collection_rate, event.vespene_collection_rate,
+                           event.workers_active_count, event.food_used, event.food_made)
+
+
+KINDS = {'lifespans': Lifespans, 'births': Births, 'structures': Structures, 'player_stats': PlayerStats}
+
+
+def load_spec(path):
+    with open(path) as data:
+        return json.load(data)
+
+
+def spec_version(spec):
+    #stable text for cache keys, two specs that compile the same give the same string
+    return json.dumps(spec, sort_keys=True, separators=(',', ':'))
+
+
+class Extraction:
+    def __init__(self, spec=DEFAULT_SPEC, batch_rows=BATCH_ROWS):
+        self.spec = spec
+        self.collectors = []
+        for name, options in spec.items():
+            options = dict(options or {})
+            kind = options.pop('kind', name)
+            if kind not in KINDS:
+                raise ValueError('%s: unknown output kind %r, expected one of %s' % (name, kind, ', '.join(sorted(KINDS))))
+            self.collectors.append(KINDS[kind](name, batch_rows, **options))
+        self.names = [collector.name for collector in self.collectors]
+
+        # event class -> ((bound handler, collector), ...)
+        dispatch = {}
+        for collector in self.collectors:
+            for event_class, method in collector.handlers.items():
+                dispatch.setdefault(event_class, []).append((getattr(collector, method), collector))
+        self.dispatch = dict((event_class, tuple(handlers)) for event_class, handlers in dispatch.items())
+        # for replay_loader.stream_events, only these classes need to be decoded into objects
+        self.event_classes = tuple(self.dispatch)
+
+    def run(self, events):
+        #one pass over events, yields (output name, ColumnTable) batches
+        for collector in self.collectors:
+            collector.reset()
+        dispatch = self.dispatch
+        for event in events:
+            handlers = dispatch.get(type(event))
+            if handlers is None:
+                continue
+            for handler, collector in handlers:
+                if handler(event):
+                    yield collector.name, collector.take()
+        for collector in self.collectors:
+            yield collector.name, collector.take()
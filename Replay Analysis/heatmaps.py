@@ -0,0 +1,170 @@
+import argparse
+
+import numpy as np
+
+from columns import ColumnTable, iter_chunks, save_npz
+
+
+#2D histograms of where units are born and die, from sc2script_csv.py output
+#
+#python heatmaps.py all_units marine_heatmaps.npz --units Marine --window 120
+#
+#Every row of a lifespans table (or births/structures) is binned into cells of --cell
+#game units on a --size x --size grid, separately for every (event, map, unit type,
+#game time window). The input is read a chunk at a time (iter_chunks, at most
+#--chunk-rows rows are binned together) and all the binning of a chunk is one
+#np.bincount over a combined group and cell index, so nothing loops over rows in
+#Python and memory does not grow with the number of replays.
+#
+#The result is itself a ColumnTable, one row per heatmap: event, map and unit_type
+#as categorical columns, window_start in game seconds and counts, an int32 array of
+#rows x size/cell x size/cell. save_npz/map_npz store and load it like any other
+#output, e.g.
+#
+#    heatmaps = load_columns('marine_heatmaps.npz')
+#    died = heatmaps.decode('event') == 'died'
+#    total = heatmaps['counts'][died].sum(axis=0)
+
+MAP_SIZE = 256  # largest playable SC2 map side, in game units
+CHUNK_ROWS = 1 << 18
+
+#event -> (x, y, game second) columns, whichever set the table has
+EVENT_COLUMNS = {
+    'born': [('purchase_x', 'purchase_y', 'purchase_game_second'), ('x', 'y', 'game_second'),
+             ('x', 'y', 'start_game_second')],
+    'died': [('death_x', 'death_y', 'death_game_second')],
+}
+
+
+class Heatmaps:
+    def __init__(self, cell=4, size=MAP_SIZE, window=None, events=('born', 'died'), unit_types=None):
+        self.cell = cell
+        self.side = -(-size // cell)
+        self.window = window  # seconds per time window, None for the whole game
+        self.events = list(events)
+        self.unit_types = None if unit_types is None else set(unit_types)
+        self.names = {'map': [], 'unit_type': []}
+        self.positions = {'map': {}, 'unit_type': {}}
+        self.counts = {}  # (event, map, unit type, window) -> side x side int64 counts
+
+    def global_codes(self, table, name):
+        #the table's codes for a categorical column, as positions in self.names[name]
+        positions, names = self.positions[name], self.names[name]
+        if name not in table.columns:
+            # tables written without that column count under ''
+            value = positions.setdefault('', len(positions))
+            if value == len(names):
+                names.append('')
+            return np.full(len(table), value, dtype=np.int64)
+        lookup = []
+        for value in table.categories[name]:
+            if value not in positions:
+                positions[value] = len(names)
+                names.append(value)
+            lookup.append(positions[value])
+        return np.array(lookup, dtype=np.int64)[np.asarray(table.columns[name])]
+
+    def add(self, table):
+        #bins every row of table, whatever the table holds rows for
+        if not len(table):
+            return
+        maps = self.global_codes(table, 'map')
+        unit_types = self.global_codes(table, 'unit_type')
+        keep = None
+        if self.unit_types is not None:
+            wanted = np.array([name in self.unit_types for name in self.names['unit_type']], dtype=bool)
+            keep = wanted[unit_types]
+        for event in self.events:
+            columns = next((names for names in EVENT_COLUMNS[event] if all(name in table.columns for name in names)),
+                           None)
+            if columns is not None:
+                self.bin(event, table, columns, maps, unit_types, keep)
+
+    def bin(self, event, table, columns, maps, unit_types, keep):
+        x, y, second = (np.asarray(table.columns[name]) for name in columns)
+        valid = (second >= 0) & (x >= 0) & (y >= 0)  # -1 for units that never died or structures never done
+        if keep is not None:
+            valid &= keep
+        if not valid.all():
+            x, y, second, maps, unit_types = x[valid], y[valid], second[valid], maps[valid], unit_types[valid]
+        if not len(x):
+            return
+        side = self.side
+        column = np.minimum((x // self.cell).astype(np.int64), side - 1)
+        row = np.minimum((y // self.cell).astype(np.int64), side - 1)
+        windows = second.astype(np.int64) // self.window if self.window else np.zeros(len(x), dtype=np.int64)
+
+        # one group id per (map, unit type, window) present in the chunk, then a single bincount
+        groups = (maps * len(self.names['unit_type']) + unit_types) * (windows.max() + 1) + windows
+        keys, group = np.unique(groups, return_inverse=True)
+        counts = np.bincount(group * side * side + row * side + column,
+                             minlength=len(keys) * side * side).reshape(len(keys), side, side)
+
+        types, window_count = len(self.names['unit_type']), windows.max() + 1
+        for key, grid in zip(keys.tolist(), counts):
+            map_code, rest = divmod(key, types * window_count)
+            type_code, window = divmod(rest, window_count)
+            index = (event, map_code, type_code, window)
+            if index in self.counts:
+                self.counts[index] += grid
+            else:
+                self.counts[index] = grid.astype(np.int64)
+
+    def add_path(self, path, chunk_rows=CHUNK_ROWS):
+        #bins a sc2script_csv.py output chunk by chunk, at most chunk_rows rows at a time
+        for table in iter_chunks(path):
+            for start in range(0, len(table), chunk_rows):
+                self.add(ColumnTable(dict((name, column[start:start + chunk_rows])
+                                          for name, column in table.columns.items()), table.categories))
+
+    def table(self):
+        #one row per heatmap, sorted by event, map, unit type and window
+        index = sorted(self.counts, key=lambda key: (key[0], self.names['map'][key[1]],
+                                                     self.names['unit_type'][key[2]], key[3]))
+        events = [key[0] for key in index]
+        columns = {
+            'event': np.array([self.events.index(event) for event in events], dtype=np.int32),
+            'map': np.array([key[1] for key in index], dtype=np.int32),
+            'unit_type': np.array([key[2] for key in index], dtype=np.int32),
+            'window_start': np.array([key[3] * (self.window or 0) for key in index], dtype=np.int32),
+            'counts': np.array([self.counts[key] for key in index], dtype=np.int32).reshape(
+                len(index), self.side, self.side),
+        }
+        return ColumnTable(columns, {'event': list(self.events), 'map': list(self.names['map']),
+                                     'unit_type': list(self.names['unit_type'])})
+
+
+def heatmap_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('columns_in', metavar='PATH', type=str, nargs='+',
+                        help="sc2script_csv.py output, a directory of .npz chunks or a .npz/.arrow/.parquet file")
+    parser.add_argument('out', metavar='PATH', type=str, help=".npz file for the heatmaps")
+    parser.add_argument('--cell', type=int, default=4, help="cell side in game units")
+    parser.add_argument('--size', type=int, default=MAP_SIZE, help="grid side in game units")
+    parser.add_argument('--window', type=int, default=None, help="game seconds per time window, default whole game")
+    parser.add_argument('--events', type=str, default='born,died')
+    parser.add_argument('--units', type=str, default=None, help="comma separated unit types, default all")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    return parser.parse_args()
+
+
+def main():
+    args = heatmap_parser()
+    heatmaps = Heatmaps(args.cell, args.size, args.window, args.events.split(','),
+                        args.units.split(',') if args.units else None)
+    for path in args.columns_in:
+        heatmaps.add_path(path, args.chunk_rows)
+    table = heatmaps.table()
+    save_npz(args.out, table)
+
+    counts = table['counts']
+    events, maps, types = table.decode('event'), table.decode('map'), table.decode('unit_type')
+    print('%d heatmaps of %dx%d cells' % (len(table), heatmaps.side, heatmaps.side))
+    for i in np.argsort(-counts.sum(axis=(1, 2)))[:10]:
+        row, column = np.unravel_index(np.argmax(counts[i]), counts[i].shape)
+        print('%-5s %-28s %-14s t>=%5ds %6d units, busiest cell (%d, %d)' % (
+            events[i], maps[i], types[i], table['window_start'][i], counts[i].sum(),
+            column * args.cell, row * args.cell))
+
+if __name__ == '__main__':
+    main()
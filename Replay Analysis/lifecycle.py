@@ -0,0 +1,76 @@
+from array import array
+
+
+#Unit lifecycle index, filled by extraction_spec.Lifespans in one pass over the events
+#Every unit that is born (UnitBornEvent) or starts construction (UnitInitEvent) gets
+#a row keyed by unit_id. Birth, death, locations and the killer are kept in typed
+#arrays instead of one dict per event, unit type names are stored once and referred to
+#by index. A type change (e.g. SiegeTank -> SiegeTankSieged) only updates the unit's
+#current type, which is what its kills are credited to. Deaths find their row through
+#the unit_id dict, so joining births to deaths is a single O(n) pass instead of
+#comparing every birth with every death.
+
+NO_VALUE = -1
+
+
+class UnitLifecycleIndex:
+    def __init__(self):
+        self.rows = {}  # unit_id -> row
+        self.type_names = []
+        self.type_index = {}  # type name -> position in type_names
+
+        self.unit_id = array('q')
+        self.unit_type = array('i')  # type when the unit was born
+        self.current_type = array('i')
+        self.born_second = array('i')
+        self.born_x = array('i')
+        self.born_y = array('i')
+        self.died_second = array('i')
+        self.died_x = array('i')
+        self.died_y = array('i')
+        self.killer_id = array('q')
+        self.killer_type = array('i')
+
+    def __len__(self):
+        return len(self.unit_id)
+
+    def intern_type(self, name):
+        index = self.type_index.get(name)
+        if index is None:
+            index = self.type_index[name] = len(self.type_names)
+            self.type_names.append(name)
+        return index
+
+    def born(self, unit_id, type_name, second, location):
+        if unit_id in self.rows:
+            return  # ids are not reused, keep the first birth if one is ever repeated
+        type_id = self.intern_type(type_name)
+        self.rows[unit_id] = len(self.unit_id)
+        self.unit_id.append(unit_id)
+        self.unit_type.append(type_id)
+        self.current_type.append(type_id)
+        self.born_second.append(second)
+        self.born_x.append(location[0])
+        self.born_y.append(location[1])
+        for column in (self.died_second, self.died_x, self.died_y, self.killer_id, self.killer_type):
+            column.append(NO_VALUE)
+
+    def died(self, unit_id, second, location, killer_id):
+        #returns the row of the unit, None for a unit that was never born
+        row = self.rows.get(unit_id)
+        if row is None:
+            return None
+        self.died_second[row] = second
+        self.died_x[row] = location[0]
+        self.died_y[row] = location[1]
+        if killer_id is not None:
+            self.killer_id[row] = killer_id
+            killer = self.rows.get(killer_id)
+            if killer is not None:
+                self.killer_type[row] = self.current_type[killer]
+        return row
+
+    def changed(self, unit_id, type_name):
+        row = self.rows.get(unit_id)
+        if row is not None:
+            self.current_type[row] = self.intern_type(type_name)
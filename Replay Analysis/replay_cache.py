@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+import sc2reader
+
+from columns import map_npz, save_npz
+
+
+#Parsed replay cache, keyed by what is in the replay file and how it was extracted
+#
+#The key is the sha256 of a version string (extractor version, extraction spec, sc2reader
+#version) followed by the bytes of the .SC2Replay, so a renamed or copied replay is still
+#a hit and a changed file or extractor is a miss. Every entry is a file under
+#<directory>/<first two hex digits>/: <key>.<output>.npz holds the ColumnTable of one
+#extraction output, <key>.err the error of a replay sc2reader could not read, so it is
+#not retried every run. Only sc2reader's own exceptions (CACHED_ERRORS) are, they come
+#back the same every time; a MemoryError or an interrupted read must not stick to the
+#replay. retry_errors=True parses replays with a cached error again. Entries are written to a temporary name and renamed, an
+#interrupted run never leaves half a file behind.
+
+_READ_SIZE = 1 << 20
+
+#errors that are a property of the replay file, the same on every attempt
+CACHED_ERRORS = (sc2reader.exceptions.SC2ReaderError,)
+
+
+class ReplayCache:
+    def __init__(self, directory, version, retry_errors=False):
+        self.directory = directory
+        self.version = version.encode('utf-8')
+        self.retry_errors = retry_errors
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, in_path):
+        digest = hashlib.sha256(self.version + b'\0')
+        with open(in_path, 'rb') as replay:
+            for block in iter(lambda: replay.read(_READ_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def get(self, key, names):
+        #({output: table}, None) or (None, error) for a cached replay, None when it has to be parsed
+        tables = {}
+        for name in names:
+            table_path = self.path(key, '.%s.npz' % name)
+            if not os.path.isfile(table_path):
+                break
+            tables[name] = map_npz(table_path)
+        else:
+            self.hits += 1
+            return tables, None
+        error_path = self.path(key, '.err')
+        if not self.retry_errors and os.path.isfile(error_path):
+            self.hits += 1
+            with open(error_path) as data:
+                return None, data.read()
+        self.misses += 1
+        return None
+
+    def put(self, key, tables=None, error=None):
+        if error is not None:
+            self.write(self.path(key, '.err'), error=error)
+        elif os.path.isfile(self.path(key, '.err')):
+            os.remove(self.path(key, '.err'))  # a retried replay that parses now
+        for name, table in (tables or {}).items():
+            self.write(self.path(key, '.%s.npz' % name), table)
+
+    def write(self, final, table=None, error=None):
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        temp = '%s.%d.tmp' % (final, os.getpid())
+        if error is None:
+            save_npz(temp, table)
+        else:
+            with open(temp, 'w') as out:
+                out.write(error)
+        os.replace(temp, final)
@@ -0,0 +1,144 @@
+import argparse
+import statistics
+import time
+
+import sc2reader
+from sc2reader.decoders import BitPackedDecoder
+from sc2reader.engine import GameEngine
+from sc2reader.engine.plugins import APMTracker, SelectionTracker
+from sc2reader.readers import TrackerEventsReader
+from sc2reader.utils import extract_data_file
+
+
+#Loads a replay only as far as the outputs asked for need
+#
+#sc2reader reads a replay in levels: 1 details, 2 players and chat, 3 tracker events,
+#4 game events. Game events (every click and command) are by far the slowest part, and
+#after loading, the default engine runs every registered plugin over all events. The
+#unit lifespans only need tracker events and no plugin, so they load at level 3
+#without running the engine at all. Plugins are instantiated per load and only for
+#the outputs that need them, nothing is registered on the global sc2reader engine.
+#
+#With stream=True a tracker level load stops at level 2 and stream_events() decodes
+#the tracker events from the archive one at a time, so no list of every event in the
+#replay is ever built and memory stays flat however long the game is.
+#
+#python replay_loader.py csv_script --limit 20    per replay parse time, full load vs minimal
+
+#output -> (load level, engine plugin classes)
+OUTPUTS = {
+    'lifespans': (3, []),
+    'apm': (4, [APMTracker]),
+    'selection': (4, [SelectionTracker]),
+}
+TRACKER_LEVEL = 3
+
+
+def requirements(outputs):
+    #(load level, plugin classes) covering every output
+    level, plugins = 0, []
+    for output in outputs:
+        if output not in OUTPUTS:
+            raise ValueError('unknown output %r, expected one of %s' % (output, ', '.join(sorted(OUTPUTS))))
+        needed, classes = OUTPUTS[output]
+        level = max(level, needed)
+        plugins.extend(plugin for plugin in classes if plugin not in plugins)
+    return level, plugins
+
+
+def load_replay(in_path, outputs=('lifespans',), stream=False):
+    level, plugins = requirements(outputs)
+    if stream and level == TRACKER_LEVEL:
+        level -= 1  # the tracker events are left in the archive for stream_events()
+    engine = GameEngine(plugins=[plugin() for plugin in plugins]) if plugins else None
+    return sc2reader.load_replay(in_path, load_level=level, engine=engine)
+
+
+def replay_events(replay):
+    #the events the extraction reads; below game event level that is just the tracker events
+    return replay.tracker_events if replay.load_level <= TRACKER_LEVEL else replay.events
+
+
+def tracker_events(replay, kinds=None):
+    #decodes replay.tracker.events straight out of the archive, one event at a time, and
+    #only builds the event objects whose class is in kinds. Same framing as sc2reader's
+    #TrackerEventsReader, which decodes them all into one list
+    data = extract_data_file('replay.tracker.events', replay.archive)
+    if not data:
+        return
+    dispatch = TrackerEventsReader().EVENT_DISPATCH
+    decoder = BitPackedDecoder(data)
+    frames = 0
+    while not decoder.done():
+        decoder._buffer.read(3)  # 03 00 09
+        frames += decoder.read_vint()
+        decoder._buffer.read(1)  # 09
+        kind = dispatch[decoder.read_vint()]
+        event_data = decoder.read_struct()
+        if kinds is None or kind in kinds:
+            yield kind(frames, event_data, replay.build)
+
+
+def stream_events(replay, kinds=None):
+    #yields the events the extraction reads one at a time, optionally only instances of kinds.
+    #A streamed load decodes them lazily. Otherwise the replay lets go of its event lists first
+    #and every event is dropped once it has been handed out, so a consumer that keeps nothing
+    #does not hold the whole decoded replay to the end
+    if replay.load_level < TRACKER_LEVEL:
+        for event in tracker_events(replay, kinds):
+            yield event
+        return
+    events = replay_events(replay)
+    replay.events, replay.tracker_events, replay.game_events, replay.message_events = [], [], [], []
+    for data_file in ('replay.tracker.events', 'replay.game.events', 'replay.message.events'):
+        replay.raw_data.pop(data_file, None)
+    events.reverse()
+    while events:
+        event = events.pop()
+        if kinds is None or isinstance(event, kinds):
+            yield event
+
+
+def full_load(in_path):
+    #what the scripts used to do: everything decoded, APM and selection plugins run
+    return sc2reader.load_replay(in_path, load_level=4,
+                                 engine=GameEngine(plugins=[APMTracker(), SelectionTracker()]))
+
+
+def time_loads(replays, load):
+    #seconds per replay, replays that fail to load are left out
+    seconds = []
+    for in_path in replays:
+        start = time.perf_counter()
+        try:
+            load(in_path)
+        except Exception:
+            continue
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def main():
+    from sc2script_csv import find_replays
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('replay_in', metavar='PATH', type=str, nargs='+', help="replay files or directories")
+    parser.add_argument('--outputs', type=str, default='lifespans', help="comma separated, any of " +
+                        ', '.join(sorted(OUTPUTS)))
+    parser.add_argument('--limit', type=int, default=None, help="only time the first LIMIT replays")
+    args = parser.parse_args()
+
+    outputs = args.outputs.split(',')
+    replays = find_replays(args.replay_in)[:args.limit]
+    level, plugins = requirements(outputs)
+    for name, load in [('full', full_load), ('minimal', lambda in_path: load_replay(in_path, outputs))]:
+        seconds = time_loads(replays, load)
+        if not seconds:
+            print('%-8s no replay could be loaded' % name)
+            continue
+        print('%-8s %4d replays  mean %7.1f ms  median %7.1f ms  total %6.1f s' % (
+            name, len(seconds), statistics.mean(seconds) * 1e3, statistics.median(seconds) * 1e3, sum(seconds)))
+    print('minimal load: level %d, plugins: %s' % (level, ', '.join(plugin.__name__ for plugin in plugins) or 'none'))
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,7 @@ import csv
 import sys
 from os.path import isfile, join
 import sc2reader
-from sc2reader.engine.plugins import SelectionTracker, APMTracker
-sc2reader.engine.register_plugin(APMTracker())
-sc2reader.engine.register_plugin(SelectionTracker())
+from replay_loader import load_replay
 from sc2reader.factories import SC2Factory
 
 import sc2reader
@@ -13,7 +11,8 @@ import sc2reader
 
 
 def main():
-    replay = sc2reader.load_replay('not_working.SC2Replay', load_level=4)
+    # lifespans only needs tracker events, add 'apm' or 'selection' to decode game events and run those plugins
+    replay = load_replay('not_working.SC2Replay', outputs=('lifespans',))
     #replay.load_map()
 
     print (replay)
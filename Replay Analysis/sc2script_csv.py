@@ -1,117 +1,250 @@
-# To get the parsed replay data, run the command below
-# python filename.py replay.SC2replay output.csv > realOutput.csv_out
+# Extracts unit data out of StarCraft II replays into typed columns
+#
+# python sc2script_csv.py [options] PATH... OUT
+#
+# python sc2script_csv.py replay.SC2Replay marines.csv
+# python sc2script_csv.py ../UntrainedReplay ../replays/SmartAgent csv_script all_units --jobs 8
+#
+# Every PATH is a replay or a directory searched recursively for them. With several
+# replays each one is parsed in a process pool and rows from all of them go into OUT.
 #
-# python sc2script_csv.py *.SC2Replay > 1.csv
-# realOutput.csv is the data you need!
-
 import argparse
 import csv
+import functools
+import itertools
+import multiprocessing
+import os
+import shutil
 import sys
-from os.path import isfile, join
+import tempfile
+import time
+from os.path import join
 import sc2reader
-from sc2reader.engine.plugins import SelectionTracker, APMTracker
-sc2reader.engine.register_plugin(APMTracker())
-sc2reader.engine.register_plugin(SelectionTracker())
+from columns import ColumnWriter, concat, read_npz, save_npz
+from extraction_spec import DEFAULT_SPEC, Extraction, load_spec, spec_version
+from replay_cache import CACHED_ERRORS, ReplayCache
+from replay_loader import load_replay, stream_events
+
+# bump whenever the extraction would give different columns for the same replay and spec,
+# it is part of every cache key
+EXTRACTOR_VERSION = 4
+CACHE_DIR = join(os.path.dirname(os.path.abspath(__file__)), '.replay_cache')
+
+
 def csv_out(results, out_path):
-    # for i in range(0,len(results)):
-    #
-    #     print('unit_type: ' + results[i]['unit_type:'] + ", "
-    #           'unit_id: ' + results[i]['unit_id:'] + ", "
-    #           'purchase_game_second: ' + results[i]['purchase_game_second:'] + ", "
-    #           'purchase_x_coordinate: ' + results[i]['purchase_x_coordinate:'] + ", "
-    #           'purchase_y_coordinate: ' + results[i]['purchase_y_coordinate:'] + ", "
-    #           'death_game_second: ' + results[i]['death_game_second:'] + ", "
-    #           'death_x_coordinate: ' + results[i]['death_x_coordinate:'] + ", "
-    #           'death_y_coordinate: ' + results[i]['death_y_coordinate:'] + ", "
-    #           'killing_unit_id: ' + results[i]['killing_unit_id:'] + ", "
-    #           'life_span: ' + results[i]['life_span:']
-    #     )
-    keys = results[0].keys()
-    with open (out_path, 'wb') as myfile:
-        wr = csv.DictWriter(myfile, keys)
+    # optional text export of a ColumnTable, one row per unit with the old "name:" headers
+    with open(out_path, 'w', newline='') as myfile:
+        wr = csv.DictWriter(myfile, results.csv_headers())
         wr.writeheader()
-        wr.writerows(results)
+        wr.writerows(results.rows())
         #wr = csv.writer(myfile, dialect='excel')
         #wr.writerow(results)
 
 
-
-def getData(created, deaths, out_path):
-    results = []
-    for i in range(0,len(created)):
-        for j in range(0, len(deaths)):
-            if created[i]['unit_id:'] == deaths[j]['unit_id:']:
-                survival = deaths[j]['game_second:'] - created[i]['game_second:']
-
-                game_results = {
-                    'life_span:': str(survival),
-
-                    'killing_unit_id:': str(deaths[j]['killing_unit_id:']),
-                    'death_x_coordinate:': str(deaths[j]['x_coordinate:']),
-                    'death_y_coordinate:': str(deaths[j]['y_coordinate:']),
-                    'death_game_second:': str(deaths[j]['game_second:']),
-
-
-
-                    'purchase_x_coordinate:': str(created[i]['x_coordinate:']),
-                    'purchase_y_coordinate:': str(created[i]['y_coordinate:']),
-                    'purchase_game_second:': str(created[i]['game_second:']),
-                    'unit_id:': str(created[i]['unit_id:']),
-                    'unit_type:': str(created[i]['unit_type:'])
-                }
-                # print(game_results)
-                results.append(game_results)
-    #print(results)
-    if '.csv' in out_path:
-        csv_out(results, out_path)
+def stream_replay(in_path, extraction):
+    # one pass over the replay, only the event classes the spec dispatches on are decoded,
+    # every table gets the map name as a categorical column
+    replay = load_replay(in_path, stream=True)
+    events = stream_events(replay, extraction.event_classes)
+    for name, results in extraction.run(events):
+        yield name, results.with_category('map', replay.map_name)
 
 
 def sc2_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument('replay_in', metavar='PATH', type=str, help="replay file")
-    parser.add_argument('out', metavar='PATH', type=str, help="csv file")
+    parser.add_argument('replay_in', metavar='PATH', type=str, nargs='+', help="replay files or directories")
+    parser.add_argument('out', metavar='PATH', type=str, help="output: a directory of .npz chunks, "
+                        "a .npz file, .arrow/.parquet (needs pyarrow) or a .csv export")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="worker processes for batch mode")
+    parser.add_argument('--cache', metavar='DIR', type=str, default=CACHE_DIR,
+                        help="parsed replay cache, only new or changed replays are parsed again")
+    parser.add_argument('--no-cache', action='store_true', help="parse every replay and leave the cache alone")
+    parser.add_argument('--retry-errors', action='store_true',
+                        help="parse replays the cache has an sc2reader error for again")
+    parser.add_argument('--spec', metavar='JSON', type=str, default=None,
+                        help="extraction spec (see extraction_spec.py), default Marine lifespans")
+    parser.add_argument('--units', type=str, default=None,
+                        help="comma separated unit types for the default lifespans output, e.g. Marine,Reaper,SCV")
     return parser.parse_args()
 
-def extract(in_path, out_path):
-    replay = sc2reader.load_replay(in_path)
-    created = []
-    deaths = []
-
-    for event in replay.events:
-        # Unit created
-        if type(event) is sc2reader.events.tracker.UnitBornEvent:
-            if event.unit_type_name in ['Marine']:
-                created_data = {
-                    'x_coordinate:': event.location[0],
-                    'y_coordinate:': event.location[1],
-                    'unit_type:': event.unit_type_name,
-                    'game_second:': event.second,
-                    #'player': event.unit_controller.toon_id,
-                    'unit_id:': event.unit_id
-                }
-
-                created.append(created_data)
-
-        if type(event) is sc2reader.events.tracker.UnitDiedEvent:
-            death_data = {
-                'killing_unit_id:': event.killing_unit_id,
-                'x_coordinate:': event.location[0],
-                'y_coordinate:': event.location[1],
-                'game_second:': event.second,
-                #'unit_type:': event.unit_type_name,                    'game_second': event.second,
-                #'player': event.unit_controller.toon_id,
-                'unit_id:': event.unit_id
-            }
-
-            deaths.append(death_data)
-    getData(created, deaths, out_path)
+def open_cache(directory, spec=DEFAULT_SPEC, retry_errors=False):
+    version = 'extractor %d, spec %s, sc2reader %s' % (EXTRACTOR_VERSION, spec_version(spec), sc2reader.__version__)
+    return ReplayCache(directory, version, retry_errors)
+
+
+def output_path(out_path, name, names):
+    # a spec with one output writes to out_path itself, more go next to each other:
+    # all_units/lifespans/, all_units/births/ or all_units_lifespans.csv, all_units_births.csv
+    if len(names) == 1:
+        return out_path
+    stem, extension = os.path.splitext(out_path)
+    if extension in ('.csv', '.npz', '.arrow', '.parquet'):
+        return '%s_%s%s' % (stem, name, extension)
+    return join(out_path, name)
+
+
+def open_writers(out_path, names):
+    return dict((name, ColumnWriter(output_path(out_path, name, names))) for name in names)
+
+
+def close_writers(writers):
+    for writer in writers.values():
+        writer.close()
+
+
+def extract(in_path, out_path, cache=None, extraction=None):
+    # rows are written batch by batch while the replay's events are consumed, the cache keeps them
+    # without the replay column since the same replay can turn up under another path
+    extraction = extraction or Extraction()
+    key = cache.key(in_path) if cache else None
+    cached = cache.get(key, extraction.names) if cache else None
+    if cached:
+        tables, error = cached
+        if error:
+            raise ValueError('%s (cached): %s' % (in_path, error))
+        batches = tables.items()
+    else:
+        # births, type changes and deaths of every unit in one pass over the events
+        batches = stream_replay(in_path, extraction)
+    kept = dict((name, []) for name in extraction.names)
+    writers = open_writers(out_path, extraction.names)
+    try:
+        for name, results in batches:
+            # the same columns as batch mode, outputs of both can be concatenated
+            writers[name].write(results.with_category('replay', in_path))
+            if cache and not cached:
+                kept[name].append(results)
+    finally:
+        close_writers(writers)
+    if cache and not cached:
+        cache.put(key, dict((name, concat(tables)) for name, tables in kept.items()))
+
+
+def find_replays(paths):
+    replays = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                replays.extend(join(root, name) for name in sorted(files) if name.lower().endswith('.sc2replay'))
+        elif '.sc2replay' in path.lower():
+            replays.append(path)
+    return replays
+
+
+_extractions = {}  # spec version -> compiled Extraction, one per worker process
+
+
+def parse_replay(in_path, scratch, spec=DEFAULT_SPEC):
+    # runs in a worker process, a replay sc2reader cannot read is reported instead of stopping the batch,
+    # anything else (MemoryError, a failed read) stops it and is not cached.
+    # Every batch is saved to its own .npz under scratch as soon as it is made, so a worker holds one
+    # batch at a time however big the replay; returns (in_path, [(output name, chunk path)], error)
+    version = spec_version(spec)
+    extraction = _extractions.get(version)
+    if extraction is None:
+        extraction = _extractions[version] = Extraction(spec)
+    directory = tempfile.mkdtemp(dir=scratch)
+    chunks = []
+    try:
+        for name, results in stream_replay(in_path, extraction):
+            chunk = join(directory, '%05d.npz' % len(chunks))
+            save_npz(chunk, results)
+            chunks.append((name, chunk))
+    except CACHED_ERRORS as error:
+        shutil.rmtree(directory, ignore_errors=True)
+        return in_path, None, '%s: %s' % (type(error).__name__, error)
+    return in_path, chunks, None
+
+
+def read_chunks(chunks):
+    # (output name, table) for parse_replay's chunk files, read and deleted one at a time
+    for name, chunk in chunks:
+        table = read_npz(chunk)
+        os.remove(chunk)
+        yield name, table
+    if chunks:
+        os.rmdir(os.path.dirname(chunks[0][1]))
+
+
+def split_cached(replays, cache, names):
+    # (in_path, tables, error) for every replay the cache has, and replay -> cache key for the rest
+    hits, keys = [], {}
+    for in_path in replays:
+        key = cache.key(in_path)
+        cached = cache.get(key, names)
+        if cached:
+            hits.append((in_path,) + cached)
+        else:
+            keys[in_path] = key
+    return hits, keys
+
+
+def batch(replays, out_path, jobs, cache=None, spec=DEFAULT_SPEC):
+    # rows are written as soon as each replay finishes, whichever order that happens in,
+    # replays already in the cache come first and only the rest are parsed
+    start = time.time()
+    rows = 0
+    failed = []
+    names = Extraction(spec).names
+    hits, keys = split_cached(replays, cache, names) if cache else ([], {})
+    misses = list(keys) if cache else replays
+    scratch = tempfile.mkdtemp(prefix='sc2script_')
+    parse = functools.partial(parse_replay, scratch=scratch, spec=spec)
+    pool = multiprocessing.Pool(jobs) if jobs > 1 and misses else None
+    parsed = pool.imap_unordered(parse, misses) if pool else map(parse, misses)
+    # (in_path, (name, table) batches, error) whether the replay came from the cache or a worker
+    hits = [(in_path, tables and tables.items(), error) for in_path, tables, error in hits]
+    parsed = ((in_path, chunks and read_chunks(chunks), error) for in_path, chunks, error in parsed)
+    writers = open_writers(out_path, names)
+    try:
+        for done, (in_path, batches, error) in enumerate(itertools.chain(hits, parsed), 1):
+            # batches go to the writers as they are read, only a new cache entry needs them all at once
+            kept = dict((name, []) for name in names) if in_path in keys else None
+            if error:
+                failed.append((in_path, error))
+            else:
+                for name, results in batches:
+                    writers[name].write(results.with_category('replay', in_path))
+                    rows += len(results)
+                    if kept is not None:
+                        kept[name].append(results)
+            if kept is not None:
+                tables = None if error else dict((name, concat(tables)) for name, tables in kept.items())
+                cache.put(keys[in_path], tables, error)
+            elapsed = time.time() - start
+            sys.stderr.write('\r[%d/%d] %d rows, %.1f replays/s' % (done, len(replays), rows, done / elapsed))
+            sys.stderr.flush()
+    except BaseException:
+        if pool:
+            pool.terminate()  # the replays still queued would only be thrown away
+        raise
+    finally:
+        close_writers(writers)
+        if pool:
+            pool.close()
+            pool.join()
+        shutil.rmtree(scratch, ignore_errors=True)
+    sys.stderr.write('\n')
+    if cache:
+        sys.stderr.write('%d replays from the cache, %d parsed\n' % (cache.hits, cache.misses))
+    for in_path, error in failed:
+        sys.stderr.write('failed %s: %s\n' % (in_path, error))
 
 
 def main():
     args = sc2_parser()
-    if(".sc2replay" in args.replay_in.lower()):
-
-        extract(args.replay_in, args.out)
+    replays = find_replays(args.replay_in)
+    spec = load_spec(args.spec) if args.spec else DEFAULT_SPEC
+    if args.units:
+        spec = dict(spec, lifespans={'unit_types': args.units.split(',')})
+    extraction = Extraction(spec)
+    cache = None if args.no_cache else open_cache(args.cache, spec, args.retry_errors)
+    if len(args.replay_in) == 1 and len(replays) == 1 and replays[0] == args.replay_in[0]:
+
+        extract(args.replay_in[0], args.out, cache, extraction)
+    elif replays:
+        batch(replays, args.out, max(args.jobs or 1, 1), cache, spec)
 
 if __name__ == '__main__':
     main()
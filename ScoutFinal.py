@@ -1,14 +1,23 @@
 import random
 import math
 import os.path
-
-import numpy as np
-import pandas as pd
+from collections import namedtuple
 
 from pysc2.agents import base_agent
 from pysc2.lib import actions
 from pysc2.lib import features
 
+from qtable import ActionMaskCache, QLearningTable, TERMINAL_STATE
+from checkpoint import QTableCheckpoint
+from qtable_map import map_exists, open_map
+from frame_view import FrameView
+from grid_pool import scout_actions
+from action_table import ActionTable
+from placement import BuildSites
+from phase_profile import NULL_PROFILER, PhaseProfiler
+from reward import RewardAccumulator
+from state_key import StateEncoder, migrate_table
+
 
 #SOURCES:
 #https://github.com/skjb/pysc2-tutorial A pysc2 tutorial
@@ -77,84 +86,78 @@ smart_actions = [
     ACTION_BUILD_TECHLAB,
     ACTION_BUILD_REAPER
 ]
-# Split scout actions into 16 quadrants to minimize action space
-for mm_x in range(0, 64):
-    for mm_y in range(0, 64):
-        if (mm_x + 1) % 16 == 0 and (mm_y + 1) % 16 == 0:
-            smart_actions.append(ACTION_SCOUT + '_' + str(mm_x - 8) + '_' + str(mm_y - 8))
+# Split the minimap into SCOUT_GRID x SCOUT_GRID squares, one scout action per square
+# 4x4 keeps the action space small, 8x8 scouts more precisely but grows the table
+SCOUT_GRID = 4
+SCOUT_START = len(smart_actions)
+smart_actions.extend(scout_actions(SCOUT_GRID))
+
+# every action name split once into its kind and integer minimap target, see action_table.py
+ACTION_TABLE = ActionTable(smart_actions)
+
+# the counts step() works out, handed to the SECOND_STEP handlers
+StepCounts = namedtuple('StepCounts', ['cc', 'supply_depot', 'worker_supply', 'barracks', 'engbay', 'turrets',
+                                       'refinery', 'supply_free', 'army_supply', 'supply_limit'])
+
+STATE_ENCODER = StateEncoder(SCOUT_GRID * SCOUT_GRID)
+
+# build sites as (dx, dy) from the command center for a top-left base, in the order
+# the buildings go up, and the footprint (height, width) each takes on screen. The
+# footprints match the pixel counts the *Count helpers divide by
+SITE_OFFSETS = {
+    _TERRAN_SUPPLY_DEPOT: [(-35, 0), (-5, -32), (13, 0)],
+    _TERRAN_BARRACKS: [(32, -20), (22, -20), (28, -10), (10, 17)],
+    _TERRAN_ENGBAY: [(-8, 28)],
+    _TERRAN_TURRET: [(29, 24), (24, 29)],
+}
+SITE_FOOTPRINTS = {
+    _TERRAN_SUPPLY_DEPOT: (8, 9),
+    _TERRAN_BARRACKS: (14, 10),
+    _TERRAN_ENGBAY: (10, 10),
+    _TERRAN_TURRET: (7, 7),
+}
 
 SEE_ENEMY_REWARD = 0.001
 NOT_DIE_REWARD = 0.5
 
-REWARDGL = 0
-
-DATA_FILE = 'Scout_data'
+DATA_FILE = 'Scout_data' if SCOUT_GRID == 4 else 'Scout_data_%dx%d' % (SCOUT_GRID, SCOUT_GRID)
 
 
-# Stolen from https://github.com/MorvanZhou/Reinforcement-learning-with-tensorflow
+def excludedActions(supply_depot_count, no_workers, barracks_count, engbay_count,
+                    turrets_count, refinery_count, no_supply, no_army):
+    excluded_actions = []
+    if supply_depot_count == 3 or no_workers:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_SUPPLY_DEPOT))
+        # supplydepots = True
 
-class QLearningTable:
-    def __init__(self,actions,learningRate = 0.01, rewardDecay = 0.9, epsilon = 0.9):
-        self.actions = actions #Table of possible actions
-        self.learningRate = learningRate
-        self.gamma = rewardDecay
-        self.epsilon = epsilon
-        self.qTable = pd.DataFrame(columns = self.actions, dtype = np.float64) #create a column for each, data type is float
-        self.forbiddenActions = {} #No forbidden actions to start
+    if supply_depot_count == 0 or barracks_count == 4 or no_workers:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_BARRACKS))
+        # barracks = True
 
-    def choose_action(self, states, excludedActions = []):
-        self.stateExist(states) #check to see if the state is in the table and add it if not
+    if barracks_count == 0 or engbay_count == 1:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_ENGBAY))
+        # engbay = True
 
-        self.forbiddenActions[states] = excludedActions #States is a string so this works, i dont know how python works
+    if engbay_count == 0 or turrets_count == 2:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_TURRET))
 
-        action = self.qTable.ix[states,:] #string magic, clone all the columns of qTable
+    if turrets_count == 0 or refinery_count == 2:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_REFINERY))
 
-        for excludedActions in excludedActions:
-            del action[excludedActions] #delete the excluded actions from action
-            
-        if np.random.uniform() < self.epsilon:
-            action = action.reindex(np.random.permutation(action.index)) #Randomly permute the actions
-            action = action.idxmax() #choose the maximum value over 0
+    if no_supply or barracks_count == 0 or refinery_count == 0:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_BUILD_REAPER))
 
-        else:
-            #choose random action
-            action = np.random.choice(self.actions)
-
-        return action
+    if no_army:
+        excluded_actions.extend(ACTION_TABLE.ids(ACTION_SCOUT))
 
-    def learn(self,prevState,prevAction,reward,currentState):
-        if prevState == currentState:
-            return #If the state hasn't changed do no learning
-        self.stateExist(currentState)
-        self.stateExist(prevState)
+    return excluded_actions
 
-        qPredict = self.qTable.ix[prevState,prevAction]
-        sRewards = self.qTable.ix[currentState,:]
-
-        if currentState in self.forbiddenActions: #if current state is a forbidden action delete all the forbidden state rewards
-            for excludedAction in self.forbiddenActions[currentState]:
-                del sRewards[excludedAction]
-
-        if currentState != 'terminal':
-            qTarget = reward + self.gamma * self.qTable.ix[currentState,:].max() #decay
-        else:
-            qTarget = reward #at end of game
-            
-            #update the rewards
-        self.qTable.ix[prevState,prevAction] += self.learningRate *(qTarget-qPredict) #add in the difference
-        
-
-        
-    def stateExist(self,state):
-        if state not in self.qTable.index:
-        #If state is not in the qTable append a column at the end of the table and init it to 0
-            self.qTable = self.qTable.append(pd.Series([0] * (len(self.actions)), index =self.qTable.columns, name=state))
-        
 
+ACTION_MASKS = ActionMaskCache(list(range(len(smart_actions))), excludedActions)
 
 
 class SmartAgent(base_agent.BaseAgent):
-    def __init__(self):
+    def __init__(self, data_file=DATA_FILE, mapped=False, profile=None):
         super(SmartAgent, self).__init__()
         self.qlearn = QLearningTable(actions=list(range(len(smart_actions))))
         self.previous_action = None
@@ -169,8 +172,29 @@ class SmartAgent(base_agent.BaseAgent):
         self.timeTillBase = 0
         self.baseFound = False
 
-        if os.path.isfile(DATA_FILE + '.gz'):
-            self.qlearn.qTable = pd.read_pickle(DATA_FILE + '.gz', compression='gzip')
+        self.rewards = RewardAccumulator()  # this agent's own, self.reward is base_agent's game score
+
+        self.frame = FrameView()
+
+        # profile='phases.jsonl' (or .csv) writes per episode timings of every step phase
+        self.profiler = PhaseProfiler(profile) if profile else NULL_PROFILER
+
+        # data_file=None runs without loading or saving the Q-table
+        self.checkpoint = None
+        if mapped and data_file is not None:
+            # read only evaluation agent, shares the table pages with every other mapped agent
+            if not map_exists(data_file):
+                raise FileNotFoundError('no memory mapped Q-table %s, write one with '
+                                        'python qtable_map.py %s' % (data_file, data_file))
+            self.qlearn = open_map(data_file, self.qlearn.actions, STATE_ENCODER)
+        elif data_file is not None:
+            self.checkpoint = QTableCheckpoint(data_file, STATE_ENCODER)
+            if self.checkpoint.exists():
+                self.checkpoint.load(self.qlearn)
+            elif os.path.isfile(data_file + '.gz'):
+                # first run since the switch to checkpoints, turn the old gzip pickle into a snapshot
+                self.qlearn.load(data_file + '.gz', lambda table: migrate_table(table, STATE_ENCODER))
+                self.checkpoint.compact(self.qlearn)
 
     def transformDistance(self, x, x_distance, y, y_distance):
         if not self.base_top_left:
@@ -185,16 +209,11 @@ class SmartAgent(base_agent.BaseAgent):
         return [x, y]
 
     def splitAction(self, action_id):
-        smart_action = smart_actions[action_id]
-        x = 0
-        y = 0
-        if '_' in smart_action:
-            smart_action, x, y = smart_action.split('_')
+        # (kind, x, y) out of the table compiled at import, x and y are ints
+        return ACTION_TABLE.kinds[action_id], ACTION_TABLE.x[action_id], ACTION_TABLE.y[action_id]
 
-        return (smart_action, x, y)
-
-    def foundBase(self,obs):
-        enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
+    def foundBase(self,frame):
+        enemy_y, enemy_x = frame.enemy_pixels
         if self.base_top_left and not self.baseFound:
             found = False
             if 45 in enemy_y and 35 in enemy_x:
@@ -218,66 +237,72 @@ class SmartAgent(base_agent.BaseAgent):
         super(SmartAgent, self).step(obs)
 
         if obs.last():
-            self.obsLast()
+            with self.profiler.phase('obsLast'):
+                self.obsLast()
+            self.profiler.episode_end(self.episodes)
             return actions.FunctionCall(_NO_OP, [])
 
-        unit_type = obs.observation['screen'][_UNIT_TYPE]
+        # derived values are computed at most once per frame and shared by every helper
+        frame = self.frame
+        frame.update(obs)
+        screen = frame.screen
 
         if obs.first():
-            self.obsFirst(unit_type,obs)
-
-        self.foundBase(obs)
-        self.timeTillBase = self.timeTillBase + 1
-        #############SETTING UP THE STATE#############
-        supply_depot_count = self.supplyDepotCount(unit_type)
-        cc_count = self.commandCenterCount(unit_type)
-        barracks_count = self.barracksCount(unit_type)
-        turrets_count = self.turretCount(unit_type)
-        engbay_count = self.engbayCount(unit_type)
-        refinery_count = self.refineryCount(unit_type)
+            with self.profiler.phase('obsFirst'):
+                self.obsFirst(frame)
 
-        supply_used = obs.observation['player'][3]
-        supply_limit = obs.observation['player'][4]
-        army_supply = obs.observation['player'][5]  # check vs 8 #################
-        worker_supply = obs.observation['player'][6]
+        with self.profiler.phase('features'):
+            self.foundBase(frame)
+            self.timeTillBase = self.timeTillBase + 1
+            #############SETTING UP THE STATE#############
+            supply_depot_count = self.supplyDepotCount(screen)
+            cc_count = self.commandCenterCount(screen)
+            barracks_count = self.barracksCount(screen)
+            turrets_count = self.turretCount(screen)
+            engbay_count = self.engbayCount(screen)
+            refinery_count = self.refineryCount(screen)
 
-        supply_free = supply_limit - supply_used
+            supply_used, supply_limit, army_supply, worker_supply, supply_free = frame.supply  # check army vs 8 #################
 
 
         if self.stepNum == 0:  # if this is the first step
             self.stepNum += 1
-            return self.firstStep(unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
-                                               turrets_count, refinery_count, supply_free, army_supply,supply_limit)
+            with self.profiler.phase('firstStep'):
+                return self.firstStep(frame,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
+                                                   turrets_count, refinery_count, supply_free, army_supply,supply_limit)
 
         elif self.stepNum == 1:
             self.stepNum += 1
-            return self.secondStep(unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
-                                               turrets_count, refinery_count, supply_free, army_supply,supply_limit)
+            with self.profiler.phase('secondStep'):
+                return self.secondStep(frame,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
+                                                   turrets_count, refinery_count, supply_free, army_supply,supply_limit)
 
         elif self.stepNum == 2:
             self.stepNum = 0
-            return self.thirdStep(unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
-                                               turrets_count, refinery_count, supply_free, army_supply,supply_limit)
+            with self.profiler.phase('thirdStep'):
+                return self.thirdStep(frame,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
+                                                   turrets_count, refinery_count, supply_free, army_supply,supply_limit)
 
         return actions.FunctionCall(_NO_OP, [])
 
 
     def obsLast(self):
-        global REWARDGL
+        reward = self.rewards.episode_end()
        # print("REWARD VALUE")
-        #print(REWARDGL)
-        self.qlearn.learn(str(self.previous_state), self.previous_action, REWARDGL, 'terminal')
-        self.qlearn.qTable.to_pickle(DATA_FILE + '.gz', 'gzip')
+        #print(reward)
+        if self.previous_action is not None:
+            self.qlearn.learn(self.previous_state, self.previous_action, reward, TERMINAL_STATE)
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.qlearn)  # only the rows learned this episode
         self.previous_action = None
         self.previous_state = None
         self.stepNum = 0
         self.kill_check = 0
         self.structure_kill = 0
         self.geyser_farm = 0
-        REWARDGL = 0
         return
-    def obsFirst(self,unit_type,obs):
-        player_y, player_x = (obs.observation['minimap'][_PLAYER_RELATIVE] == _PLAYER_SELF).nonzero()
+    def obsFirst(self,frame):
+        player_y, player_x = frame.own_pixels
         self.base_top_left = 1 if player_y.any() and player_y.mean() <= 31 else 0
         self.previous_action = None
         self.previous_state = None
@@ -286,143 +311,104 @@ class SmartAgent(base_agent.BaseAgent):
         self.kill_check = 0
         self.stepNum = 0
         self.geyser_farm = 0
-        self.CommandCenterY, self.CommandCenterX = (unit_type == _TERRAN_COMMANDCENTER).nonzero()
+        self.CommandCenterY, self.CommandCenterX = frame.screen.pixels(_TERRAN_COMMANDCENTER)
+        # every build site of the episode, worked out once from where the command center starts
+        self.buildSites = None
+        if self.CommandCenterY.any():
+            self.buildSites = BuildSites((round(self.CommandCenterX.mean()), round(self.CommandCenterY.mean())),
+                                         self.base_top_left, SITE_OFFSETS, SITE_FOOTPRINTS)
         self.timeTillBase = 0
         self.baseFound = False
         return
 
 
-    def firstStep(self,unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
+    def firstStep(self,frame,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
                                                turrets_count, refinery_count, supply_free, army_supply,supply_limit):
-        # current state is an array holding all the state values
-        current_state = self.currentState(cc_count, supply_depot_count, barracks_count, engbay_count, turrets_count,
-                                          refinery_count, supply_limit, army_supply)
-
         # marks all the current regions with a 1 where it sees enemies
-        enemy_squares = self.markEnemies(obs)
+        with self.profiler.phase('markEnemies'):
+            enemy_squares = self.markEnemies(frame)
 
-        for i in range(0, 16):
-            current_state[i + 8] = enemy_squares[i]  # write in enemy squares location into the state
+        # current state is a packed integer key holding all the state values
+        current_state = self.currentState(cc_count, supply_depot_count, barracks_count, engbay_count, turrets_count,
+                                          refinery_count, supply_limit, army_supply, enemy_squares)
 
             # Dont learn from the first step#
         if self.previous_action is not None:
-            self.learn(unit_type, obs,current_state)
+            with self.profiler.phase('learn'):
+                self.learn(frame,current_state)
 
-        excluded_actions = self.excludeActions(supply_depot_count, worker_supply, barracks_count, engbay_count,
-                                               turrets_count, refinery_count, supply_free, army_supply)
-        rl_action = self.qlearn.choose_action(str(current_state), excluded_actions)
+        action_mask = self.excludeActions(supply_depot_count, worker_supply, barracks_count, engbay_count,
+                                          turrets_count, refinery_count, supply_free, army_supply)
+        with self.profiler.phase('choose_action'):
+            rl_action = self.qlearn.choose_action(current_state, action_mask)
         self.previous_state = current_state
         self.previous_action = rl_action
-        smart_action, x, y = self.splitAction(self.previous_action)
 
         self.previousSupply = army_supply
 
-        # select SCV for building
-        if smart_action == ACTION_BUILD_BARRACKS or smart_action == ACTION_BUILD_SUPPLY_DEPOT or smart_action == ACTION_BUILD_TURRET or smart_action == ACTION_BUILD_ENGBAY or smart_action == ACTION_BUILD_REFINERY:
-            return self.selectSCV(unit_type)
-
-        # selecting barracks for making marine units
-        elif smart_action == ACTION_BUILD_REAPER:
-            return self.selectBarracks(unit_type)
-
-        # selecting marine units for scouting
-        elif smart_action == ACTION_SCOUT:
-            if _SELECT_ARMY in obs.observation['available_actions']:
-                return actions.FunctionCall(_SELECT_ARMY, [_NOT_QUEUED])
-        return actions.FunctionCall(_NO_OP, [])
-    def secondStep(self,unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
+        # select the SCV, barracks or army the action needs, FIRST_STEP is at the end of the module
+        return FIRST_STEP[rl_action](self, frame)
+    def secondStep(self,frame,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
                                                turrets_count, refinery_count, supply_free, army_supply,supply_limit):
-        smart_action, x, y = self.splitAction(self.previous_action)  # get the action
-
-        if smart_action == ACTION_BUILD_SUPPLY_DEPOT:
-            return self.buildSupplyDepot(obs, supply_depot_count)
-
-        elif smart_action == ACTION_BUILD_BARRACKS:
-            return self.buildBarracks(obs, barracks_count)
-
-        elif smart_action == ACTION_BUILD_ENGBAY:
-            return self.buildEngbay(obs, engbay_count)
-
-        elif smart_action == ACTION_BUILD_REFINERY:
-            return self.buildRefinery(obs,refinery_count)
-
-        elif smart_action == ACTION_BUILD_TURRET:
-            return self.buildTurret(obs, turrets_count)
-
-        elif smart_action == ACTION_BUILD_REAPER:
-            return self.trainReaper(obs)
-
-        elif smart_action == ACTION_SCOUT:
-            return self.scout(obs,x,y)
-        return actions.FunctionCall(_NO_OP, [])
-    def thirdStep(self, unit_type, obs, cc_count, supply_depot_count, worker_supply, barracks_count, engbay_count,
+        # build, train or scout, SECOND_STEP is at the end of the module
+        counts = StepCounts(cc_count, supply_depot_count, worker_supply, barracks_count, engbay_count,
+                            turrets_count, refinery_count, supply_free, army_supply, supply_limit)
+        return SECOND_STEP[self.previous_action](self, frame, self.previous_action, counts)
+    def thirdStep(self, frame, cc_count, supply_depot_count, worker_supply, barracks_count, engbay_count,
                    turrets_count, refinery_count, supply_free, army_supply,supply_limit):
-        smart_action, x, y = self.splitAction(self.previous_action)
-
-        if smart_action == ACTION_BUILD_BARRACKS or smart_action == ACTION_BUILD_SUPPLY_DEPOT or smart_action == ACTION_BUILD_TURRET or smart_action == ACTION_BUILD_ENGBAY:
-            if _HARVEST_GATHER in obs.observation['available_actions']:
-                self.geyser_farm += 1
-                if self.geyser_farm % 4 == 0:
-                    unit_y, unit_x = (unit_type == _TERRAN_REFINERY).nonzero()
-                    if unit_y.any():
-                        i = random.randint(0, len(unit_y) - 1)
+        # send the SCV back to work after building, THIRD_STEP is at the end of the module
+        return THIRD_STEP[self.previous_action](self, frame)
+    def gatherResources(self, frame):
+        if frame.can(_HARVEST_GATHER):
+            self.geyser_farm += 1
+            if self.geyser_farm % 4 == 0:
+                unit_y, unit_x = frame.screen.pixels(_TERRAN_REFINERY)
+                if unit_y.any():
+                    i = random.randint(0, len(unit_y) - 1)
 
-                        m_x = unit_x[i]
-                        m_y = unit_y[i]
+                    m_x = unit_x[i]
+                    m_y = unit_y[i]
 
-                        target = [int(m_x), int(m_y)]
+                    target = [int(m_x), int(m_y)]
 
-                        return actions.FunctionCall(_HARVEST_GATHER, [_QUEUED, target])
-                else:
-                    unit_y, unit_x = (unit_type == _NEUTRAL_MINERAL_FIELD).nonzero()
-                    if unit_y.any():
-                        i = random.randint(0, len(unit_y) - 1)
+                    return actions.FunctionCall(_HARVEST_GATHER, [_QUEUED, target])
+            else:
+                unit_y, unit_x = frame.screen.pixels(_NEUTRAL_MINERAL_FIELD)
+                if unit_y.any():
+                    i = random.randint(0, len(unit_y) - 1)
 
-                        m_x = unit_x[i]
-                        m_y = unit_y[i]
+                    m_x = unit_x[i]
+                    m_y = unit_y[i]
 
-                        target = [int(m_x), int(m_y)]
+                    target = [int(m_x), int(m_y)]
 
-                        return actions.FunctionCall(_HARVEST_GATHER, [_QUEUED, target])
+                    return actions.FunctionCall(_HARVEST_GATHER, [_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
 
 
     def currentState(self,cc_count,supply_depot_count,barracks_count,engbay_count,
-                     turrets_count,refinery_count,supply_limit,army_supply):
-        current_state = np.zeros(24)  # Generate array of 22
-        current_state[0] = cc_count
-        current_state[1] = supply_depot_count
-        current_state[2] = barracks_count
-        current_state[3] = engbay_count
-        current_state[4] = turrets_count
-        current_state[5] = refinery_count
-        current_state[6] = supply_limit
-        current_state[7] = army_supply
-        return current_state
-    def markEnemies(self,obs):
-        enemy_squares = np.zeros(16)
-        enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
-        for i in range(0, len(enemy_y)):
-            y = int(math.ceil((enemy_y[i] + 1) / 16))
-            x = int(math.ceil((enemy_x[i] + 1) / 16))
-            enemy_squares[((y - 1) * 4) + (x - 1)] = 1  # mark location of enemy squares
-            if not self.base_top_left:  # Invert the quadrants
-                enemy_squares = enemy_squares[::-1]
-        return enemy_squares
-    def learn(self,unit_type,obs,current_state):
-        global REWARDGL
-        unit_y, unit_x = (unit_type == _TERRAN_COMMANDCENTER).nonzero()
-        enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
-        if enemy_y.any() and unit_y.mean() > 0 and unit_y.mean() < 1000:
-            xdist = round((unit_x.mean() - enemy_x.mean()) ** 2)
-            ydist = round((unit_y.mean() - enemy_y.mean()) ** 2)
+                     turrets_count,refinery_count,supply_limit,army_supply,enemy_squares):
+        # STATE_ENCODER.decode turns the key back into the count and enemy square values
+        return STATE_ENCODER.encode((cc_count, supply_depot_count, barracks_count, engbay_count,
+                                     turrets_count, refinery_count, supply_limit, army_supply), enemy_squares)
+    def markEnemies(self,frame):
+        enemy_squares = frame.enemy_grid(SCOUT_GRID)  # mark location of enemy squares
+        if not self.base_top_left:  # Invert the quadrants
+            enemy_squares = enemy_squares[::-1, ::-1]
+        return enemy_squares.ravel()
+    def learn(self,frame,current_state):
+        cc_centroid = frame.cc_centroid
+        enemy_y, enemy_x = frame.enemy_pixels
+        if enemy_y.any() and cc_centroid is not None and cc_centroid[1] > 0 and cc_centroid[1] < 1000:
+            xdist = round((cc_centroid[0] - enemy_x.mean()) ** 2)
+            ydist = round((cc_centroid[1] - enemy_y.mean()) ** 2)
             distance_multiplier = math.sqrt(xdist + ydist)
             # print("distance mult", distance_multiplier)
         else:
             distance_multiplier = 0
 
-        killed_units = obs.observation["score_cumulative"][5]
-        killed_structures = obs.observation["score_cumulative"][6]
+        killed_units = frame.observation["score_cumulative"][5]
+        killed_structures = frame.observation["score_cumulative"][6]
         killbonus = 0
         structure_kill_bonus = 0
         if self.kill_check < killed_units:
@@ -432,46 +418,22 @@ class SmartAgent(base_agent.BaseAgent):
             structure_kill_bonus = 15
             self.structure_kill = killed_structures
 
-        added_value = len(enemy_x) * SEE_ENEMY_REWARD * distance_multiplier + structure_kill_bonus + killbonus
         ## army_bonus = army_supply*0.01
-        REWARDGL += added_value
-        self.qlearn.learn(str(self.previous_state), self.previous_action, 0, str(current_state))
+        self.rewards.add(see_enemy=len(enemy_x) * SEE_ENEMY_REWARD * distance_multiplier,
+                         kill_structure=structure_kill_bonus, kill_unit=killbonus)
+        self.qlearn.learn(self.previous_state, self.previous_action, 0, current_state)
         return
 
         # Returns supply depot count
     def excludeActions(self,supply_depot_count,worker_supply,barracks_count,engbay_count,
                        turrets_count,refinery_count,supply_free,army_supply):
-        excluded_actions = []
-        if supply_depot_count == 3 or worker_supply == 0:
-            excluded_actions.append(1)
-            # supplydepots = True
-
-        if supply_depot_count == 0 or barracks_count == 4 or worker_supply == 0:
-            excluded_actions.append(2)
-            # barracks = True
-
-        if barracks_count == 0 or engbay_count == 1:
-            excluded_actions.append(3)
-            # engbay = True
-
-        if engbay_count == 0 or turrets_count == 2:
-            excluded_actions.append(4)
-
-        if turrets_count == 0 or refinery_count == 2:
-            excluded_actions.append(5)
-
-        if supply_free == 0 or barracks_count == 0 or refinery_count == 0:
-            excluded_actions.append(7)
+        # masks are cached per count tuple so excludedActions only runs for new ones
+        return ACTION_MASKS.get((supply_depot_count, bool(worker_supply == 0), barracks_count, engbay_count,
+                                 turrets_count, refinery_count, bool(supply_free == 0), bool(army_supply == 0)))
 
-        if army_supply == 0:
-            for i in range(0, 16):
-                excluded_actions.append(i + 8)
 
-        return excluded_actions
-
-
-    def selectSCV(self,unit_type):
-        unit_y, unit_x = (unit_type == _TERRAN_SCV).nonzero()
+    def selectSCV(self,screen):
+        unit_y, unit_x = screen.pixels(_TERRAN_SCV)
 
         if unit_y.any():
             i = random.randint(0, len(unit_y) - 1)
@@ -479,141 +441,142 @@ class SmartAgent(base_agent.BaseAgent):
 
             return actions.FunctionCall(_SELECT_POINT, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def selectBarracks(self,unit_type):
-        barracks_y, barracks_x = (unit_type == _TERRAN_BARRACKS).nonzero()
+    def selectBarracks(self,screen):
+        barracks_y, barracks_x = screen.pixels(_TERRAN_BARRACKS)
         if barracks_y.any():
             i = random.randint(0, len(barracks_y) - 1)
             target = [barracks_x[i], barracks_y[i]]
             return actions.FunctionCall(_SELECT_POINT, [_SELECT_ALL, target])
         return actions.FunctionCall(_NO_OP, [])
+    def selectArmy(self,frame):
+        if frame.can(_SELECT_ARMY):
+            return actions.FunctionCall(_SELECT_ARMY, [_NOT_QUEUED])
+        return actions.FunctionCall(_NO_OP, [])
+    def noOp(self,*args):
+        return actions.FunctionCall(_NO_OP, [])
 
 
-    def buildSupplyDepot(self,obs,supply_depot_count):
-        if supply_depot_count < 3 and _BUILD_SUPPLY_DEPOT in obs.observation['available_actions']:
-            if self.CommandCenterY.any():
-                global REWARDGL
-                if supply_depot_count == 0:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), -35,
-                                                    round(self.CommandCenterY.mean()), 0)
-                elif supply_depot_count == 1:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), -5,
-                                                    round(self.CommandCenterY.mean()), -32)
-                elif supply_depot_count == 2:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 13,
-                                                    round(self.CommandCenterY.mean()), 0)
-                    REWARDGL += 5
-
+    def buildSite(self,frame,unit,count):
+        # next free site for the unit or None, placements that would be refused are never sent
+        if self.buildSites is None:
+            return None
+        return self.buildSites.next(unit, count, frame.occupancy)
+    def buildSupplyDepot(self,frame,supply_depot_count):
+        if supply_depot_count < 3 and frame.can(_BUILD_SUPPLY_DEPOT):
+            target = self.buildSite(frame, _TERRAN_SUPPLY_DEPOT, supply_depot_count)
+            if target is not None:
+                if supply_depot_count == 2:
+                    self.rewards.add(supply_depot=5)
                 return actions.FunctionCall(_BUILD_SUPPLY_DEPOT, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def buildBarracks(self,obs,barracks_count):
-        if barracks_count < 4 and _BUILD_BARRACKS in obs.observation['available_actions']:
-            if self.CommandCenterY.any():
-                global REWARDGL
-                if barracks_count == 0:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 32,
-                                                    round(self.CommandCenterY.mean()), -20)
-                    REWARDGL += 2
-                elif barracks_count == 1:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 22,
-                                                    round(self.CommandCenterY.mean()), -20)
-                    REWARDGL += 2
-                elif barracks_count == 2:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 28,
-                                                    round(self.CommandCenterY.mean()), -10)
-                    REWARDGL += 2
-                elif barracks_count == 3:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 10,
-                                                    round(self.CommandCenterY.mean()), 17)
-                    REWARDGL += 4
-
+    def buildBarracks(self,frame,barracks_count):
+        if barracks_count < 4 and frame.can(_BUILD_BARRACKS):
+            target = self.buildSite(frame, _TERRAN_BARRACKS, barracks_count)
+            if target is not None:
+                self.rewards.add(barracks=4 if barracks_count == 3 else 2)
                 return actions.FunctionCall(_BUILD_BARRACKS, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def buildEngbay(self,obs,engbay_count):
-        if engbay_count < 1 and _BUILD_ENGBAY in obs.observation['available_actions']:
-            if self.CommandCenterY.any():
-                if engbay_count < 1:
-                    global REWARDGL
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), -8,
-                                                    round(self.CommandCenterY.mean()), 28)
-                    REWARDGL += 5
-                    return actions.FunctionCall(_BUILD_ENGBAY, [_NOT_QUEUED, target])
+    def buildEngbay(self,frame,engbay_count):
+        if engbay_count < 1 and frame.can(_BUILD_ENGBAY):
+            target = self.buildSite(frame, _TERRAN_ENGBAY, engbay_count)
+            if target is not None:
+                self.rewards.add(engbay=5)
+                return actions.FunctionCall(_BUILD_ENGBAY, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def buildRefinery(self,obs,refinery_count):
-        if refinery_count < 2 and _BUILD_REFINERY in obs.observation['available_actions']:
+    def buildRefinery(self,frame,refinery_count):
+        if refinery_count < 2 and frame.can(_BUILD_REFINERY):
             if self.CommandCenterY.any():
-                unit_type = obs.observation['screen'][_UNIT_TYPE]
-                global REWARDGL
                 if refinery_count == 0:
-                    vespene_y, vespene_x = (unit_type == _NEUTRAL_VESPENEGEYSER).nonzero()
+                    vespene_y, vespene_x = frame.screen.pixels(_NEUTRAL_VESPENEGEYSER)
                     first_y = vespene_y[0:97]
                     first_x = vespene_x[0:97]
                     target = self.transformDistance(round(first_x.mean()), 0, round(first_y.mean()), 0)
                 elif refinery_count == 1:
-                    vespene_y, vespene_x = (unit_type == _NEUTRAL_VESPENEGEYSER).nonzero()
+                    vespene_y, vespene_x = frame.screen.pixels(_NEUTRAL_VESPENEGEYSER)
                     target = self.transformDistance(round(vespene_x.mean()), 0, round(vespene_y.mean()), 0)
-                    REWARDGL += 5
+                    self.rewards.add(refinery=5)
                 return actions.FunctionCall(_BUILD_REFINERY, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def buildTurret(self,obs,turrets_count):
-        if turrets_count < 2 and _BUILD_TURRET in obs.observation['available_actions']:
-            if self.CommandCenterY.any():
-                global REWARDGL
-                if turrets_count == 0:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 29,
-                                                    round(self.CommandCenterY.mean()), 24)
-                elif turrets_count == 1:
-                    target = self.transformDistance(round(self.CommandCenterX.mean()), 24,
-                                                    round(self.CommandCenterY.mean()), 29)
-                    REWARDGL += 5
+    def buildTurret(self,frame,turrets_count):
+        if turrets_count < 2 and frame.can(_BUILD_TURRET):
+            target = self.buildSite(frame, _TERRAN_TURRET, turrets_count)
+            if target is not None:
+                if turrets_count == 1:
+                    self.rewards.add(turret=5)
                 return actions.FunctionCall(_BUILD_TURRET, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
-    def trainReaper(self,obs):
-        if _TRAIN_REAPER in obs.observation['available_actions']:
-            global REWARDGL
-            REWARDGL += 1
+    def trainReaper(self,frame):
+        if frame.can(_TRAIN_REAPER):
+            self.rewards.add(reaper=1)
             return actions.FunctionCall(_TRAIN_REAPER, [_QUEUED])
         return actions.FunctionCall(_NO_OP, [])
-    def scout(self,obs,x,y):
+    def scout(self,frame,x,y):
         do_it = True
 
-        if len(obs.observation['single_select']) > 0 and obs.observation['single_select'][0][0] == _TERRAN_SCV:
+        if len(frame.observation['single_select']) > 0 and frame.observation['single_select'][0][0] == _TERRAN_SCV:
             do_it = False
 
-        if len(obs.observation['multi_select']) > 0 and obs.observation['multi_select'][0][0] == _TERRAN_SCV:
+        if len(frame.observation['multi_select']) > 0 and frame.observation['multi_select'][0][0] == _TERRAN_SCV:
             do_it = False
 
-        if _MOVE_MINIMAP in obs.observation["available_actions"] and do_it:
-            target = self.transformLocation((int(x)), int(y))
+        if frame.can(_MOVE_MINIMAP) and do_it:
+            target = self.transformLocation(x, y)
             return actions.FunctionCall(_ATTACK_MINIMAP, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
 
 
-    def supplyDepotCount(self,unit_type):
-        depot_y, depot_x = (unit_type == _TERRAN_SUPPLY_DEPOT).nonzero()
-        return int(round(len(depot_y) / 69)) #69 is the size of the depot in pixels
+    def supplyDepotCount(self,screen):
+        return int(round(screen.count(_TERRAN_SUPPLY_DEPOT) / 69)) #69 is the size of the depot in pixels
 
             #returns commandCenter count
-    def commandCenterCount(self,unit_type):
-        cc_y, cc_x = (unit_type == _TERRAN_COMMANDCENTER).nonzero()
-        cc_count = 1 if cc_y.any() else 0
+    def commandCenterCount(self,screen):
+        cc_count = 1 if screen.has(_TERRAN_COMMANDCENTER) else 0
         return cc_count
             #Returns barracks count
-    def barracksCount(self,unit_type):
-        barracks_y, barracks_x = (unit_type == _TERRAN_BARRACKS).nonzero()
-        return int(round(len(barracks_y) / 137))
+    def barracksCount(self,screen):
+        return int(round(screen.count(_TERRAN_BARRACKS) / 137))
 
             #returns # of turrets
-    def turretCount(self,unit_type):
-        turrets_y, turrets_x = (unit_type == _TERRAN_TURRET).nonzero()
-        return int(round(len(turrets_y) / 52))
+    def turretCount(self,screen):
+        return int(round(screen.count(_TERRAN_TURRET) / 52))
 
             #returns # of engbays
-    def engbayCount(self,unit_type):
-        engbay_y, engbay_x = (unit_type == _TERRAN_ENGBAY).nonzero()
-        engbay_count = 1 if engbay_y.any() else 0
+    def engbayCount(self,screen):
+        engbay_count = 1 if screen.has(_TERRAN_ENGBAY) else 0
         return engbay_count
 
             #returns # of refineries
-    def refineryCount(self,unit_type):
-        refinery_y, refinery_x = (unit_type == _TERRAN_REFINERY).nonzero()
-        return int(round(len(refinery_y) / 97))
+    def refineryCount(self,screen):
+        return int(round(screen.count(_TERRAN_REFINERY) / 97))
+
+
+# What every action id does on each of its three steps, looked up by action id instead of
+# comparing action names. Actions without an entry do nothing on that step.
+FIRST_STEP = ACTION_TABLE.dispatch({
+    ACTION_BUILD_SUPPLY_DEPOT: lambda agent, frame: agent.selectSCV(frame.screen),
+    ACTION_BUILD_BARRACKS: lambda agent, frame: agent.selectSCV(frame.screen),
+    ACTION_BUILD_ENGBAY: lambda agent, frame: agent.selectSCV(frame.screen),
+    ACTION_BUILD_TURRET: lambda agent, frame: agent.selectSCV(frame.screen),
+    ACTION_BUILD_REFINERY: lambda agent, frame: agent.selectSCV(frame.screen),
+    ACTION_BUILD_REAPER: lambda agent, frame: agent.selectBarracks(frame.screen),
+    ACTION_SCOUT: lambda agent, frame: agent.selectArmy(frame),
+}, lambda agent, frame: agent.noOp())
+
+SECOND_STEP = ACTION_TABLE.dispatch({
+    ACTION_BUILD_SUPPLY_DEPOT: lambda agent, frame, action, counts: agent.buildSupplyDepot(frame, counts.supply_depot),
+    ACTION_BUILD_BARRACKS: lambda agent, frame, action, counts: agent.buildBarracks(frame, counts.barracks),
+    ACTION_BUILD_ENGBAY: lambda agent, frame, action, counts: agent.buildEngbay(frame, counts.engbay),
+    ACTION_BUILD_REFINERY: lambda agent, frame, action, counts: agent.buildRefinery(frame, counts.refinery),
+    ACTION_BUILD_TURRET: lambda agent, frame, action, counts: agent.buildTurret(frame, counts.turrets),
+    ACTION_BUILD_REAPER: lambda agent, frame, action, counts: agent.trainReaper(frame),
+    ACTION_SCOUT: lambda agent, frame, action, counts: agent.scout(frame, ACTION_TABLE.x[action],
+                                                                   ACTION_TABLE.y[action]),
+}, lambda agent, frame, action, counts: agent.noOp())
+
+# refineries are left out, the SCV that built one is already harvesting gas
+THIRD_STEP = ACTION_TABLE.dispatch({
+    ACTION_BUILD_SUPPLY_DEPOT: lambda agent, frame: agent.gatherResources(frame),
+    ACTION_BUILD_BARRACKS: lambda agent, frame: agent.gatherResources(frame),
+    ACTION_BUILD_ENGBAY: lambda agent, frame: agent.gatherResources(frame),
+    ACTION_BUILD_TURRET: lambda agent, frame: agent.gatherResources(frame),
+}, lambda agent, frame: agent.noOp())
@@ -0,0 +1,43 @@
+#The smart action list compiled once into lists indexed by action id
+#
+#Names like 'scout_11_7' carry their minimap target. ActionTable splits every name once,
+#when the agent module is imported, into its kind ('scout') and integer x and y, so a
+#step looks up table.kinds[action] and table.x[action] instead of parsing strings.
+#dispatch() turns a {kind: handler} dict into a list with one handler per action id,
+#ids() gives the action ids of some kinds, e.g. for the exclusion masks.
+#
+#    ACTION_TABLE = ActionTable(smart_actions)
+#    SECOND_STEP = ACTION_TABLE.dispatch({ACTION_SCOUT: scout, ...})
+#    SECOND_STEP[action](...)
+
+
+class ActionTable:
+    def __init__(self, smart_actions):
+        self.names = list(smart_actions)
+        self.kinds = []
+        self.x = []
+        self.y = []
+        for name in self.names:
+            kind, x, y = name, 0, 0
+            if '_' in name:
+                kind, x, y = name.split('_')
+            self.kinds.append(kind)
+            self.x.append(int(x))
+            self.y.append(int(y))
+        self.by_kind = {}
+        for action, kind in enumerate(self.kinds):
+            self.by_kind.setdefault(kind, []).append(action)
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, *kinds):
+        #action ids of every action of these kinds, in id order
+        return sorted(action for kind in kinds for action in self.by_kind.get(kind, ()))
+
+    def dispatch(self, handlers, default=None):
+        #one entry per action id: the handler of its kind, default for kinds without one
+        unknown = set(handlers) - set(self.by_kind)
+        if unknown:
+            raise ValueError('no actions of kind %s' % ', '.join(sorted(unknown)))
+        return [handlers.get(kind, default) for kind in self.kinds]
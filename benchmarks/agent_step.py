@@ -0,0 +1,290 @@
+#Per-step latency of the agents' step() hot path
+#python benchmarks/agent_step.py                    run every agent and compare with the baseline
+#python benchmarks/agent_step.py --save-baseline    store this run as the new baseline
+#
+#Each agent is driven through headless_env.HeadlessEnv, or fed the frames of an
+#obs_recorder.py recording with --fixture DIR. Only the time spent inside
+#agent.step() is measured. The agent's helpers are wrapped so the step is split into
+#phases: feature extraction (counts, enemy grid, state key, action masks),
+#choose_action, learn and the action builders (select*/build*/scout/trainReaper).
+#Time inside a helper that another helper calls only counts once, for the innermost
+#phase. Whatever is left over is "other".
+#
+#A second pass runs the same steps under tracemalloc and reports the peak number of
+#bytes allocated during a step. It is kept apart so tracing does not skew the timings.
+#Every agent is run --repeat times. A saved baseline keeps the median of each number,
+#a check the lowest, and any phase whose p50 or p99 is then more than --tolerance above
+#the baseline is flagged and the script exits with status 1. Timings of the same code
+#move by a third or more between runs on a busy machine, hence the 50% default and the
+#repeats; alloc_bytes hardly moves at all and has its own --alloc-tolerance of 5%.
+#Without a baseline file it exits with status 2, --no-baseline only prints the numbers.
+#
+#agent_step_baseline.json next to this script comes from --save-baseline --repeat 5
+#(headless env, --steps 3000, seed 0) on a single core machine. --fixture runs want a
+#baseline of their own: --fixture DIR --baseline DIR.json --save-baseline
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from headless_env import HeadlessEnv
+from obs_recorder import replay
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agent_step_baseline.json')
+
+_FEATURES = ['foundBase', 'obsFirst', 'supplyDepotCount', 'commandCenterCount', 'barracksCount', 'turretCount',
+             'engbayCount', 'refineryCount', 'markEnemies', 'currentState', 'excludeActions']
+_ACTIONS = ['selectSCV', 'selectBarracks', 'buildSupplyDepot', 'buildBarracks', 'buildEngbay', 'buildRefinery',
+            'buildTurret', 'trainReaper', 'scout']
+_SCOUT_ACTIONS = _ACTIONS + ['selectArmy', 'gatherResources', 'buildSite']  # helpers smartAgent does not have
+
+#module -> (agent class, constructor kwargs, phase -> helpers). "qlearn." helpers live on
+#agent.qlearn and "module." ones are module level functions the agent calls through globals
+AGENTS = {
+    'ScoutFinal': ('SmartAgent', {'data_file': None}, {
+        'features': _FEATURES,
+        'choose_action': ['qlearn.choose_action'],
+        'learn': ['learn', 'qlearn.learn'],
+        'actions': _SCOUT_ACTIONS,
+    }),
+    'smartAgent': ('SmartAgent', {}, {
+        'features': _FEATURES,
+        'choose_action': ['qlearn.choose_action'],
+        'learn': ['learn', 'qlearn.learn'],
+        'actions': _ACTIONS,
+    }),
+    'smartAgent2': ('SmartAgent', {}, {
+        'choose_action': ['qlearn.choose_action'],
+        'learn': ['qlearn.learn'],
+    }),
+    'simple_agent': ('SimpleAgent', {}, {
+        'actions': ['module.selectScv', 'module.buildSupplyDepot', 'module.buildBarracks',
+                    'module.selectCommandCenter', 'module.selectBarracks'],
+    }),
+}
+
+
+class PhaseTimer:
+    #exclusive wall time per phase for the current step
+    def __init__(self):
+        self.stack = []
+        self.totals = {}
+
+    def wrap(self, phase, function):
+        stack = self.stack
+        totals = self.totals
+
+        def timed(*args, **kwargs):
+            frame = [0.0]  # time spent in nested timed calls
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                totals[phase] = totals.get(phase, 0.0) + elapsed - frame[0]
+                if stack:
+                    stack[-1][0] += elapsed
+        return timed
+
+
+def instrument(agent, module, phases, timer):
+    #returns a function that puts the module level functions back
+    patched = []
+    for phase, names in phases.items():
+        for name in names:
+            if name.startswith('module.'):
+                target, attribute = module, name[len('module.'):]
+                patched.append((attribute, getattr(module, attribute)))
+            elif name.startswith('qlearn.'):
+                target, attribute = agent.qlearn, name[len('qlearn.'):]
+            else:
+                target, attribute = agent, name
+            setattr(target, attribute, timer.wrap(phase, getattr(target, attribute)))
+
+    def restore():
+        for attribute, function in patched:
+            setattr(module, attribute, function)
+    return restore
+
+
+def drive(agent, steps, max_steps, seed, on_step, fixture=None):
+    #runs agent against the headless env for steps agent steps, on_step wraps each agent.step call
+    #with a fixture the recorded observations are fed in instead, all of them
+    if fixture is not None:
+        replay(agent, fixture, seed, on_step)
+        return
+    random.seed(seed)
+    np.random.seed(seed)
+    env = HeadlessEnv(max_steps=max_steps, seed=seed)
+    done = 0
+    while done < steps:
+        timesteps = env.reset()
+        agent.reset()
+        while done < steps:
+            function_call = on_step(agent, timesteps[0])
+            done += 1
+            if timesteps[0].last():
+                break
+            timesteps = env.step([function_call])
+
+
+def measure(name, steps, max_steps, seed, fixture=None):
+    module = importlib.import_module(name)
+    class_name, kwargs, phases = AGENTS[name]
+
+    timer = PhaseTimer()
+    agent = getattr(module, class_name)(**kwargs)
+    restore = instrument(agent, module, phases, timer)
+    samples = {phase: [] for phase in list(phases) + ['other', 'step']}
+
+    def timed_step(agent, timestep):
+        timer.totals.clear()
+        start = time.perf_counter()
+        function_call = agent.step(timestep)
+        elapsed = time.perf_counter() - start
+        for phase, spent in timer.totals.items():
+            samples[phase].append(spent)
+        samples['other'].append(elapsed - sum(timer.totals.values()))
+        samples['step'].append(elapsed)
+        return function_call
+
+    try:
+        drive(agent, steps, max_steps, seed, timed_step, fixture)
+    finally:
+        restore()
+
+    # same steps again with a fresh agent under tracemalloc
+    agent = getattr(module, class_name)(**kwargs)
+    allocated = []
+    pinned = [None]  # previous timestep, previous frame values
+
+    def traced_step(agent, timestep):
+        # the step frees the previous observation and frame values before it allocates the new
+        # ones, keep them alive until it is done or the peak would hide the new allocations
+        pinned[1:] = [dict(agent.frame.cache) if hasattr(agent, 'frame') else None]
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function_call = agent.step(timestep)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        pinned[:1] = [timestep]
+        return function_call
+
+    tracemalloc.start()
+    try:
+        drive(agent, steps, max_steps, seed, traced_step, fixture)
+    finally:
+        tracemalloc.stop()
+
+    result = {}
+    for phase, values in samples.items():
+        if values:
+            values = np.array(values) * 1e6
+            result[phase] = {'n': len(values), 'p50': float(np.percentile(values, 50)),
+                             'p99': float(np.percentile(values, 99))}
+    allocated = np.array(allocated, dtype=np.float64)
+    result['alloc_bytes'] = {'n': len(allocated), 'p50': float(np.percentile(allocated, 50)),
+                             'p99': float(np.percentile(allocated, 99))}
+    return result
+
+
+def combine(runs, statistic):
+    #per phase and stat one number out of several measure() results, e.g. statistic=min
+    result = {}
+    for phase in runs[0]:
+        stats = [run[phase] for run in runs if phase in run]
+        result[phase] = {'n': stats[0]['n'], 'p50': float(statistic([stat['p50'] for stat in stats])),
+                         'p99': float(statistic([stat['p99'] for stat in stats]))}
+    return result
+
+
+def regressions(results, baseline, tolerance, alloc_tolerance, floor, min_samples):
+    #(agent, phase, stat, baseline, now) for every number that grew by more than its tolerance
+    flagged = []
+    for agent, phases in results.items():
+        for phase, stats in phases.items():
+            before = baseline.get(agent, {}).get(phase)
+            # a phase hit a handful of times has no stable percentiles to compare
+            if before is None or min(stats['n'], before['n']) < min_samples:
+                continue
+            allowed = alloc_tolerance if phase == 'alloc_bytes' else tolerance
+            for stat in ('p50', 'p99'):
+                limit = before[stat] * (1 + allowed)
+                # tiny phases are all timer noise, they need to move by more than floor as well
+                if stats[stat] > limit and stats[stat] - before[stat] > floor:
+                    flagged.append((agent, phase, stat, before[stat], stats[stat]))
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('agents', nargs='*', default=sorted(AGENTS), help="agent modules to run, default all")
+    parser.add_argument('--steps', type=int, default=3000, help="agent steps per agent")
+    parser.add_argument('--max-steps', type=int, default=500, help="steps per episode")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixture', type=str, default=None,
+                        help="obs_recorder.py recording to replay instead of running the headless env")
+    parser.add_argument('--baseline', type=str, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="write this run to --baseline")
+    parser.add_argument('--no-baseline', action='store_true', help="only print the numbers, compare with nothing")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed slowdown, 0.5 is 50%%")
+    parser.add_argument('--alloc-tolerance', type=float, default=0.05, help="allowed growth of alloc_bytes")
+    parser.add_argument('--floor', type=float, default=2.0, help="ignore changes smaller than this many us/bytes")
+    parser.add_argument('--min-samples', type=int, default=50, help="ignore phases timed fewer times than this")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per agent, see combine()")
+    args = parser.parse_args()
+
+    results = {}
+    directory = os.getcwd()
+    fixture = os.path.abspath(args.fixture) if args.fixture else None
+    with tempfile.TemporaryDirectory() as scratch:
+        # the agents load and save their Q-tables in the working directory
+        os.chdir(scratch)
+        try:
+            for name in args.agents:
+                runs = [measure(name, args.steps, args.max_steps, args.seed, fixture)
+                        for run in range(max(args.repeat, 1))]
+                # a baseline keeps the typical run, a check its best one: a busy machine only adds time
+                results[name] = combine(runs, np.median if args.save_baseline else min)
+        finally:
+            os.chdir(directory)
+
+    print('%-14s %-14s %7s %10s %10s' % ('agent', 'phase', 'steps', 'p50', 'p99'))
+    for agent, phases in results.items():
+        for phase, stats in phases.items():
+            unit = 'B' if phase == 'alloc_bytes' else 'us'
+            print('%-14s %-14s %7d %8.1f%s %8.1f%s' % (agent, phase, stats['n'], stats['p50'], unit, stats['p99'], unit))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+        print('baseline written to %s' % args.baseline)
+        return
+
+    if args.no_baseline:
+        return
+    if not os.path.isfile(args.baseline):
+        sys.stderr.write('no baseline at %s, run with --save-baseline first or pass --no-baseline\n' % args.baseline)
+        sys.exit(2)
+    with open(args.baseline) as data:
+        baseline = json.load(data)
+    flagged = regressions(results, baseline, args.tolerance, args.alloc_tolerance, args.floor, args.min_samples)
+    for agent, phase, stat, before, now in flagged:
+        print('REGRESSION %s %s %s: %.1f -> %.1f' % (agent, phase, stat, before, now))
+    if flagged:
+        sys.exit(1)
+    print('no regressions against %s' % args.baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#Compares ways of writing the Q-table at the end of an episode
+#python benchmarks/checkpoint_formats.py --states 50000
+#
+#gzip pickle is what the agents used to do every episode. The zlib/lzma/raw rows
+#write the same binary record checkpoint.py uses, and "delta" is the per episode
+#append of only the rows that changed.
+
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from checkpoint import QTableCheckpoint, pack_record, read_records
+from qtable import QLearningTable
+from state_key import DEFAULT_ENCODER
+
+
+def synthetic_table(states, actions, seed):
+    rng = np.random.RandomState(seed)
+    qtable = QLearningTable(actions=list(range(actions)))
+    counts = rng.randint(0, 4, size=(states, 8))
+    counts[:, 6] = rng.randint(15, 200, size=states)
+    enemies = rng.rand(states, 16) < 0.1
+    for i in range(states):
+        qtable.check_state_exist(DEFAULT_ENCODER.encode(counts[i], enemies[i]))
+    # most rows are only touched a few times, so they stay sparse
+    visited = rng.rand(len(qtable), actions) < 0.2
+    qtable.values[:len(qtable)] = np.where(visited, rng.normal(0, 2, size=visited.shape), 0)
+    qtable.take_dirty()
+    return qtable
+
+
+def timed(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_pickle(qtable, directory, repeat):
+    path = os.path.join(directory, 'table.gz')
+    write, _ = timed(lambda: qtable.save(path), repeat)
+    read, _ = timed(lambda: QLearningTable(qtable.actions).load(path), repeat)
+    return write, read, os.path.getsize(path)
+
+
+def bench_record(qtable, compress, decompress, repeat):
+    pack = lambda: pack_record(b'QSNP', DEFAULT_ENCODER, qtable.states, qtable.values[:len(qtable)])
+    write, data = timed(lambda: compress(pack()), repeat)
+    read, _ = timed(lambda: list(read_records(decompress(data), b'QSNP', DEFAULT_ENCODER)), repeat)
+    return write, read, len(data)
+
+
+def bench_delta(qtable, directory, fraction, repeat, seed):
+    rng = np.random.RandomState(seed)
+    checkpoint = QTableCheckpoint(os.path.join(directory, 'delta'), snapshot_every=10 ** 9)
+    rows = rng.choice(len(qtable), max(1, int(len(qtable) * fraction)), replace=False)
+
+    def append():
+        qtable.dirty.update(rows.tolist())
+        checkpoint.save(qtable)
+    write, _ = timed(append, repeat)
+    return write, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type=int, default=50000)
+    parser.add_argument('--actions', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--delta-fraction', type=float, default=0.01, help="share of rows changed per episode")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    qtable = synthetic_table(args.states, args.actions, args.seed)
+    identity = lambda data: data
+    formats = [
+        ('raw binary', identity, identity),
+        ('zlib 1', lambda data: zlib.compress(data, 1), zlib.decompress),
+        ('zlib 6', lambda data: zlib.compress(data, 6), zlib.decompress),
+        ('zlib 9', lambda data: zlib.compress(data, 9), zlib.decompress),
+        ('gzip 9', lambda data: gzip.compress(data, 9), gzip.decompress),
+        ('bz2 9', lambda data: bz2.compress(data, 9), bz2.decompress),
+        ('lzma 0', lambda data: lzma.compress(data, preset=0), lzma.decompress),
+        ('lzma 6', lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    ]
+
+    print('%d states x %d actions, best of %d' % (len(qtable), args.actions, args.repeat))
+    print('%-16s %10s %10s %12s' % ('format', 'write ms', 'read ms', 'bytes'))
+    with tempfile.TemporaryDirectory() as directory:
+        write, read, size = bench_pickle(qtable, directory, args.repeat)
+        print('%-16s %10.1f %10.1f %12d' % ('gzip pickle', write * 1000, read * 1000, size))
+        for name, compress, decompress in formats:
+            write, read, size = bench_record(qtable, compress, decompress, args.repeat)
+            print('%-16s %10.1f %10.1f %12d' % (name, write * 1000, read * 1000, size))
+
+        write, rows = bench_delta(qtable, directory, args.delta_fraction, args.repeat, args.seed)
+        print('%-16s %10.1f %10s %12s' % ('delta %d rows' % rows, write * 1000, '-', '-'))
+
+if __name__ == '__main__':
+    main()
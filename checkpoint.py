@@ -0,0 +1,147 @@
+import argparse
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from qtable import QLearningTable
+from state_key import DEFAULT_ENCODER, migrate_table
+
+
+#Incremental Q-table checkpoints
+#At the end of every episode only the rows learn() touched are appended to
+#<base>.delta. Every SNAPSHOT_EVERY episodes the whole table is written to
+#<base>.snap (temp file + os.replace so a crash never leaves a half written
+#snapshot) and the delta log starts over. Loading reads the snapshot and then
+#replays the deltas on top of it. Rows are stored whole, so replaying a delta
+#twice is harmless and a torn record at the end of the log is simply dropped.
+#
+#Record layout (little endian): magic, row count, key width, action count,
+#flags, payload length, crc32 of the payload. The payload is the keys
+#(key width bytes each) followed by the float64 rows, zlib compressed when
+#flags has COMPRESSED set. benchmarks/checkpoint_formats.py compares this with
+#the old gzip pickle and other compressors.
+
+SNAPSHOT_EVERY = 20
+SNAPSHOT_LEVEL = 1  # zlib level for snapshots, 0 writes them raw
+DELTA_LEVEL = 0  # delta records are small, compressing them costs more than it saves
+
+_SNAPSHOT_MAGIC = b'QSNP'
+_DELTA_MAGIC = b'QDLT'
+_HEADER = struct.Struct('<4sIHHIQI')
+_COMPRESSED = 1
+
+
+def pack_record(magic, encoder, states, values, level=0):
+    payload = encoder.keysToBytes(states) + np.ascontiguousarray(values, dtype='<f8').tobytes()
+    flags = 0
+    if level:
+        payload = zlib.compress(payload, level)
+        flags |= _COMPRESSED
+    return _HEADER.pack(magic, len(states), encoder.width, values.shape[1], flags, len(payload),
+                        zlib.crc32(payload)) + payload
+
+
+def read_records(data, magic, encoder):
+    #yields (states, values, end offset) for every complete record, stops at the first damaged one
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        record_magic, rows, width, columns, flags, length, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        if record_magic != magic or width != encoder.width or len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        if flags & _COMPRESSED:
+            payload = zlib.decompress(payload)
+        keys = rows * width
+        states = encoder.keysFromBytes(payload[:keys])
+        values = np.frombuffer(payload, dtype='<f8', offset=keys).reshape(rows, columns)
+        offset = start + length
+        yield states, values, offset
+
+
+def write_atomic(path, data):
+    temp = path + '.tmp'
+    with open(temp, 'wb') as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp, path)
+
+
+class QTableCheckpoint:
+    def __init__(self, base, encoder=DEFAULT_ENCODER, snapshot_every=SNAPSHOT_EVERY):
+        self.snapshot_path = base + '.snap'
+        self.delta_path = base + '.delta'
+        self.encoder = encoder
+        self.snapshot_every = snapshot_every
+        self.episodes = 0
+
+    def exists(self):
+        return os.path.isfile(self.snapshot_path) or os.path.isfile(self.delta_path)
+
+    def load(self, qtable):
+        #snapshot first, then every delta in the order it was written
+        for path, magic in ((self.snapshot_path, _SNAPSHOT_MAGIC), (self.delta_path, _DELTA_MAGIC)):
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as data:
+                data = data.read()
+            end = 0
+            for states, values, end in read_records(data, magic, self.encoder):
+                qtable.set_rows(states, values)
+            if end < len(data) and path == self.delta_path:
+                # cut off a record torn by a crash so new deltas are not appended after it
+                with open(path, 'r+b') as log:
+                    log.truncate(end)
+        qtable.take_dirty()
+
+    def save(self, qtable):
+        #called once per episode
+        self.episodes += 1
+        if self.episodes % self.snapshot_every == 0:
+            self.compact(qtable)
+            return
+
+        rows = qtable.take_dirty()
+        if len(rows):
+            record = pack_record(_DELTA_MAGIC, self.encoder, [qtable.states[row] for row in rows],
+                                 qtable.values[rows], DELTA_LEVEL)
+            with open(self.delta_path, 'ab') as log:
+                log.write(record)
+
+    def compact(self, qtable):
+        count = len(qtable.states)
+        write_atomic(self.snapshot_path, pack_record(_SNAPSHOT_MAGIC, self.encoder, qtable.states,
+                                                     qtable.values[:count], SNAPSHOT_LEVEL))
+        # the snapshot already holds every delta, so the log can go
+        if os.path.isfile(self.delta_path):
+            os.remove(self.delta_path)
+        qtable.take_dirty()
+
+
+def checkpoint_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['import', 'export'],
+                        help="import turns a gzip pickled table into a snapshot, export goes the other way")
+    parser.add_argument('base', metavar='NAME', type=str, help="checkpoint name without extension, e.g. Scout_data")
+    parser.add_argument('table', metavar='PATH', type=str, help="gzip pickled Q-table, e.g. Scout_data.gz")
+    parser.add_argument('--actions', type=int, default=24, help="number of actions in the table")
+    return parser.parse_args()
+
+
+def main():
+    args = checkpoint_parser()
+    qtable = QLearningTable(actions=list(range(args.actions)))
+    checkpoint = QTableCheckpoint(args.base)
+
+    if args.command == 'import':
+        qtable.load(args.table, migrate_table)
+        checkpoint.compact(qtable)
+    else:
+        checkpoint.load(qtable)
+        qtable.save(args.table)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import collections
+
+import numpy as np
+
+from pysc2.lib import actions
+from pysc2.lib import features
+
+from grid_pool import occupancy_grid
+from placement import Occupancy
+from screen_summary import ScreenSummary
+
+
+#Lazily computed view of one pysc2 observation
+#Each derived value (screen summary, enemy pixels, CC centroid, available action
+#bitset, supply numbers, build site occupancy) is worked out the first time a helper
+#asks for it and reused for the rest of the frame. update() is called at the top of
+#every step, which throws the cached values away for the new observation.
+
+_UNIT_TYPE = features.SCREEN_FEATURES.unit_type.index
+_PLAYER_RELATIVE_MINI = features.MINIMAP_FEATURES.player_relative.index
+
+_PLAYER_SELF = 1
+_PLAYER_ENEMY = 4
+
+_TERRAN_COMMANDCENTER = 18
+
+Supply = collections.namedtuple('Supply', ['used', 'limit', 'army', 'workers', 'free'])
+
+
+def frameCached(method):
+    #turns a method into a property that is computed at most once per frame
+    name = method.__name__
+
+    def cached(self):
+        try:
+            return self.cache[name]
+        except KeyError:
+            value = self.cache[name] = method(self)
+            return value
+    return property(cached)
+
+
+class FrameView:
+    def __init__(self, obs=None):
+        self.cache = {}
+        self.primed = None  # (obs, values) handed in by prime() before update(obs)
+        self.obs = None
+        self.observation = None
+        if obs is not None:
+            self.update(obs)
+
+    def update(self, obs):
+        self.obs = obs
+        self.observation = obs.observation
+        self.cache = {}
+        if self.primed is not None:
+            if self.primed[0] is obs:
+                self.cache = self.primed[1]  # the frame owns the primed dict from here on
+            self.primed = None
+
+    def prime(self, obs, values):
+        #lets a caller that already has some of the values for obs (e.g. a batched driver) hand
+        #them in, keyed like the cache ('screen', 'enemy_pixels', ('enemy_grid', cells) ...).
+        #They are used from the update(obs) the agent's step makes for that observation
+        if obs is self.obs:
+            self.cache.update(values)
+        else:
+            self.primed = (obs, values)
+
+    def can(self, function_id):
+        return self.available[function_id]
+
+    def enemy_grid(self, cells):
+        #cells x cells occupancy of enemy pixels on the minimap
+        key = ('enemy_grid', cells)
+        grid = self.cache.get(key)
+        if grid is None:
+            grid = self.cache[key] = occupancy_grid(self.observation['minimap'][_PLAYER_RELATIVE_MINI],
+                                                    _PLAYER_ENEMY, cells)
+        return grid
+
+    @frameCached
+    def screen(self):
+        return ScreenSummary(self.observation['screen'][_UNIT_TYPE])
+
+    @frameCached
+    def enemy_pixels(self):
+        #(y, x) of every enemy pixel on the minimap
+        return (self.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
+
+    @frameCached
+    def own_pixels(self):
+        #(y, x) of every friendly pixel on the minimap
+        return (self.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_SELF).nonzero()
+
+    @frameCached
+    def cc_centroid(self):
+        #(x, y) of the command center on screen or None
+        return self.screen.centroid(_TERRAN_COMMANDCENTER)
+
+    @frameCached
+    def occupancy(self):
+        #where a building can go on screen, see placement.py
+        return Occupancy(self.observation['screen'][_UNIT_TYPE])
+
+    @frameCached
+    def available(self):
+        #boolean array indexed by pysc2 function id
+        available = np.zeros(len(actions.FUNCTIONS), dtype=bool)
+        available[self.observation['available_actions']] = True
+        return available
+
+    @frameCached
+    def supply(self):
+        player = self.observation['player']
+        used, limit, army, workers = int(player[3]), int(player[4]), int(player[5]), int(player[6])
+        return Supply(used, limit, army, workers, limit - used)
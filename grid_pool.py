@@ -0,0 +1,28 @@
+#Pools a minimap layer down to an NxN occupancy grid in one reshape/any
+#instead of walking every pixel in python, and builds the scout actions that
+#go with the same grid so the two always line up
+
+ACTION_SCOUT = 'scout'
+
+
+def occupancy_grid(layer, value, cells):
+    #True for every cell holding at least one pixel equal to value, works on a single
+    #(size, size) layer or a stack of them with any leading dimensions
+    size = layer.shape[-1]
+    if size % cells:
+        raise ValueError('%d cells do not divide a %d pixel minimap' % (cells, size))
+    step = size // cells
+    hits = layer == value
+    return hits.reshape(layer.shape[:-2] + (cells, step, cells, step)).any(axis=(-3, -1))
+
+
+def cell_centers(cells, size=64):
+    #minimap coordinate of the middle of each cell along one axis
+    step = size // cells
+    return [step * (i + 1) - 1 - step // 2 for i in range(cells)]
+
+
+def scout_actions(cells, size=64):
+    #'scout_x_y' for the center of every cell, x major like the old hard-coded 4x4 list
+    centers = cell_centers(cells, size)
+    return [ACTION_SCOUT + '_' + str(x) + '_' + str(y) for x in centers for y in centers]
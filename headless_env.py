@@ -0,0 +1,635 @@
+import argparse
+import importlib
+import time
+
+import numpy as np
+
+from pysc2.env import environment
+from pysc2.lib import actions
+from pysc2.lib import features
+
+
+#Headless stand-in for the pysc2 SC2Env so the agents can be run, profiled and
+#benchmarked without the StarCraft II binary
+#
+#The world is a cut down Simple64: two bases in opposite corners of a 64x64
+#minimap, the camera always sits on our own base (none of the agents move it) and
+#the screen shows the command center, mineral line, geysers, SCVs, buildings and
+#the army while it is at home. Minerals and gas come in per step from the
+#harvesting workers, buildings take a few steps to finish, barracks train marines
+#and reapers, and the army walks across the minimap to wherever it was sent,
+#fighting the enemy squad and base when it gets close. Destroying every enemy
+#structure wins, otherwise the episode ends after max_steps.
+#
+#Observations use the same dict as the pysc2 version the agents were written for
+#(screen, minimap, player, score_cumulative, available_actions, single_select,
+#multi_select) and come wrapped in environment.TimeStep, so first()/last() work.
+#Like pysc2, an action that is not in available_actions or has an argument out
+#of range raises ValueError instead of being silently dropped.
+
+SCREEN_SIZE = 84
+MINIMAP_SIZE = 64
+
+_SCREEN = features.SCREEN_FEATURES
+_MINIMAP = features.MINIMAP_FEATURES
+
+_PLAYER_SELF = 1
+_PLAYER_NEUTRAL = 3
+_PLAYER_ENEMY = 4
+_VISIBLE = 2
+
+_TERRAN_COMMANDCENTER = 18
+_TERRAN_SUPPLY_DEPOT = 19
+_TERRAN_REFINERY = 20
+_TERRAN_BARRACKS = 21
+_TERRAN_ENGBAY = 22
+_TERRAN_TURRET = 23
+_TERRAN_TECHLAB = 37
+_TERRAN_SCV = 45
+_TERRAN_MARINE = 48
+_TERRAN_REAPER = 49
+_NEUTRAL_MINERAL_FIELD = 341
+_NEUTRAL_VESPENEGEYSER = 342
+
+_FUNCTIONS = actions.FUNCTIONS
+_NO_OP = _FUNCTIONS.no_op.id
+_MOVE_CAMERA = _FUNCTIONS.move_camera.id
+_SELECT_POINT = _FUNCTIONS.select_point.id
+_SELECT_ARMY = _FUNCTIONS.select_army.id
+_ATTACK_SCREEN = _FUNCTIONS.Attack_screen.id
+_ATTACK_MINIMAP = _FUNCTIONS.Attack_minimap.id
+_MOVE_SCREEN = _FUNCTIONS.Move_screen.id
+_MOVE_MINIMAP = _FUNCTIONS.Move_minimap.id
+_BUILD_SUPPLY_DEPOT = _FUNCTIONS.Build_SupplyDepot_screen.id
+_BUILD_BARRACKS = _FUNCTIONS.Build_Barracks_screen.id
+_BUILD_ENGBAY = _FUNCTIONS.Build_EngineeringBay_screen.id
+_BUILD_TURRET = _FUNCTIONS.Build_MissileTurret_screen.id
+_BUILD_REFINERY = _FUNCTIONS.Build_Refinery_screen.id
+_BUILD_TECHLAB = _FUNCTIONS.Build_TechLab_Barracks_quick.id
+_HARVEST_GATHER = _FUNCTIONS.Harvest_Gather_screen.id
+_TRAIN_SCV = _FUNCTIONS.Train_SCV_quick.id
+_TRAIN_MARINE = _FUNCTIONS.Train_Marine_quick.id
+_TRAIN_REAPER = _FUNCTIONS.Train_Reaper_quick.id
+_RALLY_UNITS_MINIMAP = _FUNCTIONS.Rally_Units_minimap.id
+
+_SELECT_ALL_TYPE = 2
+_ADD_ALL_TYPE = 3
+
+#unit type -> (height, width) on screen, (minerals, gas), steps to build, supply given
+#sizes are picked so the pixel counts the agents divide by (69, 137, 52, 97) round to one per building
+STRUCTURES = {
+    _TERRAN_SUPPLY_DEPOT: ((8, 9), (100, 0), 20, 8),
+    _TERRAN_BARRACKS: ((14, 10), (150, 0), 30, 0),
+    _TERRAN_ENGBAY: ((10, 10), (125, 0), 25, 0),
+    _TERRAN_TURRET: ((7, 7), (100, 0), 18, 0),
+    _TERRAN_REFINERY: ((10, 10), (75, 0), 20, 0),
+    _TERRAN_TECHLAB: ((5, 5), (50, 25), 18, 0),
+}
+BUILD_ACTIONS = {
+    _BUILD_SUPPLY_DEPOT: _TERRAN_SUPPLY_DEPOT,
+    _BUILD_BARRACKS: _TERRAN_BARRACKS,
+    _BUILD_ENGBAY: _TERRAN_ENGBAY,
+    _BUILD_TURRET: _TERRAN_TURRET,
+    _BUILD_REFINERY: _TERRAN_REFINERY,
+}
+#building -> what has to be finished first
+REQUIRES = {_TERRAN_BARRACKS: _TERRAN_SUPPLY_DEPOT, _TERRAN_TURRET: _TERRAN_ENGBAY}
+
+#unit type -> (minerals, gas), steps to train, screen size
+TRAINED = {
+    _TERRAN_SCV: ((50, 0), 12, 3),
+    _TERRAN_MARINE: ((50, 0), 18, 2),
+    _TERRAN_REAPER: ((50, 50), 22, 2),
+}
+TRAIN_ACTIONS = {_TRAIN_SCV: _TERRAN_SCV, _TRAIN_MARINE: _TERRAN_MARINE, _TRAIN_REAPER: _TERRAN_REAPER}
+ARMY_TYPES = (_TERRAN_MARINE, _TERRAN_REAPER)
+
+COMMANDCENTER_SUPPLY = 15
+MINERALS_PER_WORKER = 0.35  # per step, roughly 55 a minute at step_mul 8
+GAS_PER_WORKER = 0.3
+WORKERS_PER_REFINERY = 3
+START_WORKERS = 12
+START_MINERALS = 50
+
+ARMY_SPEED = 1.5  # minimap pixels per step
+SIGHT = 6  # minimap pixels
+ENGAGE_RANGE = 5
+KILL_CHANCE = 0.06  # per own army unit per step
+LOSS_CHANCE = 0.05  # per enemy unit per step
+ENEMY_STRUCTURES = 6
+ENEMY_SQUAD = 4
+ENEMY_SQUAD_MAX = 12
+ENEMY_REINFORCE_EVERY = 25
+UNIT_VALUE = 50
+STRUCTURE_VALUE = 150
+
+#base centers (x, y) on the minimap, top-left spawn first. The enemy base is drawn 7 pixels
+#across, so both cover what ScoutFinal/smartAgent foundBase look for: x 35, y 45 from the
+#top left and x 20, y 25 from the bottom right
+BASE_CENTERS = ((21, 24), (38, 45))
+
+
+class Entity:
+    #anything drawn on the screen: buildings, neutral resources, SCVs and the home army
+    __slots__ = ('unit_type', 'owner', 'rect', 'done', 'workers')
+
+    def __init__(self, unit_type, owner, rect, done=0):
+        self.unit_type = unit_type
+        self.owner = owner
+        self.rect = rect  # (top, bottom, left, right), bottom/right exclusive
+        self.done = done  # step the building finishes
+        self.workers = 0  # SCVs harvesting a refinery
+
+
+class HeadlessEnv:
+    def __init__(self, step_mul=8, max_steps=1000, seed=None, base_top_left=None, copy=True):
+        #base_top_left=None picks a random spawn every episode like Simple64
+        #copy=False hands out the env's own arrays, they change on the next step
+        self.step_mul = step_mul
+        self.max_steps = max_steps
+        self.rng = np.random.RandomState(seed)
+        self.spawn = base_top_left
+        self.copy = copy
+
+        self.screen = np.zeros((len(_SCREEN), SCREEN_SIZE, SCREEN_SIZE), dtype=np.int32)
+        self.minimap = np.zeros((len(_MINIMAP), MINIMAP_SIZE, MINIMAP_SIZE), dtype=np.int32)
+        self.entityIds = np.full((SCREEN_SIZE, SCREEN_SIZE), -1, dtype=np.int32)
+        self.ended = True
+        self.lastAvailable = []
+
+    def observation_spec(self):
+        return ({'screen': self.screen.shape, 'minimap': self.minimap.shape, 'player': (11,),
+                 'score_cumulative': (13,), 'available_actions': (0,), 'single_select': (0, 7),
+                 'multi_select': (0, 7)},)
+
+    def action_spec(self):
+        return (actions.ValidActions(actions.TYPES, _FUNCTIONS),)
+
+    def close(self):
+        self.ended = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def reset(self):
+        self.top_left = bool(self.rng.randint(2)) if self.spawn is None else bool(self.spawn)
+        self.steps = 0
+        self.now = 0.0  # game time in steps of 8 game loops, what the build times are given in
+        self.ended = False
+        self.minerals = float(START_MINERALS)
+        self.gas = 0.0
+        self.collected = [0.0, 0.0]
+        self.score = np.zeros(13, dtype=np.int32)
+
+        self.entities = []
+        self.queue = []  # (step done, unit type) for units being trained
+        self.selection = []
+        self.army = {unit: 0 for unit in ARMY_TYPES}
+        self.home = np.array(BASE_CENTERS[0 if self.top_left else 1], dtype=np.float64)
+        self.enemyBase = np.array(BASE_CENTERS[1 if self.top_left else 0], dtype=np.float64)
+        self.armyPos = self.home.copy()
+        self.armyTarget = self.home.copy()
+        self.enemyStructures = ENEMY_STRUCTURES
+        self.enemySquad = ENEMY_SQUAD
+        self.enemyPos = self.enemyBase.copy()
+
+        self.layout()
+        self.screenDirty = True
+        return (self.timestep(environment.StepType.FIRST, 0, 0),)
+
+    def step(self, function_calls):
+        if self.ended:
+            return self.reset()
+        self.apply(function_calls[0])
+        self.steps += 1
+        self.now += self.step_mul / 8.0
+        self.tick(self.step_mul / 8.0)
+
+        if self.enemyStructures == 0:
+            return self.finish(1)
+        if self.steps >= self.max_steps:
+            return self.finish(0)
+        return (self.timestep(environment.StepType.MID, 0, 1),)
+
+    def finish(self, reward):
+        self.ended = True
+        return (self.timestep(environment.StepType.LAST, reward, 0),)
+
+    # world setup
+
+    def place(self, top, left, height, width):
+        #rect in top-left spawn coordinates, mirrored for the bottom-right spawn
+        if self.top_left:
+            return (top, top + height, left, left + width)
+        return (SCREEN_SIZE - top - height, SCREEN_SIZE - top, SCREEN_SIZE - left - width, SCREEN_SIZE - left)
+
+    def layout(self):
+        add = self.entities.append
+        add(Entity(_TERRAN_COMMANDCENTER, _PLAYER_SELF, self.place(35, 35, 14, 14)))
+        for i in range(8):
+            add(Entity(_NEUTRAL_MINERAL_FIELD, _PLAYER_NEUTRAL, self.place(16 + 2 * (i % 2), 12 + 5 * i, 3, 4)))
+        add(Entity(_NEUTRAL_VESPENEGEYSER, _PLAYER_NEUTRAL, self.place(4, 60, 10, 10)))
+        add(Entity(_NEUTRAL_VESPENEGEYSER, _PLAYER_NEUTRAL, self.place(52, 4, 10, 10)))
+        for i in range(START_WORKERS):
+            self.addUnit(_TERRAN_SCV)
+
+    def addUnit(self, unit_type):
+        if unit_type in ARMY_TYPES:
+            self.army[unit_type] += 1
+            self.screenDirty = True
+            return
+        # new SCVs queue up below the mineral line
+        i = self.count(_TERRAN_SCV)
+        self.entities.append(Entity(_TERRAN_SCV, _PLAYER_SELF, self.place(23 + 4 * (i // 12), 12 + 3 * (i % 12), 3, 3)))
+        self.screenDirty = True
+
+    # queries
+
+    def owned(self, unit_type, finished=True):
+        return [entity for entity in self.entities if entity.unit_type == unit_type
+                and (not finished or entity.done <= self.now)]
+
+    def count(self, unit_type, finished=True):
+        return len(self.owned(unit_type, finished))
+
+    def supply(self):
+        limit = COMMANDCENTER_SUPPLY + sum(STRUCTURES[_TERRAN_SUPPLY_DEPOT][3] for depot in self.owned(_TERRAN_SUPPLY_DEPOT))
+        workers = self.count(_TERRAN_SCV) + sum(1 for done, unit in self.queue if unit == _TERRAN_SCV)
+        army = sum(self.army.values()) + sum(1 for done, unit in self.queue if unit != _TERRAN_SCV)
+        return workers + army, min(limit, 200), army, workers
+
+    def gasWorkers(self):
+        return sum(refinery.workers for refinery in self.owned(_TERRAN_REFINERY))
+
+    def armyHome(self):
+        return np.abs(self.armyPos - self.home).max() <= SIGHT
+
+    def selectedType(self):
+        if not self.selection:
+            return None
+        if self.selection[0] == 'army':
+            return 'army'
+        return self.selection[0].unit_type
+
+    def canAfford(self, cost):
+        return self.minerals >= cost[0] and self.gas >= cost[1]
+
+    def available(self):
+        available = [_NO_OP, _MOVE_CAMERA, _SELECT_POINT]
+        if sum(self.army.values()):
+            available.append(_SELECT_ARMY)
+
+        selected = self.selectedType()
+        used, limit, army, workers = self.supply()
+        if selected == _TERRAN_SCV:
+            available.extend((_MOVE_SCREEN, _MOVE_MINIMAP, _ATTACK_SCREEN, _ATTACK_MINIMAP, _HARVEST_GATHER))
+            for function_id, unit_type in BUILD_ACTIONS.items():
+                required = REQUIRES.get(unit_type)
+                if self.canAfford(STRUCTURES[unit_type][1]) and (required is None or self.count(required)):
+                    available.append(function_id)
+        elif selected == _TERRAN_BARRACKS:
+            available.append(_RALLY_UNITS_MINIMAP)
+            if used < limit:
+                if self.canAfford(TRAINED[_TERRAN_MARINE][0]):
+                    available.append(_TRAIN_MARINE)
+                if self.canAfford(TRAINED[_TERRAN_REAPER][0]):
+                    available.append(_TRAIN_REAPER)
+            if self.canAfford(STRUCTURES[_TERRAN_TECHLAB][1]):
+                available.append(_BUILD_TECHLAB)
+        elif selected == _TERRAN_COMMANDCENTER:
+            if used < limit and self.canAfford(TRAINED[_TERRAN_SCV][0]):
+                available.append(_TRAIN_SCV)
+        elif selected == 'army':
+            available.extend((_MOVE_SCREEN, _MOVE_MINIMAP, _ATTACK_SCREEN, _ATTACK_MINIMAP))
+        return available
+
+    # actions
+
+    def apply(self, call):
+        function_id = int(call.function)
+        if function_id not in self.lastAvailable:
+            raise ValueError('Function %s/%s is currently not available' % (function_id, _FUNCTIONS[function_id].name))
+        arguments = [[int(value) for value in argument] for argument in call.arguments]
+        for argument in arguments[1:]:
+            size = MINIMAP_SIZE if function_id in (_MOVE_MINIMAP, _ATTACK_MINIMAP, _RALLY_UNITS_MINIMAP, _MOVE_CAMERA) \
+                else SCREEN_SIZE
+            if len(argument) != 2 or not all(0 <= value < size for value in argument):
+                raise ValueError('Wrong argument values for %s: %s' % (_FUNCTIONS[function_id].name, argument))
+
+        if function_id == _SELECT_POINT:
+            self.selectPoint(arguments[0][0], arguments[1])
+        elif function_id == _SELECT_ARMY:
+            self.selection = ['army']
+        elif function_id in BUILD_ACTIONS:
+            self.build(BUILD_ACTIONS[function_id], arguments[1])
+        elif function_id == _BUILD_TECHLAB:
+            self.buildTechlab()
+        elif function_id in TRAIN_ACTIONS:
+            unit_type = TRAIN_ACTIONS[function_id]
+            cost, steps, size = TRAINED[unit_type]
+            self.spend(cost)
+            self.queue.append((self.now + steps, unit_type))
+        elif function_id == _HARVEST_GATHER:
+            self.harvest(arguments[1])
+        elif function_id in (_MOVE_MINIMAP, _ATTACK_MINIMAP) and self.selectedType() == 'army':
+            self.armyTarget = np.array(arguments[1], dtype=np.float64)
+        # camera, screen moves and rally points do not change anything this model tracks
+
+    def selectPoint(self, select_type, point):
+        x, y = point
+        entity_id = self.entityIds[y, x]
+        if entity_id < 0:
+            self.selection = []
+            return
+        if entity_id >= len(self.entities):
+            self.selection = ['army']  # home army pixels
+            return
+        entity = self.entities[entity_id]
+        if entity.owner != _PLAYER_SELF:
+            self.selection = []
+        elif select_type in (_SELECT_ALL_TYPE, _ADD_ALL_TYPE):
+            self.selection = self.owned(entity.unit_type, finished=False)
+        else:
+            self.selection = [entity]
+
+    def spend(self, cost):
+        self.minerals -= cost[0]
+        self.gas -= cost[1]
+
+    def free(self, rect):
+        top, bottom, left, right = rect
+        if top < 0 or left < 0 or bottom > SCREEN_SIZE or right > SCREEN_SIZE:
+            return False
+        taken = self.entityIds[top:bottom, left:right]
+        return not any(self.entities[i].unit_type != _TERRAN_SCV for i in np.unique(taken) if 0 <= i < len(self.entities))
+
+    def build(self, unit_type, point):
+        (height, width), cost, steps, supply = STRUCTURES[unit_type]
+        x, y = point
+        if unit_type == _TERRAN_REFINERY:
+            # snaps onto the closest geyser that does not have one yet, like clicking near it
+            taken = {refinery.rect for refinery in self.owned(_TERRAN_REFINERY, finished=False)}
+            geysers = [geyser for geyser in self.owned(_NEUTRAL_VESPENEGEYSER) if geyser.rect not in taken]
+            if not geysers:
+                return
+            geyser = min(geysers, key=lambda g: (g.rect[0] + g.rect[1] - 2 * y) ** 2 + (g.rect[2] + g.rect[3] - 2 * x) ** 2)
+            rect = geyser.rect
+        else:
+            top = min(max(y - height // 2, 0), SCREEN_SIZE - height)
+            left = min(max(x - width // 2, 0), SCREEN_SIZE - width)
+            rect = (top, top + height, left, left + width)
+            if not self.free(rect):
+                return  # the game refuses to place it, the agent just sees nothing happen
+        self.spend(cost)
+        entity = Entity(unit_type, _PLAYER_SELF, rect, self.now + steps)
+        if unit_type == _TERRAN_REFINERY:
+            entity.workers = 1  # the SCV that builds it stays on gas
+        self.entities.append(entity)
+        self.screenDirty = True
+
+    def buildTechlab(self):
+        height, width = STRUCTURES[_TERRAN_TECHLAB][0]
+        for barracks in self.selection:
+            if barracks.done > self.now:
+                continue
+            top, bottom, left, right = barracks.rect
+            # the addon sits against the barracks on the side away from the map edge
+            left = right if right + width <= SCREEN_SIZE else left - width
+            rect = (bottom - height, bottom, left, left + width)
+            if self.free(rect):
+                self.spend(STRUCTURES[_TERRAN_TECHLAB][1])
+                self.entities.append(Entity(_TERRAN_TECHLAB, _PLAYER_SELF, rect, self.now + STRUCTURES[_TERRAN_TECHLAB][2]))
+                self.screenDirty = True
+                return
+
+    def harvest(self, point):
+        x, y = point
+        entity_id = self.entityIds[y, x]
+        target = self.entities[entity_id] if 0 <= entity_id < len(self.entities) else None
+        refineries = [refinery for refinery in self.owned(_TERRAN_REFINERY) if refinery.workers]
+        if target is not None and target.unit_type == _TERRAN_REFINERY and target.done <= self.now:
+            if target.workers < WORKERS_PER_REFINERY and self.gasWorkers() < self.count(_TERRAN_SCV):
+                target.workers += 1
+        elif target is not None and target.unit_type == _NEUTRAL_MINERAL_FIELD and refineries:
+            # only moves anyone if the selected SCV happened to be one of the gas workers
+            if self.rng.uniform() * self.count(_TERRAN_SCV) < self.gasWorkers():
+                refineries[0].workers -= 1
+
+    # simulation
+
+    def tick(self, elapsed):
+        used, limit, army, workers = self.supply()
+        gas_workers = self.gasWorkers()
+        mined = (workers - gas_workers) * MINERALS_PER_WORKER * elapsed
+        gassed = gas_workers * GAS_PER_WORKER * elapsed
+        self.minerals += mined
+        self.gas += gassed
+        self.collected[0] += mined
+        self.collected[1] += gassed
+
+        finished = [unit for done, unit in self.queue if done <= self.now]
+        if finished:
+            self.queue = [(done, unit) for done, unit in self.queue if done > self.now]
+            for unit in finished:
+                self.addUnit(unit)
+
+        self.moveArmy(elapsed)
+        self.moveEnemy()
+        self.fight()
+
+    def moveArmy(self, elapsed):
+        was_home = self.armyHome()
+        offset = self.armyTarget - self.armyPos
+        distance = np.hypot(*offset)
+        if distance > ARMY_SPEED * elapsed:
+            self.armyPos += offset * (ARMY_SPEED * elapsed / distance)
+        else:
+            self.armyPos = self.armyTarget.copy()
+        if was_home != self.armyHome():
+            self.screenDirty = True
+
+    def moveEnemy(self):
+        # the squad wanders around its own half of the map and slowly gets reinforced
+        if self.steps % ENEMY_REINFORCE_EVERY == 0 and self.enemySquad < ENEMY_SQUAD_MAX and self.enemyStructures:
+            self.enemySquad += 1
+        drift = self.enemyBase + (self.home - self.enemyBase) * 0.25 - self.enemyPos
+        self.enemyPos = np.clip(self.enemyPos + drift * 0.05 + self.rng.uniform(-1.5, 1.5, 2), 0, MINIMAP_SIZE - 1)
+
+    def fight(self):
+        army_units = sum(self.army.values())
+        if not army_units:
+            return
+        if self.enemySquad and np.hypot(*(self.enemyPos - self.armyPos)) <= ENGAGE_RANGE:
+            kills = min(self.rng.binomial(army_units, KILL_CHANCE), self.enemySquad)
+            losses = self.rng.binomial(self.enemySquad, LOSS_CHANCE)
+            self.enemySquad -= kills
+            self.score[5] += kills * UNIT_VALUE
+            self.loseArmy(losses)
+        elif self.enemyStructures and np.hypot(*(self.enemyBase - self.armyPos)) <= ENGAGE_RANGE:
+            if self.rng.binomial(army_units, KILL_CHANCE / 2):
+                self.enemyStructures -= 1
+                self.score[6] += STRUCTURE_VALUE
+
+    def loseArmy(self, losses):
+        for unit in ARMY_TYPES:
+            lost = min(losses, self.army[unit])
+            self.army[unit] -= lost
+            losses -= lost
+        if not sum(self.army.values()):
+            self.armyPos = self.home.copy()
+            self.armyTarget = self.home.copy()
+            if self.selection == ['army']:
+                self.selection = []
+        self.screenDirty = True
+
+    # observation
+
+    def drawScreen(self):
+        screen = self.screen
+        screen[:] = 0
+        screen[_SCREEN.visibility_map.index] = _VISIBLE
+        unit_type = screen[_SCREEN.unit_type.index]
+        relative = screen[_SCREEN.player_relative.index]
+        player_id = screen[_SCREEN.player_id.index]
+        ids = self.entityIds
+        ids[:] = -1
+
+        for i, entity in enumerate(self.entities):
+            top, bottom, left, right = entity.rect
+            unit_type[top:bottom, left:right] = entity.unit_type
+            relative[top:bottom, left:right] = entity.owner
+            player_id[top:bottom, left:right] = 1 if entity.owner == _PLAYER_SELF else 16
+            ids[top:bottom, left:right] = i
+
+        if self.armyHome():
+            # the home army stands in a block next to the command center
+            slot = 0
+            for unit in ARMY_TYPES:
+                for n in range(self.army[unit]):
+                    rect = self.place(52 + 3 * (slot // 10), 52 + 3 * (slot % 10), 2, 2)
+                    unit_type[rect[0]:rect[1], rect[2]:rect[3]] = unit
+                    relative[rect[0]:rect[1], rect[2]:rect[3]] = _PLAYER_SELF
+                    player_id[rect[0]:rect[1], rect[2]:rect[3]] = 1
+                    ids[rect[0]:rect[1], rect[2]:rect[3]] = len(self.entities)
+                    slot += 1
+        self.screenDirty = False
+
+    def drawMinimap(self):
+        minimap = self.minimap
+        minimap[:] = 0
+        relative = minimap[_MINIMAP.player_relative.index]
+        visibility = minimap[_MINIMAP.visibility_map.index]
+
+        hx, hy = self.home.astype(int)
+        relative[hy - 4:hy + 5, hx - 4:hx + 5] = _PLAYER_SELF
+        visibility[max(hy - SIGHT - 4, 0):hy + SIGHT + 5, max(hx - SIGHT - 4, 0):hx + SIGHT + 5] = _VISIBLE
+        camera = minimap[_MINIMAP.camera.index]
+        camera[max(hy - 7, 0):hy + 8, max(hx - 7, 0):hx + 8] = 1
+
+        ax, ay = np.round(self.armyPos).astype(int)
+        if sum(self.army.values()):
+            relative[max(ay - 1, 0):ay + 2, max(ax - 1, 0):ax + 2] = _PLAYER_SELF
+            visibility[max(ay - SIGHT, 0):ay + SIGHT + 1, max(ax - SIGHT, 0):ax + SIGHT + 1] = _VISIBLE
+
+        # enemies only show up where we have vision
+        enemy = np.zeros_like(relative, dtype=bool)
+        if self.enemyStructures:
+            ex, ey = self.enemyBase.astype(int)
+            enemy[ey - 3:ey + 4, ex - 3:ex + 4] = True
+        if self.enemySquad:
+            sx, sy = np.round(self.enemyPos).astype(int)
+            enemy[max(sy - 1, 0):sy + 2, max(sx - 1, 0):sx + 2] = True
+        relative[enemy & (visibility == _VISIBLE)] = _PLAYER_ENEMY
+        minimap[_MINIMAP.player_id.index] = np.where(relative == _PLAYER_SELF, 1, np.where(relative == _PLAYER_ENEMY, 2, 0))
+
+    def selectRows(self):
+        if self.selection == ['army']:
+            return np.array([[unit, _PLAYER_SELF, 45, 0, 0, 0, 0] for unit in ARMY_TYPES
+                             for n in range(self.army[unit])], dtype=np.int32).reshape(-1, 7)
+        return np.array([[entity.unit_type, _PLAYER_SELF, 100, 0, 0, 0,
+                          100 if entity.done <= self.now else 0] for entity in self.selection],
+                        dtype=np.int32).reshape(-1, 7)
+
+    def timestep(self, step_type, reward, discount):
+        if self.screenDirty:
+            self.drawScreen()
+        self.drawMinimap()
+
+        used, limit, army, workers = self.supply()
+        self.lastAvailable = self.available()
+        player = np.array([1, int(self.minerals), int(self.gas), used, limit, army, workers, 0,
+                           sum(self.army.values()), 0, 0], dtype=np.int32)
+        score = self.score
+        score[3] = sum(TRAINED[unit][0][0] * count for unit, count in self.army.items())
+        score[4] = sum(STRUCTURES[entity.unit_type][1][0] for entity in self.entities if entity.unit_type in STRUCTURES)
+        score[7], score[8] = self.collected
+        score[0] = score[3] + score[4] + score[5] + score[6]
+
+        rows = self.selectRows()
+        single, multi = (rows, np.zeros((0, 7), dtype=np.int32)) if len(rows) == 1 else (np.zeros((0, 7), dtype=np.int32), rows)
+        screen, minimap = (self.screen.copy(), self.minimap.copy()) if self.copy else (self.screen, self.minimap)
+        observation = {
+            'screen': screen,
+            'minimap': minimap,
+            'player': player,
+            'score_cumulative': score.copy(),
+            'available_actions': np.array(self.lastAvailable, dtype=np.int32),
+            'single_select': single,
+            'multi_select': multi,
+        }
+        return environment.TimeStep(step_type=step_type, reward=reward, discount=discount, observation=observation)
+
+
+def run_loop(agents, env, max_frames=0, max_episodes=0):
+    #same loop as pysc2.env.run_loop, returns (frames, seconds) instead of printing
+    total_frames = 0
+    total_episodes = 0
+    start_time = time.perf_counter()
+
+    for agent, obs_spec, act_spec in zip(agents, env.observation_spec(), env.action_spec()):
+        agent.setup(obs_spec, act_spec)
+
+    while not max_episodes or total_episodes < max_episodes:
+        total_episodes += 1
+        timesteps = env.reset()
+        for agent in agents:
+            agent.reset()
+        while True:
+            total_frames += 1
+            function_calls = [agent.step(timestep) for agent, timestep in zip(agents, timesteps)]
+            if max_frames and total_frames >= max_frames:
+                return total_frames, time.perf_counter() - start_time
+            if timesteps[0].last():
+                break
+            timesteps = env.step(function_calls)
+    return total_frames, time.perf_counter() - start_time
+
+
+def load_agent(path):
+    #"ScoutFinal.SmartAgent" -> the class
+    module, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
+
+
+def env_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent', type=str, default='ScoutFinal.SmartAgent', help="module.Class of the agent to run")
+    parser.add_argument('--episodes', type=int, default=3)
+    parser.add_argument('--max-steps', type=int, default=1000, help="agent steps per episode")
+    parser.add_argument('--step-mul', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = env_parser()
+    agent = load_agent(args.agent)()
+    with HeadlessEnv(step_mul=args.step_mul, max_steps=args.max_steps, seed=args.seed) as env:
+        frames, seconds = run_loop([agent], env, max_episodes=args.episodes)
+    print('Took %.3f seconds for %s steps: %.3f fps' % (seconds, frames, frames / seconds))
+
+if __name__ == '__main__':
+    main()
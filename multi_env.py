@@ -0,0 +1,197 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from pysc2.lib import features
+
+from screen_summary import ScreenSummary
+
+
+#Steps K agents against K environments in one process, with the per-frame features of
+#all K worked out together
+#
+#StackedFeatures copies the unit_type screens and player_relative minimaps of the K
+#observations into two (K, size, size) arrays and computes, in a handful of NumPy
+#calls over the stack, the values ScoutFinal reads from its FrameView:
+#    unit type pixel counts   one np.bincount of the non background pixels by environment
+#    enemy pixels             one flatnonzero over the stack, split per environment
+#    enemy grid               the cells of those pixels, like grid_pool.occupancy_grid
+#    command center centroid  weighted np.bincount of the CC pixels among the counted ones
+#The results go to each agent's FrameView through prime(), keyed like its cache, so
+#the agent's own step() (state key, choose_action, learn) finds them already there.
+#Agents without a frame are simply stepped.
+#
+#Only the agents' side gets faster, the environments step one by one either way and
+#HeadlessEnv takes most of a step. With a single environment batching costs more than
+#it saves, it pays from about 8 on.
+#
+#python multi_env.py --agents 1,8,16,32,64  per agent step time, one by one vs batched
+
+_UNIT_TYPE = features.SCREEN_FEATURES.unit_type.index
+_PLAYER_RELATIVE_MINI = features.MINIMAP_FEATURES.player_relative.index
+
+_PLAYER_ENEMY = 4
+_TERRAN_COMMANDCENTER = 18
+
+
+class StackedFeatures:
+    def __init__(self, grid_cells=(4,)):
+        self.grid_cells = tuple(grid_cells)
+        self.screens = None
+        self.minimaps = None
+
+    def stack(self, buffer, layers):
+        #copies layers into a reused (K, ...) buffer, reallocated when K or the shape changes
+        shape = (len(layers),) + layers[0].shape
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=layers[0].dtype)
+        np.stack(layers, out=buffer)
+        return buffer
+
+    @staticmethod
+    def unravel(flat, shape):
+        #(k, y, x) of flat indices into a (K, height, width) array, in row major order like nonzero
+        k, rest = np.divmod(flat, shape[1] * shape[2])
+        y, x = np.divmod(rest, shape[2])
+        return k, y, x
+
+    def compute(self, timesteps):
+        #one dict of FrameView cache values per timestep
+        observations = [timestep.observation for timestep in timesteps]
+        unit_types = [observation['screen'][_UNIT_TYPE] for observation in observations]
+        screens = self.screens = self.stack(self.screens, unit_types)
+        minimaps = self.minimaps = self.stack(
+            self.minimaps, [observation['minimap'][_PLAYER_RELATIVE_MINI] for observation in observations])
+        count = len(timesteps)
+
+        # only the pixels that are not background are counted, about a tenth of the screen.
+        # Every environment gets its own range of bins and the background is what is left over
+        pixels = screens.shape[1] * screens.shape[2]
+        flat = np.flatnonzero(screens != 0)  # nonzero of a bool mask, much cheaper than of int32
+        env = flat // pixels  # a division alone is several times cheaper than divmod
+        units = screens.reshape(-1)[flat]
+        types = int(units.max()) + 1 if len(units) else 1
+        counts = np.bincount(env * types + units, minlength=count * types).reshape(count, types)
+        counts[:, 0] = pixels - counts.sum(axis=1)
+
+        # flat indices split back into (k, y, x), much cheaper than nonzero on a 3d array
+        size = minimaps.shape[-1]
+        k, enemy_y, enemy_x = self.unravel(np.flatnonzero(minimaps == _PLAYER_ENEMY), minimaps.shape)
+        bounds = np.searchsorted(k, np.arange(count + 1))
+        grids = {}
+        for cells in self.grid_cells:
+            if size % cells:
+                raise ValueError('%d cells do not divide a %d pixel minimap' % (cells, size))
+            step = size // cells
+            grid = np.zeros((count, cells, cells), dtype=bool)
+            grid[k, enemy_y // step, enemy_x // step] = True  # same as occupancy_grid on every minimap
+            grids[cells] = grid
+
+        # the command center pixels are among the ones already found
+        cc = units == _TERRAN_COMMANDCENTER
+        cc_k = env[cc]
+        cc_y, cc_x = np.divmod(flat[cc] - cc_k * pixels, screens.shape[2])
+        cc_pixels = np.bincount(cc_k, minlength=count)
+        cc_x = np.bincount(cc_k, cc_x, minlength=count)
+        cc_y = np.bincount(cc_k, cc_y, minlength=count)
+
+        values = []
+        for i in range(count):
+            start, stop = bounds[i], bounds[i + 1]
+            frame = {
+                'screen': ScreenSummary(unit_types[i], counts[i]),
+                'enemy_pixels': (enemy_y[start:stop], enemy_x[start:stop]),
+                'cc_centroid': (cc_x[i] / cc_pixels[i], cc_y[i] / cc_pixels[i])
+                if cc_pixels[i] else None,
+            }
+            for cells, grid in grids.items():
+                frame[('enemy_grid', cells)] = grid[i]
+            values.append(frame)
+        return values
+
+
+def run_batched(agents, envs, max_frames=0, max_episodes=0, batched=True, grid_cells=(4,)):
+    #like headless_env.run_loop for K single player environments at once, max_episodes is
+    #per environment. With batched=False the features are left to each agent, for comparison.
+    #Returns (frames, seconds, agent seconds), the last only the features and agent steps
+    start_time = time.perf_counter()
+    agent_seconds = 0.0
+    stacked = StackedFeatures(grid_cells)
+    for agent, env in zip(agents, envs):
+        agent.setup(env.observation_spec()[0], env.action_spec()[0])
+    timesteps = []
+    for agent, env in zip(agents, envs):
+        timesteps.append(env.reset()[0])
+        agent.reset()
+
+    total_frames = 0
+    episodes = [0] * len(envs)
+    active = list(range(len(envs)))
+    while active:
+        agent_start = time.perf_counter()
+        if batched:
+            for i, values in zip(active, stacked.compute([timesteps[i] for i in active])):
+                frame = getattr(agents[i], 'frame', None)
+                if frame is not None:
+                    frame.prime(timesteps[i], values)
+        function_calls = [agents[i].step(timesteps[i]) for i in active]
+        agent_seconds += time.perf_counter() - agent_start
+        total_frames += len(active)
+
+        still_active = []
+        for i, function_call in zip(active, function_calls):
+            if timesteps[i].last():
+                episodes[i] += 1
+                if max_episodes and episodes[i] >= max_episodes:
+                    continue
+                timesteps[i] = envs[i].reset()[0]
+                agents[i].reset()
+            else:
+                timesteps[i] = envs[i].step([function_call])[0]
+            still_active.append(i)
+        active = still_active
+        if max_frames and total_frames >= max_frames:
+            break
+    return total_frames, time.perf_counter() - start_time, agent_seconds
+
+
+def multi_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent', type=str, default='ScoutFinal.SmartAgent', help="module.Class of the agents")
+    parser.add_argument('--agents', type=str, default='1,8,16,64', help="comma separated K values to time")
+    parser.add_argument('--steps', type=int, default=4000, help="agent steps per run, spread over the K agents")
+    parser.add_argument('--max-steps', type=int, default=500, help="steps per episode")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each, the fastest counts")
+    return parser.parse_args()
+
+
+def main():
+    from headless_env import HeadlessEnv, load_agent
+
+    args = multi_parser()
+    agent_class = load_agent(args.agent)
+    kwargs = {'data_file': None} if args.agent.startswith('ScoutFinal.') else {}
+    print('%6s %29s %29s' % ('', 'agent side', 'end to end'))
+    print('%6s %10s %10s %7s %10s %10s %7s' % ('K', 'one by one', 'batched', 'speedup', 'one by one', 'batched',
+                                             'speedup'))
+    for count in [int(value) for value in args.agents.split(',')]:
+        # us per agent step, agent side and end to end, the fastest of --repeat runs
+        best = {False: [float('inf')] * 2, True: [float('inf')] * 2}
+        for run in range(args.repeat):
+            for batched in (False, True):
+                random.seed(args.seed)
+                np.random.seed(args.seed)
+                agents = [agent_class(**kwargs) for i in range(count)]
+                envs = [HeadlessEnv(max_steps=args.max_steps, seed=args.seed + i) for i in range(count)]
+                frames, seconds, agent_seconds = run_batched(agents, envs, max_frames=args.steps, batched=batched)
+                best[batched] = [min(best[batched][0], agent_seconds / frames * 1e6),
+                                 min(best[batched][1], seconds / frames * 1e6)]
+        one, both = best[False], best[True]
+        print('%6d %7.1f us %7.1f us %6.2fx %7.1f us %7.1f us %6.2fx' % (
+            count, one[0], both[0], one[0] / both[0], one[1], both[1], one[1] / both[1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+
+from pysc2.env import environment
+from pysc2.lib import actions
+
+
+#Records every observation an agent sees and plays them back into step() later
+#
+#RecordingAgent wraps any agent. Every TimeStep it sees goes into a buffer together
+#with the function call the agent answered with, and every chunk_steps steps or at the
+#end of an episode the buffer is written to <directory>/epNNNNN_MMMMM.npz with
+#np.savez_compressed. Inside a chunk every array that keeps its shape (screen,
+#minimap, player, score_cumulative) is stored as the first frame followed by frame to
+#frame differences, so the mostly unchanged layers compress to almost nothing. Ragged
+#ones (available_actions, single_select, multi_select) are concatenated with a
+#lengths array. The stored function calls let a replay check it makes the same decisions.
+#manifest.json lists the chunks of every episode and the seed that random and
+#np.random were given when recording started.
+#
+#replay() seeds random/np.random the same way, feeds the frames back through
+#agent.reset()/agent.step() and returns the steps where the agent picked a
+#different action. The agent has to start from the same Q-table it was recorded
+#with (e.g. ScoutFinal.SmartAgent(data_file=None) both times) to get the same actions.
+
+MANIFEST = 'manifest.json'
+CHUNK_STEPS = 256
+
+_DELTA = 'delta.'
+_RAGGED = 'ragged.'
+_LENGTHS = 'lengths.'
+
+
+def pack_chunk(timesteps, function_calls):
+    #dict of arrays for np.savez_compressed
+    arrays = {
+        'step_type': np.array([int(timestep.step_type) for timestep in timesteps], dtype=np.int8),
+        'reward': np.array([timestep.reward for timestep in timesteps], dtype=np.float64),
+        'discount': np.array([timestep.discount for timestep in timesteps], dtype=np.float64),
+    }
+    for key in timesteps[0].observation:
+        frames = [np.asarray(timestep.observation[key]) for timestep in timesteps]
+        if all(frame.shape == frames[0].shape for frame in frames):
+            stacked = np.stack(frames)
+            # wraps around on overflow, the cumsum in unpack_chunk wraps back the same way
+            arrays[_DELTA + key] = np.concatenate((stacked[:1], np.diff(stacked, axis=0))) \
+                if stacked.dtype.kind in 'iu' else stacked
+        else:
+            arrays[_RAGGED + key] = np.concatenate(frames)
+            arrays[_LENGTHS + key] = np.array([len(frame) for frame in frames], dtype=np.int64)
+
+    # function id, argument count, then per argument its length and values
+    calls = []
+    for call in function_calls:
+        arguments = [] if call is None else call.arguments
+        calls.append([-1 if call is None else int(call.function), len(arguments)])
+        for argument in arguments:
+            calls[-1].append(len(argument))
+            calls[-1].extend(int(value) for value in argument)
+    arrays['calls'] = np.concatenate([np.array(call, dtype=np.int64) for call in calls])
+    arrays['call_lengths'] = np.array([len(call) for call in calls], dtype=np.int64)
+    return arrays
+
+
+def unpack_chunk(data):
+    #list of (TimeStep, FunctionCall or None) back out of pack_chunk's arrays
+    count = len(data['step_type'])
+    observations = [{} for i in range(count)]
+    for name in data.files:
+        if name.startswith(_DELTA):
+            stacked = data[name]
+            if stacked.dtype.kind in 'iu':
+                stacked = np.cumsum(stacked, axis=0, dtype=stacked.dtype)
+            for observation, frame in zip(observations, stacked):
+                observation[name[len(_DELTA):]] = frame
+        elif name.startswith(_RAGGED):
+            key = name[len(_RAGGED):]
+            frames = np.split(data[name], np.cumsum(data[_LENGTHS + key])[:-1])
+            for observation, frame in zip(observations, frames):
+                observation[key] = frame
+
+    calls = []
+    for call in np.split(data['calls'], np.cumsum(data['call_lengths'])[:-1]):
+        call = call.tolist()
+        if call[0] < 0:
+            calls.append(None)
+            continue
+        arguments, position = [], 2
+        for i in range(call[1]):
+            length = call[position]
+            arguments.append(call[position + 1:position + 1 + length])
+            position += 1 + length
+        calls.append(actions.FunctionCall(call[0], arguments))
+
+    steps = []
+    for i in range(count):
+        timestep = environment.TimeStep(step_type=environment.StepType(int(data['step_type'][i])),
+                                        reward=float(data['reward'][i]), discount=float(data['discount'][i]),
+                                        observation=observations[i])
+        steps.append((timestep, calls[i]))
+    return steps
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+class RecordingAgent:
+    #Drop-in wrapper: RecordingAgent(SmartAgent(), 'recordings/run1') goes wherever the agent did
+    def __init__(self, agent, directory, chunk_steps=CHUNK_STEPS, seed=0):
+        self.agent = agent
+        self.directory = directory
+        self.chunk_steps = chunk_steps
+        self.seed = seed
+        self.episodes = []  # chunk file names per episode
+        self.timesteps = []
+        self.calls = []
+        os.makedirs(directory, exist_ok=True)
+        if seed is not None:
+            seed_everything(seed)
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def setup(self, obs_spec, action_spec):
+        self.agent.setup(obs_spec, action_spec)
+
+    def reset(self):
+        self.flush()
+        self.episodes.append([])
+        self.agent.reset()
+
+    def step(self, obs):
+        if not self.episodes:
+            self.episodes.append([])
+        function_call = self.agent.step(obs)
+        self.timesteps.append(obs)
+        self.calls.append(function_call)
+        if obs.last() or len(self.timesteps) >= self.chunk_steps:
+            self.flush()
+        return function_call
+
+    def flush(self):
+        if not self.timesteps:
+            return
+        name = 'ep%05d_%05d.npz' % (len(self.episodes) - 1, len(self.episodes[-1]))
+        np.savez_compressed(os.path.join(self.directory, name), **pack_chunk(self.timesteps, self.calls))
+        self.episodes[-1].append(name)
+        self.timesteps = []
+        self.calls = []
+
+        manifest = {'seed': self.seed, 'chunk_steps': self.chunk_steps,
+                    'agent': type(self.agent).__module__ + '.' + type(self.agent).__name__,
+                    'episodes': self.episodes}
+        temp = os.path.join(self.directory, MANIFEST + '.tmp')
+        with open(temp, 'w') as out:
+            json.dump(manifest, out, indent=1)
+        os.replace(temp, os.path.join(self.directory, MANIFEST))
+
+    def close(self):
+        self.flush()
+
+
+class ObservationReplay:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as data:
+            self.manifest = json.load(data)
+        self.seed = self.manifest['seed']
+
+    def __len__(self):
+        return len(self.manifest['episodes'])
+
+    def episode(self, index):
+        #yields (TimeStep, recorded FunctionCall) for one episode, a chunk at a time
+        for name in self.manifest['episodes'][index]:
+            with np.load(os.path.join(self.directory, name)) as data:
+                for step in unpack_chunk(data):
+                    yield step
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.episode(index)
+
+
+def replay(agent, directory, seed=None, on_step=None):
+    #feeds a recording back into agent, returns (episode, step, recorded, replayed) for every
+    #step where the agent answered differently. on_step(agent, timestep) replaces agent.step,
+    #e.g. to time it
+    recording = ObservationReplay(directory)
+    seed = recording.seed if seed is None else seed
+    if seed is not None:
+        seed_everything(seed)
+    step = on_step or (lambda agent, timestep: agent.step(timestep))
+
+    mismatches = []
+    for index, episode in enumerate(recording):
+        agent.reset()
+        for i, (timestep, recorded) in enumerate(episode):
+            function_call = step(agent, timestep)
+            if recorded is not None and not same_call(recorded, function_call):
+                mismatches.append((index, i, recorded, function_call))
+    return mismatches
+
+
+def same_call(recorded, function_call):
+    if function_call is None:
+        return False
+    arguments = [[int(value) for value in argument] for argument in function_call.arguments]
+    return int(function_call.function) == recorded.function and arguments == recorded.arguments
+
+
+def recorder_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['record', 'replay'],
+                        help="record runs the agent in headless_env, replay feeds a recording back into it")
+    parser.add_argument('directory', metavar='DIR', type=str)
+    parser.add_argument('--agent', type=str, default='ScoutFinal.SmartAgent', help="module.Class of the agent")
+    parser.add_argument('--episodes', type=int, default=1)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--chunk-steps', type=int, default=CHUNK_STEPS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-data', action='store_true',
+                        help="construct the agent with data_file=None so recording and replay start from the same "
+                             "empty Q-table (ScoutFinal.SmartAgent)")
+    return parser.parse_args()
+
+
+def main():
+    from headless_env import HeadlessEnv, load_agent, run_loop
+
+    args = recorder_parser()
+    agent = load_agent(args.agent)(**({'data_file': None} if args.no_data else {}))
+    if args.command == 'record':
+        recorder = RecordingAgent(agent, args.directory, args.chunk_steps, args.seed)
+        with HeadlessEnv(max_steps=args.max_steps, seed=args.seed) as env:
+            frames, seconds = run_loop([recorder], env, max_episodes=args.episodes)
+        recorder.close()
+        size = sum(os.path.getsize(os.path.join(args.directory, name)) for name in os.listdir(args.directory))
+        print('%d steps in %d bytes' % (frames, size))
+    else:
+        mismatches = replay(agent, args.directory)
+        for episode, step, recorded, replayed in mismatches[:20]:
+            print('episode %d step %d: recorded %s, replayed %s' % (episode, step, recorded, replayed))
+        print('%d steps differ' % len(mismatches))
+
+if __name__ == '__main__':
+    main()
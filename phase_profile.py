@@ -0,0 +1,136 @@
+import bisect
+import csv
+import json
+import os
+import time
+
+
+#Per phase wall time for an agent, aggregated per episode
+#
+#    with self.profiler.phase('learn'):
+#        ...
+#    self.profiler.episode_end(episode)
+#
+#Every phase gets a count, total, min, max and a histogram over HISTOGRAM_EDGES_US
+#for the episode. episode_end() appends one row per phase to the output file and
+#starts over. A .csv path writes CSV, anything else writes JSON lines. NULL_PROFILER
+#is what an agent uses when profiling is off: phase() hands back one shared
+#context manager that does nothing, so a disabled phase costs a method call.
+
+#upper bucket edges in microseconds, the last bucket catches everything slower
+HISTOGRAM_EDGES_US = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000,
+                      200000, 500000, 1000000]
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class NullProfiler:
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def record(self, name, seconds):
+        pass
+
+    def episode_end(self, episode):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseStats:
+    __slots__ = ('count', 'total', 'low', 'high', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.low = float('inf')
+        self.high = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_EDGES_US) + 1)
+
+    def add(self, microseconds):
+        self.count += 1
+        self.total += microseconds
+        if microseconds < self.low:
+            self.low = microseconds
+        if microseconds > self.high:
+            self.high = microseconds
+        self.buckets[bisect.bisect_left(HISTOGRAM_EDGES_US, microseconds)] += 1
+
+    def row(self, episode, phase):
+        return {'episode': episode, 'phase': phase, 'count': self.count, 'total_us': round(self.total, 1),
+                'mean_us': round(self.total / self.count, 2), 'min_us': round(self.low, 2),
+                'max_us': round(self.high, 2), 'buckets': self.buckets}
+
+
+class PhaseProfiler:
+    enabled = True
+
+    def __init__(self, path):
+        self.path = path
+        self.csv = path.endswith('.csv')
+        self.phases = {}  # name -> reusable context manager
+        self.stats = {}
+
+    def phase(self, name):
+        timer = self.phases.get(name)
+        if timer is None:
+            timer = self.phases[name] = _Phase(self, name)
+        return timer
+
+    def record(self, name, seconds):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = PhaseStats()
+        stats.add(seconds * 1e6)
+
+    def episode_end(self, episode):
+        rows = [stats.row(episode, name) for name, stats in self.stats.items()]
+        self.stats = {}
+        if not rows:
+            return
+        if self.csv:
+            self.writeCsv(rows)
+        else:
+            with open(self.path, 'a') as out:
+                for row in rows:
+                    out.write(json.dumps(row) + '\n')
+
+    def writeCsv(self, rows):
+        buckets = ['le_%dus' % edge for edge in HISTOGRAM_EDGES_US] + ['gt_%dus' % HISTOGRAM_EDGES_US[-1]]
+        new = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as out:
+            writer = csv.writer(out)
+            if new:
+                writer.writerow(['episode', 'phase', 'count', 'total_us', 'mean_us', 'min_us', 'max_us'] + buckets)
+            for row in rows:
+                writer.writerow([row['episode'], row['phase'], row['count'], row['total_us'], row['mean_us'],
+                                 row['min_us'], row['max_us']] + row['buckets'])
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+#Where the build helpers put their buildings
+#
+#BuildSites works out every candidate site once per episode: the command center
+#centroid plus a fixed offset per site, already mirrored for the bottom-right spawn
+#like transformDistance. next() hands out the first site that is still free on the
+#current screen. The sites of the buildings already up are skipped by count, the rest
+#are checked again on every call, so a site an SCV or a passing unit kept taken once
+#is handed out as soon as it is clear.
+#
+#Occupancy is the check itself. It is a summed-area table of the unit_type pixels a
+#building cannot go on, so whether a whole footprint is free costs four lookups
+#however big the building is. SCVs and the army step aside for a new building, they
+#do not count.
+#
+#    sites = BuildSites((cc_x, cc_y), base_top_left, {depot: [(-35, 0), ...]}, {depot: (8, 9)})
+#    target = sites.next(depot, depot_count, Occupancy(unit_type))   # [x, y] or None
+
+_TERRAN_SCV = 45
+_TERRAN_MARINE = 48
+_TERRAN_REAPER = 49
+_TERRAN_MARAUDER = 51
+
+#unit types that move out of the way of a new building
+MOBILE_UNITS = (_TERRAN_SCV, _TERRAN_MARINE, _TERRAN_REAPER, _TERRAN_MARAUDER)
+
+
+class Occupancy:
+    def __init__(self, unit_type, mobile=MOBILE_UNITS):
+        blocked = unit_type != 0
+        if len(mobile):
+            blocked &= ~np.isin(unit_type, mobile)
+        self.height, self.width = unit_type.shape
+        # table[y, x] is the number of blocked pixels above and left of (y, x)
+        self.table = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(blocked, axis=0, dtype=np.int32), axis=1, out=self.table[1:, 1:])
+
+    def rect(self, x, y, footprint):
+        #(top, bottom, left, right) of a footprint centered on (x, y), cut to the screen
+        height, width = footprint
+        top = y - height // 2
+        left = x - width // 2
+        return max(top, 0), min(top + height, self.height), max(left, 0), min(left + width, self.width)
+
+    def free(self, x, y, footprint):
+        #True when no blocking pixel is under the footprint, the part off the screen is not known
+        top, bottom, left, right = self.rect(x, y, footprint)
+        if top >= bottom or left >= right:
+            return False  # entirely off the screen
+        table = self.table
+        return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left] == 0
+
+
+class BuildSites:
+    def __init__(self, center, base_top_left, offsets, footprints):
+        #center is the (x, y) of the command center, offsets {unit type: [(dx, dy), ...]} in
+        #top-left spawn terms, footprints {unit type: (height, width)} in screen pixels
+        x, y = center
+        sign = 1 if base_top_left else -1
+        self.sites = dict((unit, [[x + sign * dx, y + sign * dy] for dx, dy in unit_offsets])
+                          for unit, unit_offsets in offsets.items())
+        self.footprints = footprints
+
+    def next(self, unit, count, occupancy):
+        #[x, y] of the first free site from the count-th one on, None when all are taken.
+        #The count of buildings already up skips their sites without checking them
+        sites = self.sites[unit]
+        footprint = self.footprints[unit]
+        i = count
+        while i < len(sites) and not occupancy.free(sites[i][0], sites[i][1], footprint):
+            i += 1
+        return list(sites[i]) if i < len(sites) else None
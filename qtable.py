@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+
+# Based on https://github.com/MorvanZhou/Reinforcement-learning-with-tensorflow
+
+#Array backed Q-table shared by ScoutFinal.py, smartAgent.py and smartAgent2.py
+#Same choose_action/learn/check_state_exist API as the old pandas version but the
+#values live in a preallocated numpy matrix and states are found through a dict,
+#so adding a state is amortized O(1) and every lookup/update is O(1)
+
+TERMINAL_STATE = 'terminal'
+
+INITIAL_CAPACITY = 1024
+GROWTH_FACTOR = 2
+
+
+class QLearningTable:
+    def __init__(self, actions, learning_rate=0.01, reward_decay=0.9, e_greedy=0.9, capacity=INITIAL_CAPACITY):
+        self.actions = actions
+        self.lr = learning_rate
+        self.gamma = reward_decay
+        self.epsilon = e_greedy
+
+        self.columns = {action: i for i, action in enumerate(self.actions)}  # action label -> column
+        self.index = {}  # state key -> row
+        self.states = []  # row -> state key
+        self.values = np.zeros((max(capacity, 1), len(self.actions)), dtype=np.float64)
+
+        self.all_actions = np.ones(len(self.actions), dtype=bool)
+        self.all_actions.setflags(write=False)
+        self.ties = np.zeros(len(self.actions), dtype=bool)  # scratch row reused by choose_action
+        self.dirty = set()  # rows changed by learn since the last take_dirty, for checkpoints
+
+    def __len__(self):
+        return len(self.states)
+
+    def choose_action(self, observation, action_mask=None):
+        #action_mask is a boolean array with True for every action the greedy choice may take,
+        #see ActionMaskCache for building them once instead of every step
+        row = self.check_state_exist(observation)
+        if action_mask is None:
+            action_mask = self.all_actions
+
+        if np.random.uniform() < self.epsilon:
+            state_action = self.values[row]
+            best = np.max(state_action, where=action_mask, initial=-np.inf)
+
+            # some actions have the same value, pick one of them at random
+            ties = self.ties
+            np.equal(state_action, best, out=ties)
+            ties &= action_mask
+            count = np.count_nonzero(ties)
+            if count == 1:
+                column = ties.argmax()
+            else:
+                column = np.flatnonzero(ties)[np.random.randint(count)]
+        else:
+            # choose random action out of all of them, excluded ones too, as np.random.choice(self.actions) did
+            column = np.random.randint(len(self.actions))
+
+        return self.actions[column]
+
+    def learn(self, s, a, r, s_):
+        if s == s_:
+            return
+        if s_ != TERMINAL_STATE:
+            next_row = self.check_state_exist(s_)
+        row = self.check_state_exist(s)
+        col = self.columns[a]
+
+        q_predict = self.values[row, col]
+
+        if s_ != TERMINAL_STATE:
+            q_target = r + self.gamma * self.values[next_row].max()
+        else:
+            q_target = r  # next state is terminal
+
+        # update
+        self.values[row, col] += self.lr * (q_target - q_predict)
+        self.dirty.add(row)
+
+    def check_state_exist(self, state):
+        row = self.index.get(state)
+        if row is None:
+            # append new state to q table, doubling the matrix when it is full
+            row = len(self.states)
+            if row == self.values.shape[0]:
+                grown = np.zeros((row * GROWTH_FACTOR, self.values.shape[1]), dtype=np.float64)
+                grown[:row] = self.values
+                self.values = grown
+            self.index[state] = row
+            self.states.append(state)
+        return row
+
+    def take_dirty(self):
+        #sorted rows learned since the last call, the set starts over afterwards
+        rows = np.array(sorted(self.dirty), dtype=np.intp)
+        self.dirty = set()
+        return rows
+
+    def set_rows(self, states, values):
+        #writes whole rows, adding the states that are missing (used to replay checkpoints)
+        for state, row_values in zip(states, values):
+            self.values[self.check_state_exist(state)] = row_values
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.values[:len(self.states)], index=list(self.states), columns=self.actions)
+
+    def from_dataframe(self, table):
+        # Loads a table saved by the old pandas QLearningTable (or to_dataframe)
+        self.states = list(table.index)
+        self.index = {state: row for row, state in enumerate(self.states)}
+        self.values = np.zeros((max(len(self.states), INITIAL_CAPACITY), len(self.actions)), dtype=np.float64)
+        self.values[:len(self.states)] = table.reindex(columns=self.actions, fill_value=0).to_numpy(dtype=np.float64)
+        self.dirty = set(range(len(self.states)))
+
+    def load(self, path, convert=None):
+        #convert gets the loaded DataFrame first, e.g. state_key.migrate_table for old tables
+        table = pd.read_pickle(path, compression='gzip')
+        self.from_dataframe(convert(table) if convert else table)
+
+    def save(self, path):
+        self.to_dataframe().to_pickle(path, compression='gzip')
+
+
+class ActionMaskCache:
+    #Remembers the boolean action mask for every key it has seen. build(*key) returns the
+    #excluded action ids, so it only runs the first time a key shows up
+    def __init__(self, actions, build):
+        self.columns = {action: i for i, action in enumerate(actions)}
+        self.build = build
+        self.masks = {}
+
+    def get(self, key):
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = np.ones(len(self.columns), dtype=bool)
+            for excluded_action in self.build(*key):
+                mask[self.columns[excluded_action]] = False
+            mask.setflags(write=False)
+            self.masks[key] = mask
+        return mask
@@ -0,0 +1,95 @@
+import argparse
+import os
+
+import numpy as np
+
+from checkpoint import QTableCheckpoint
+from qtable import QLearningTable
+from state_key import DEFAULT_ENCODER, StateEncoder, migrate_table
+
+
+#Memory mapped Q-table files
+#<base>.values.npy holds the raw float64 matrix (one row per state, one column per
+#action) and <base>.keys.npy the packed state keys in row order, key width bytes
+#per row. Both are plain .npy files so np.load(mmap_mode=...) maps them straight
+#into memory: opening a table only reads the key index, the values are paged in
+#by the OS as states are looked up, and every agent mapping the same file shares
+#those pages. Tables are opened copy-on-write, so an agent that learns or meets a
+#new state gets private pages (or a private copy once the matrix has to grow)
+#and never writes back to the file.
+
+VALUES_SUFFIX = '.values.npy'
+KEYS_SUFFIX = '.keys.npy'
+
+
+def map_paths(base):
+    return base + VALUES_SUFFIX, base + KEYS_SUFFIX
+
+
+def map_exists(base):
+    return all(os.path.isfile(path) for path in map_paths(base))
+
+
+def _save_atomic(path, array):
+    temp = path + '.tmp'
+    with open(temp, 'wb') as out:
+        np.save(out, array)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp, path)
+
+
+def write_map(base, qtable, encoder=DEFAULT_ENCODER):
+    count = len(qtable)
+    keys = np.frombuffer(encoder.keysToBytes(qtable.states), dtype=np.uint8).reshape(count, encoder.width)
+    values_path, keys_path = map_paths(base)
+    # keys go last, open_map checks the row counts match in case a reader lands in between
+    _save_atomic(values_path, np.ascontiguousarray(qtable.values[:count], dtype='<f8'))
+    _save_atomic(keys_path, keys)
+
+
+def open_map(base, actions, encoder=DEFAULT_ENCODER, learning_rate=0.01, reward_decay=0.9, e_greedy=0.9):
+    #QLearningTable whose values are a copy-on-write memmap of <base>.values.npy
+    values_path, keys_path = map_paths(base)
+    keys = np.load(keys_path)
+    values = np.load(values_path, mmap_mode='c')
+    if keys.shape != (values.shape[0], encoder.width) or values.shape[1] != len(actions):
+        raise ValueError('%s: %d keys of %d bytes for a %dx%d table, expected %d bytes and %d actions'
+                         % (base, keys.shape[0], keys.shape[1], values.shape[0], values.shape[1],
+                            encoder.width, len(actions)))
+
+    qtable = QLearningTable(actions, learning_rate, reward_decay, e_greedy, capacity=1)
+    qtable.states = encoder.keysFromBytes(keys.tobytes())
+    qtable.index = {state: row for row, state in enumerate(qtable.states)}
+    qtable.values = values
+    return qtable
+
+
+def map_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', metavar='PATH', type=str,
+                        help="gzip pickled Q-table (e.g. Scout_data.gz) or checkpoint name (e.g. Scout_data)")
+    parser.add_argument('base', metavar='NAME', type=str, nargs='?',
+                        help="output name without extension, defaults to the source name")
+    parser.add_argument('--actions', type=int, default=24, help="number of actions in the table")
+    parser.add_argument('--cells', type=int, default=16, help="enemy grid cells in the state key")
+    return parser.parse_args()
+
+
+def main():
+    args = map_parser()
+    encoder = StateEncoder(args.cells)
+    qtable = QLearningTable(actions=list(range(args.actions)))
+
+    if args.source.endswith('.gz'):
+        qtable.load(args.source, lambda table: migrate_table(table, encoder))
+        base = args.base or args.source[:-len('.gz')]
+    else:
+        QTableCheckpoint(args.source, encoder).load(qtable)
+        base = args.base or args.source
+
+    write_map(base, qtable, encoder)
+    print('%s: %d states x %d actions' % (base, len(qtable), args.actions))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#Reward collected by one agent over an episode, replaces the old REWARDGL module global
+#
+#    self.rewards = RewardAccumulator()   # not self.reward, base_agent keeps the game score there
+#    self.rewards.add(barracks=2)         # any number of named terms at once
+#    total = self.rewards.episode_end()   # the episode's total, then starts over
+#
+#Every agent owns its accumulator, so any number of agents can run in one process
+#(multi_env.py, threads) without adding to each other's reward. Next to the running
+#total it keeps the sum of every term, and episode_end() files the finished episode in
+#self.episodes as (total, {term: sum}) so a run can see where the reward came from.
+#Only the last KEEP_EPISODES are kept, agents train for thousands of episodes.
+
+KEEP_EPISODES = 100
+
+
+class RewardAccumulator:
+    def __init__(self, keep=KEEP_EPISODES):
+        self.keep = keep  # most recent episodes to remember, None for all
+        self.total = 0
+        self.terms = {}
+        self.episodes = []
+
+    def add(self, **terms):
+        #adds every term to its own sum and their sum to the total in one addition,
+        #the same floating point result the old REWARDGL += a + b + c gave
+        self.total += sum(terms.values())
+        for term, value in terms.items():
+            self.terms[term] = self.terms.get(term, 0) + value
+
+    def episode_end(self):
+        #total of the finished episode, the accumulator starts over for the next one
+        total = self.total
+        self.episodes.append((total, dict(self.terms)))
+        if self.keep is not None and len(self.episodes) > self.keep:
+            del self.episodes[:-self.keep]
+        self.total = 0
+        self.terms = {}
+        return total
+
+    def term_totals(self):
+        #{term: sum over every remembered episode}
+        totals = {}
+        for total, terms in self.episodes:
+            for term, value in terms.items():
+                totals[term] = totals.get(term, 0) + value
+        return totals
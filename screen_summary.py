@@ -0,0 +1,41 @@
+import numpy as np
+
+
+#One pass summary of the unit_type screen layer for a single frame
+#Every per-type pixel count comes from one np.bincount, pixel coordinates and
+#centroids are only worked out for the unit types a helper actually asks for
+
+_NO_PIXELS = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+
+
+class ScreenSummary:
+    def __init__(self, unit_type, counts=None):
+        #counts can be handed in when they were already worked out, e.g. for a stack of screens
+        self.unit_type = unit_type
+        self.counts = np.bincount(unit_type.ravel()) if counts is None else counts
+        self.pixelCache = {}
+        self.centroidCache = {}
+
+    def count(self, unit):
+        #number of screen pixels covered by this unit type
+        if unit < len(self.counts):
+            return int(self.counts[unit])
+        return 0
+
+    def has(self, unit):
+        return self.count(unit) > 0
+
+    def pixels(self, unit):
+        #(y, x) arrays like (unit_type == unit).nonzero(), computed once per frame
+        pixels = self.pixelCache.get(unit)
+        if pixels is None:
+            pixels = (self.unit_type == unit).nonzero() if self.has(unit) else _NO_PIXELS
+            self.pixelCache[unit] = pixels
+        return pixels
+
+    def centroid(self, unit):
+        #(x, y) mean of the unit's pixels or None when it is not on screen
+        if unit not in self.centroidCache:
+            unit_y, unit_x = self.pixels(unit)
+            self.centroidCache[unit] = (unit_x.mean(), unit_y.mean()) if len(unit_y) else None
+        return self.centroidCache[unit]
@@ -0,0 +1,141 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from qtable import QLearningTable, TERMINAL_STATE
+
+
+#Q-table in shared memory for several training processes
+#
+#One shared block holds a fixed capacity open addressing hash table: a uint64 key
+#per slot (EMPTY when free) and a float64 row of action values per slot. Integer
+#state keys (state_key.StateEncoder, up to 64 bits) hash to a slot and probe
+#linearly. Slots never move and are never freed, so once a process has found a
+#state it remembers the slot in a local dict and never probes for it again.
+#
+#Writes take one of `stripes` locks, picked by slot number, so two workers only wait
+#for each other when they touch rows in the same stripe. Inserting a key locks the
+#stripe of the free slot it found and checks the slot again, which keeps two workers
+#from adding the same state twice. Reads take no lock: choose_action may see a row
+#half way through another worker's update, which Q-learning does not mind.
+#
+#    table = SharedQTable.create(actions, capacity=1 << 18, key_bits=encoder.bits)   # in the launcher
+#    worker = table.handle()                                   # picklable, pass to the processes
+#    qlearn = SharedQTable.attach(worker, actions)             # in each worker
+
+EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+STRIPES = 64
+DEFAULT_CAPACITY = 1 << 18
+
+_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+_MASK64 = (1 << 64) - 1
+
+
+class SharedQTable(QLearningTable):
+    def __init__(self, actions, memory, capacity, locks, count, owner=False, learning_rate=0.01,
+                 reward_decay=0.9, e_greedy=0.9):
+        QLearningTable.__init__(self, actions, learning_rate, reward_decay, e_greedy, capacity=1)
+        if capacity & (capacity - 1):
+            raise ValueError('capacity %d is not a power of two' % capacity)
+        self.memory = memory
+        self.owner = owner
+        self.capacity = capacity
+        self.shift = 64 - capacity.bit_length() + 1
+        self.locks = locks
+        self.count = count  # shared number of states
+        self.keys = np.ndarray((capacity,), dtype=np.uint64, buffer=memory.buf)
+        self.values = np.ndarray((capacity, len(actions)), dtype=np.float64, buffer=memory.buf,
+                                 offset=capacity * 8)
+        self.slots = {}  # state -> slot, this process' cache of slots it has found
+
+    @staticmethod
+    def nbytes(capacity, action_count):
+        return capacity * 8 * (1 + action_count)
+
+    @classmethod
+    def create(cls, actions, capacity=DEFAULT_CAPACITY, stripes=STRIPES, key_bits=64, **kwargs):
+        #key_bits is the widest state key the table will see, StateEncoder.bits
+        if key_bits > 64:
+            raise ValueError('%d bit state keys do not fit the uint64 slots of a shared Q-table, '
+                             'use fewer enemy grid cells' % key_bits)
+        memory = shared_memory.SharedMemory(create=True, size=cls.nbytes(capacity, len(actions)))
+        table = cls(actions, memory, capacity, [multiprocessing.Lock() for i in range(stripes)],
+                    multiprocessing.Value('q', 0), owner=True, **kwargs)
+        table.keys[:] = EMPTY
+        table.values[:] = 0
+        return table
+
+    def handle(self):
+        #what another process needs to attach, pass it as a multiprocessing.Process argument
+        return self.memory.name, self.capacity, self.locks, self.count
+
+    @classmethod
+    def attach(cls, handle, actions, **kwargs):
+        name, capacity, locks, count = handle
+        return cls(actions, shared_memory.SharedMemory(name=name), capacity, locks, count, **kwargs)
+
+    def close(self):
+        self.keys = self.values = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __len__(self):
+        return self.count.value
+
+    def check_state_exist(self, state):
+        slot = self.slots.get(state)
+        if slot is not None:
+            return slot
+        key = np.uint64(state)
+        if key == EMPTY:
+            raise ValueError('state %r collides with the empty slot marker' % state)
+        keys = self.keys
+        mask = self.capacity - 1
+        slot = ((state * _MULTIPLIER) & _MASK64) >> self.shift
+        for probe in range(self.capacity):
+            found = keys[slot]
+            if found == EMPTY:
+                # someone may be filling this slot right now, look again under its lock
+                with self.locks[slot % len(self.locks)]:
+                    found = keys[slot]
+                    if found == EMPTY:
+                        keys[slot] = key
+                        with self.count.get_lock():
+                            self.count.value += 1
+                        found = key
+            if found == key:
+                self.slots[state] = slot
+                return slot
+            slot = (slot + 1) & mask
+        raise MemoryError('shared Q-table is full, all %d slots are taken' % self.capacity)
+
+    def learn(self, s, a, r, s_):
+        if s == s_:
+            return
+        row = self.check_state_exist(s)
+        col = self.columns[a]
+        if s_ != TERMINAL_STATE:
+            q_target = r + self.gamma * self.values[self.check_state_exist(s_)].max()
+        else:
+            q_target = r  # next state is terminal
+
+        # only the read-modify-write of the one value needs its stripe
+        with self.locks[row % len(self.locks)]:
+            self.values[row, col] += self.lr * (q_target - self.values[row, col])
+
+    def filled(self):
+        #(states, value rows) of every used slot
+        used = np.flatnonzero(self.keys != EMPTY)
+        return self.keys[used].tolist(), self.values[used]
+
+    def to_qtable(self):
+        #plain QLearningTable copy, for saving with save/checkpoint/write_map
+        states, values = self.filled()
+        qtable = QLearningTable(self.actions, self.lr, self.gamma, self.epsilon, capacity=max(len(states), 1))
+        qtable.set_rows(states, values)
+        return qtable
+
+    def to_dataframe(self):
+        return self.to_qtable().to_dataframe()
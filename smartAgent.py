@@ -3,12 +3,15 @@ import math
 import os.path
 
 import numpy as np
-import pandas as pd
 
 from pysc2.agents import base_agent
 from pysc2.lib import actions
 from pysc2.lib import features
 
+from qtable import ActionMaskCache, QLearningTable, TERMINAL_STATE
+from reward import RewardAccumulator
+from state_key import DEFAULT_ENCODER, migrate_table
+
 _NO_OP = actions.FUNCTIONS.no_op.id
 _SELECT_POINT = actions.FUNCTIONS.select_point.id
 _BUILD_SUPPLY_DEPOT = actions.FUNCTIONS.Build_SupplyDepot_screen.id
@@ -80,69 +83,41 @@ for mm_x in range(0, 64):
 SEE_ENEMY_REWARD = 0.001
 NOT_DIE_REWARD = 0.5
 
-REWARDGL = 0
-
 DATA_FILE = 'Scout_data'
 
 
-# Stolen from https://github.com/MorvanZhou/Reinforcement-learning-with-tensorflow
-class QLearningTable:
-    def __init__(self, actions, learning_rate=0.01, reward_decay=0.9, e_greedy=0.9):
-        self.actions = actions
-        self.lr = learning_rate
-        self.gamma = reward_decay
-        self.epsilon = e_greedy
-        self.q_table = pd.DataFrame(columns=self.actions, dtype=np.float64)
-        self.disallowed_actions = {}
-
-    def choose_action(self, observation, excluded_actions=[]):
-        self.check_state_exist(observation)
-
-        self.disallowed_actions[observation] = excluded_actions
-
-        state_action = self.q_table.ix[observation, :]
-
-        for excluded_action in excluded_actions:
-            del state_action[excluded_action]
+def excludedActions(supply_depot_count, no_workers, barracks_count, engbay_count,
+                    turrets_count, refinery_count, no_supply, no_army):
+    excluded_actions = []
+    if supply_depot_count == 3 or no_workers:
+        excluded_actions.append(1)
+        # supplydepots = True
 
-        if np.random.uniform() < self.epsilon:
-            # some actions have the same value
-            state_action = state_action.reindex(np.random.permutation(state_action.index))
+    if supply_depot_count == 0 or barracks_count == 4 or no_workers:
+        excluded_actions.append(2)
+        # barracks = True
 
-            action = state_action.idxmax()
-        else:
-            # choose random action
-            action = np.random.choice(self.actions)
-
-        return action
+    if barracks_count == 0 or engbay_count == 1:
+        excluded_actions.append(3)
+        # engbay = True
 
-    def learn(self, s, a, r, s_):
-        if s == s_:
-            return
-        self.check_state_exist(s_)
-        self.check_state_exist(s)
+    if engbay_count == 0 or turrets_count == 2:
+        excluded_actions.append(4)
 
-        q_predict = self.q_table.ix[s, a]
+    if turrets_count == 0 or refinery_count == 2:
+        excluded_actions.append(5)
 
-        s_rewards = self.q_table.ix[s_, :]
+    if no_supply or barracks_count == 0 or refinery_count == 0:
+        excluded_actions.append(7)
 
-        if s_ in self.disallowed_actions:
-            for excluded_action in self.disallowed_actions[s_]:
-                del s_rewards[excluded_action]
+    if no_army:
+        for i in range(0, 16):
+            excluded_actions.append(i + 8)
 
-        if s_ != 'terminal':
-            q_target = r + self.gamma * self.q_table.ix[s_, :].max()
-        else:
-            q_target = r  # next state is terminal
+    return excluded_actions
 
-        # update
-        self.q_table.ix[s, a] += self.lr * (q_target - q_predict)
 
-    def check_state_exist(self, state):
-        if state not in self.q_table.index:
-            # append new state to q table
-            self.q_table = self.q_table.append(
-                pd.Series([0] * (len(self.actions)), index=self.q_table.columns, name=state))
+ACTION_MASKS = ActionMaskCache(list(range(len(smart_actions))), excludedActions)
 
 
 class SmartAgent(base_agent.BaseAgent):
@@ -161,8 +136,10 @@ class SmartAgent(base_agent.BaseAgent):
         self.timeTillBase = 0
         self.baseFound = False
 
+        self.rewards = RewardAccumulator()  # this agent's own, self.reward is base_agent's game score
+
         if os.path.isfile(DATA_FILE + '.gz'):
-            self.qlearn.q_table = pd.read_pickle(DATA_FILE + '.gz', compression='gzip')
+            self.qlearn.load(DATA_FILE + '.gz', migrate_table)
 
     def transformDistance(self, x, x_distance, y, y_distance):
         if not self.base_top_left:
@@ -255,18 +232,18 @@ class SmartAgent(base_agent.BaseAgent):
 
 
     def obsLast(self):
-        global REWARDGL
+        reward = self.rewards.episode_end()
        # print("REWARD VALUE")
-        #print(REWARDGL)
-        self.qlearn.learn(str(self.previous_state), self.previous_action, REWARDGL, 'terminal')
-        self.qlearn.q_table.to_pickle(DATA_FILE + '.gz', 'gzip')
+        #print(reward)
+        if self.previous_action is not None:
+            self.qlearn.learn(self.previous_state, self.previous_action, reward, TERMINAL_STATE)
+        self.qlearn.save(DATA_FILE + '.gz')
         self.previous_action = None
         self.previous_state = None
         self.stepNum = 0
         self.kill_check = 0
         self.structure_kill = 0
         self.geyser_farm = 0
-        REWARDGL = 0
         return
     def obsFirst(self,unit_type,obs):
         player_y, player_x = (obs.observation['minimap'][_PLAYER_RELATIVE] == _PLAYER_SELF).nonzero()
@@ -286,23 +263,20 @@ class SmartAgent(base_agent.BaseAgent):
 
     def firstStep(self,unit_type,obs,cc_count,supply_depot_count, worker_supply, barracks_count, engbay_count,
                                                turrets_count, refinery_count, supply_free, army_supply,supply_limit):
-        # current state is an array holding all the state values
-        current_state = self.currentState(cc_count, supply_depot_count, barracks_count, engbay_count, turrets_count,
-                                          refinery_count, supply_limit, army_supply)
-
         # marks all the current regions with a 1 where it sees enemies
         enemy_squares = self.markEnemies(obs)
 
-        for i in range(0, 16):
-            current_state[i + 8] = enemy_squares[i]  # write in enemy squares location into the state
+        # current state is a packed integer key holding all the state values
+        current_state = self.currentState(cc_count, supply_depot_count, barracks_count, engbay_count, turrets_count,
+                                          refinery_count, supply_limit, army_supply, enemy_squares)
 
             # Dont learn from the first step#
         if self.previous_action is not None:
             self.learn(unit_type, obs,current_state)
 
-        excluded_actions = self.excludeActions(supply_depot_count, worker_supply, barracks_count, engbay_count,
-                                               turrets_count, refinery_count, supply_free, army_supply)
-        rl_action = self.qlearn.choose_action(str(current_state), excluded_actions)
+        action_mask = self.excludeActions(supply_depot_count, worker_supply, barracks_count, engbay_count,
+                                          turrets_count, refinery_count, supply_free, army_supply)
+        rl_action = self.qlearn.choose_action(current_state, action_mask)
         self.previous_state = current_state
         self.previous_action = rl_action
         smart_action, x, y = self.splitAction(self.previous_action)
@@ -380,17 +354,10 @@ class SmartAgent(base_agent.BaseAgent):
 
 
     def currentState(self,cc_count,supply_depot_count,barracks_count,engbay_count,
-                     turrets_count,refinery_count,supply_limit,army_supply):
-        current_state = np.zeros(24)  # Generate array of 22
-        current_state[0] = cc_count
-        current_state[1] = supply_depot_count
-        current_state[2] = barracks_count
-        current_state[3] = engbay_count
-        current_state[4] = turrets_count
-        current_state[5] = refinery_count
-        current_state[6] = supply_limit
-        current_state[7] = army_supply
-        return current_state
+                     turrets_count,refinery_count,supply_limit,army_supply,enemy_squares):
+        # state_key.decode turns the key back into the old 24 value array
+        return DEFAULT_ENCODER.encode((cc_count, supply_depot_count, barracks_count, engbay_count,
+                                       turrets_count, refinery_count, supply_limit, army_supply), enemy_squares)
     def markEnemies(self,obs):
         enemy_squares = np.zeros(16)
         enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
@@ -402,7 +369,6 @@ class SmartAgent(base_agent.BaseAgent):
                 enemy_squares = enemy_squares[::-1]
         return enemy_squares
     def learn(self,unit_type,obs,current_state):
-        global REWARDGL
         unit_y, unit_x = (unit_type == _TERRAN_COMMANDCENTER).nonzero()
         enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
         if enemy_y.any() and unit_y.mean() > 0 and unit_y.mean() < 1000:
@@ -424,42 +390,18 @@ class SmartAgent(base_agent.BaseAgent):
             structure_kill_bonus = 15
             self.structure_kill = killed_structures
 
-        added_value = len(enemy_x) * SEE_ENEMY_REWARD * distance_multiplier + structure_kill_bonus + killbonus
         ## army_bonus = army_supply*0.01
-        REWARDGL += added_value
-        self.qlearn.learn(str(self.previous_state), self.previous_action, 0, str(current_state))
+        self.rewards.add(see_enemy=len(enemy_x) * SEE_ENEMY_REWARD * distance_multiplier,
+                         kill_structure=structure_kill_bonus, kill_unit=killbonus)
+        self.qlearn.learn(self.previous_state, self.previous_action, 0, current_state)
         return
 
         # Returns supply depot count
     def excludeActions(self,supply_depot_count,worker_supply,barracks_count,engbay_count,
                        turrets_count,refinery_count,supply_free,army_supply):
-        excluded_actions = []
-        if supply_depot_count == 3 or worker_supply == 0:
-            excluded_actions.append(1)
-            # supplydepots = True
-
-        if supply_depot_count == 0 or barracks_count == 4 or worker_supply == 0:
-            excluded_actions.append(2)
-            # barracks = True
-
-        if barracks_count == 0 or engbay_count == 1:
-            excluded_actions.append(3)
-            # engbay = True
-
-        if engbay_count == 0 or turrets_count == 2:
-            excluded_actions.append(4)
-
-        if turrets_count == 0 or refinery_count == 2:
-            excluded_actions.append(5)
-
-        if supply_free == 0 or barracks_count == 0 or refinery_count == 0:
-            excluded_actions.append(7)
-
-        if army_supply == 0:
-            for i in range(0, 16):
-                excluded_actions.append(i + 8)
-
-        return excluded_actions
+        # masks are cached per count tuple so excludedActions only runs for new ones
+        return ACTION_MASKS.get((supply_depot_count, bool(worker_supply == 0), barracks_count, engbay_count,
+                                 turrets_count, refinery_count, bool(supply_free == 0), bool(army_supply == 0)))
 
 
     def selectSCV(self,unit_type):
@@ -483,7 +425,6 @@ class SmartAgent(base_agent.BaseAgent):
     def buildSupplyDepot(self,obs,supply_depot_count):
         if supply_depot_count < 3 and _BUILD_SUPPLY_DEPOT in obs.observation['available_actions']:
             if self.CommandCenterY.any():
-                global REWARDGL
                 if supply_depot_count == 0:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), -35,
                                                     round(self.CommandCenterY.mean()), 0)
@@ -493,30 +434,29 @@ class SmartAgent(base_agent.BaseAgent):
                 elif supply_depot_count == 2:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 13,
                                                     round(self.CommandCenterY.mean()), 0)
-                    REWARDGL += 5
+                    self.rewards.add(supply_depot=5)
 
                 return actions.FunctionCall(_BUILD_SUPPLY_DEPOT, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
     def buildBarracks(self,obs,barracks_count):
         if barracks_count < 4 and _BUILD_BARRACKS in obs.observation['available_actions']:
             if self.CommandCenterY.any():
-                global REWARDGL
                 if barracks_count == 0:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 32,
                                                     round(self.CommandCenterY.mean()), -20)
-                    REWARDGL += 2
+                    self.rewards.add(barracks=2)
                 elif barracks_count == 1:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 22,
                                                     round(self.CommandCenterY.mean()), -20)
-                    REWARDGL += 2
+                    self.rewards.add(barracks=2)
                 elif barracks_count == 2:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 28,
                                                     round(self.CommandCenterY.mean()), -10)
-                    REWARDGL += 2
+                    self.rewards.add(barracks=2)
                 elif barracks_count == 3:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 10,
                                                     round(self.CommandCenterY.mean()), 17)
-                    REWARDGL += 4
+                    self.rewards.add(barracks=4)
 
                 return actions.FunctionCall(_BUILD_BARRACKS, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
@@ -524,17 +464,15 @@ class SmartAgent(base_agent.BaseAgent):
         if engbay_count < 1 and _BUILD_ENGBAY in obs.observation['available_actions']:
             if self.CommandCenterY.any():
                 if engbay_count < 1:
-                    global REWARDGL
                     target = self.transformDistance(round(self.CommandCenterX.mean()), -8,
                                                     round(self.CommandCenterY.mean()), 28)
-                    REWARDGL += 5
+                    self.rewards.add(engbay=5)
                     return actions.FunctionCall(_BUILD_ENGBAY, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
     def buildRefinery(self,obs,refinery_count):
         if refinery_count < 2 and _BUILD_REFINERY in obs.observation['available_actions']:
             if self.CommandCenterY.any():
                 unit_type = obs.observation['screen'][_UNIT_TYPE]
-                global REWARDGL
                 if refinery_count == 0:
                     vespene_y, vespene_x = (unit_type == _NEUTRAL_VESPENEGEYSER).nonzero()
                     first_y = vespene_y[0:97]
@@ -543,26 +481,24 @@ class SmartAgent(base_agent.BaseAgent):
                 elif refinery_count == 1:
                     vespene_y, vespene_x = (unit_type == _NEUTRAL_VESPENEGEYSER).nonzero()
                     target = self.transformDistance(round(vespene_x.mean()), 0, round(vespene_y.mean()), 0)
-                    REWARDGL += 5
+                    self.rewards.add(refinery=5)
                 return actions.FunctionCall(_BUILD_REFINERY, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
     def buildTurret(self,obs,turrets_count):
         if turrets_count < 2 and _BUILD_TURRET in obs.observation['available_actions']:
             if self.CommandCenterY.any():
-                global REWARDGL
                 if turrets_count == 0:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 29,
                                                     round(self.CommandCenterY.mean()), 24)
                 elif turrets_count == 1:
                     target = self.transformDistance(round(self.CommandCenterX.mean()), 24,
                                                     round(self.CommandCenterY.mean()), 29)
-                    REWARDGL += 5
+                    self.rewards.add(turret=5)
                 return actions.FunctionCall(_BUILD_TURRET, [_NOT_QUEUED, target])
         return actions.FunctionCall(_NO_OP, [])
     def trainReaper(self,obs):
         if _TRAIN_REAPER in obs.observation['available_actions']:
-            global REWARDGL
-            REWARDGL += 1
+            self.rewards.add(reaper=1)
             return actions.FunctionCall(_TRAIN_REAPER, [_QUEUED])
         return actions.FunctionCall(_NO_OP, [])
     def scout(self,obs,x,y):
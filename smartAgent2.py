@@ -3,12 +3,15 @@ import math
 import os.path
 
 import numpy as np
-import pandas as pd
 
 from pysc2.agents import base_agent
 from pysc2.lib import actions
 from pysc2.lib import features
 
+from qtable import QLearningTable, TERMINAL_STATE
+from reward import RewardAccumulator
+from state_key import DEFAULT_ENCODER, migrate_table
+
 _NO_OP = actions.FUNCTIONS.no_op.id
 _SELECT_POINT = actions.FUNCTIONS.select_point.id
 _BUILD_SUPPLY_DEPOT = actions.FUNCTIONS.Build_SupplyDepot_screen.id
@@ -85,71 +88,9 @@ SEE_ENEMY_REWARD = 0.001
 NOT_DIE_REWARD = 0.5
 
 
-REWARDGL = 0
-
 DATA_FILE = 'Scout_data'
 
 
-# Stolen from https://github.com/MorvanZhou/Reinforcement-learning-with-tensorflow
-class QLearningTable:
-    def __init__(self, actions, learning_rate=0.01, reward_decay=0.9, e_greedy=0.9):
-        self.actions = actions
-        self.lr = learning_rate
-        self.gamma = reward_decay
-        self.epsilon = e_greedy
-        self.q_table = pd.DataFrame(columns=self.actions, dtype=np.float64)
-        self.disallowed_actions = {}
-
-    def choose_action(self, observation, excluded_actions = []):
-        self.check_state_exist(observation)
-
-        self.disallowed_actions[observation] = excluded_actions
-
-        state_action = self.q_table.ix[observation, :]
-
-        for excluded_action in excluded_actions:
-            del state_action[excluded_action]
-
-        if np.random.uniform() < self.epsilon:
-            # some actions have the same value
-            state_action = state_action.reindex(np.random.permutation(state_action.index))
-
-            action = state_action.idxmax()
-        else:
-            # choose random action
-            action = np.random.choice(self.actions)
-
-        return action
-
-    def learn(self, s, a, r, s_):
-        if s == s_:
-            return
-        self.check_state_exist(s_)
-        self.check_state_exist(s)
-
-        q_predict = self.q_table.ix[s, a]
-
-        s_rewards = self.q_table.ix[s_, :]
-        
-        if s_ in self.disallowed_actions:
-            for excluded_action in self.disallowed_actions[s_]:
-                del s_rewards[excluded_action]
-        
-        if s_ != 'terminal':
-            q_target = r + self.gamma * self.q_table.ix[s_, :].max()
-        else:
-            q_target = r  # next state is terminal
-
-        # update
-        self.q_table.ix[s, a] += self.lr * (q_target - q_predict)
-
-    def check_state_exist(self, state):
-        if state not in self.q_table.index:
-            # append new state to q table
-            self.q_table = self.q_table.append(pd.Series([0] *(len(self.actions)), index=self.q_table.columns, name=state))
-
-
-
 class SmartAgent(base_agent.BaseAgent):
     ## Allows us to invert the screen and minimap and pretend all actions are from top left
     def __init__(self):
@@ -163,10 +104,12 @@ class SmartAgent(base_agent.BaseAgent):
         self.stepNum = 0
         self.CommandCenterX = None
         self.CommandCenterY = None
+
+        self.rewards = RewardAccumulator()  # this agent's own, self.reward is base_agent's game score
         
 
         if os.path.isfile(DATA_FILE + '.gz'):
-            self.qlearn.q_table = pd.read_pickle(DATA_FILE + '.gz', compression='gzip')
+            self.qlearn.load(DATA_FILE + '.gz', migrate_table)
 
     def transformDistance(self, x, x_distance, y, y_distance):
         if not self.base_top_left:
@@ -193,18 +136,18 @@ class SmartAgent(base_agent.BaseAgent):
         super(SmartAgent, self).step(obs)
 
         if obs.last():
-            global REWARDGL
+            reward = self.rewards.episode_end()
             print("REWARD VALUE")
-            print(REWARDGL)
-            self.qlearn.learn(str(self.previous_state), self.previous_action, REWARDGL, 'terminal')
-            self.qlearn.q_table.to_pickle(DATA_FILE + '.gz', 'gzip')
+            print(reward)
+            if self.previous_action is not None:
+                self.qlearn.learn(self.previous_state, self.previous_action, reward, TERMINAL_STATE)
+            self.qlearn.save(DATA_FILE + '.gz')
             self.previous_action = None
             self.previous_state = None
             self.stepNum = 0
             self.kill_check = 0
             self.structure_kill = 0
             self.geyser_farm = 0
-            REWARDGL = 0
             return actions.FunctionCall(_NO_OP, [])
 
         unit_type = obs.observation['screen'][_UNIT_TYPE]
@@ -258,16 +201,6 @@ class SmartAgent(base_agent.BaseAgent):
         if self.stepNum == 0: #if this is the first step
             self.stepNum += 1
 
-            current_state = np.zeros(24) # Generate array of 22
-            current_state[0] = cc_count
-            current_state[1] = supply_depot_count
-            current_state[2] = barracks_count
-            current_state[3] = engbay_count
-            current_state[4] = turrets_count
-            current_state[5] = refinery_count
-            current_state[6] = supply_limit
-            current_state[7] = army_supply
-
             enemy_squares = np.zeros(16)
             enemy_y, enemy_x = (obs.observation['minimap'][_PLAYER_RELATIVE_MINI] == _PLAYER_ENEMY).nonzero()
             for i in range(0,len(enemy_y)):
@@ -279,8 +212,10 @@ class SmartAgent(base_agent.BaseAgent):
             if not self.base_top_left: #Invert the quadrants
                 enemy_squares =enemy_squares[::-1]
 
-            for i in range(0,16):
-                current_state[i+8] = enemy_squares[i] #write in enemy squares location into the state
+            #pack the counts and enemy squares into the state key
+            current_state = DEFAULT_ENCODER.encode((cc_count, supply_depot_count, barracks_count, engbay_count,
+                                                    turrets_count, refinery_count, supply_limit, army_supply),
+                                                   enemy_squares)
 
                 #Dont learn from the first step#
             if self.previous_action is not None:
@@ -305,11 +240,11 @@ class SmartAgent(base_agent.BaseAgent):
                     structure_kill_bonus = 15
                     self.structure_kill = killed_structures
 
-                added_value = len(enemy_x)* SEE_ENEMY_REWARD*distance_multiplier + structure_kill_bonus + killbonus
                 ## army_bonus = army_supply*0.01
-                REWARDGL += added_value
+                self.rewards.add(see_enemy=len(enemy_x) * SEE_ENEMY_REWARD * distance_multiplier,
+                                 kill_structure=structure_kill_bonus, kill_unit=killbonus)
 
-                self.qlearn.learn(str(self.previous_state),self.previous_action,0,str(current_state))
+                self.qlearn.learn(self.previous_state,self.previous_action,0,current_state)
 
 
                     #Choose an action#
@@ -347,7 +282,7 @@ class SmartAgent(base_agent.BaseAgent):
                 for i in range (0,16):
                     excluded_actions.append(i+8)
 
-            rl_action = self.qlearn.choose_action(str(current_state))
+            rl_action = self.qlearn.choose_action(current_state)
             self.previous_state = current_state
             self.previous_action = rl_action
 
@@ -391,7 +326,7 @@ class SmartAgent(base_agent.BaseAgent):
                             target = self.transformDistance(round(self.CommandCenterX.mean()), -5, round(self.CommandCenterY.mean()), -32)
                         elif supply_depot_count == 2:
                             target = self.transformDistance(round(self.CommandCenterX.mean()), 13, round(self.CommandCenterY.mean()), 0)
-                            REWARDGL += 5
+                            self.rewards.add(supply_depot=5)
 
                         return actions.FunctionCall(_BUILD_SUPPLY_DEPOT, [_NOT_QUEUED, target])
 
@@ -400,16 +335,16 @@ class SmartAgent(base_agent.BaseAgent):
                     if self.CommandCenterY.any():
                         if barracks_count == 0:
                             target = self.transformDistance(round(self.CommandCenterX.mean()), 32, round(self.CommandCenterY.mean()),-20)
-                            REWARDGL += 2
+                            self.rewards.add(barracks=2)
                         elif barracks_count == 1:
                             target = self.transformDistance(round(self.CommandCenterX.mean()), 22, round(self.CommandCenterY.mean()),-20)
-                            REWARDGL += 2
+                            self.rewards.add(barracks=2)
                         elif barracks_count == 2:
                             target = self.transformDistance(round(self.CommandCenterX.mean()),28, round(self.CommandCenterY.mean()), -10)
-                            REWARDGL += 2
+                            self.rewards.add(barracks=2)
                         elif barracks_count == 3:
                             target = self.transformDistance(round(self.CommandCenterX.mean()),10, round(self.CommandCenterY.mean()), 17)
-                            REWARDGL += 4
+                            self.rewards.add(barracks=4)
 
                         return actions.FunctionCall(_BUILD_BARRACKS, [_NOT_QUEUED, target])
 
@@ -418,7 +353,7 @@ class SmartAgent(base_agent.BaseAgent):
                     if self.CommandCenterY.any():
                         if engbay_count < 1:
                             target = self.transformDistance(round(self.CommandCenterX.mean()), -8, round(self.CommandCenterY.mean()), 28)
-                            REWARDGL += 5
+                            self.rewards.add(engbay=5)
                             return actions.FunctionCall(_BUILD_ENGBAY, [_NOT_QUEUED, target])
 
             elif smart_action == ACTION_BUILD_REFINERY:
@@ -432,7 +367,7 @@ class SmartAgent(base_agent.BaseAgent):
                         elif refinery_count == 1:
                             vespene_y, vespene_x = (unit_type == _NEUTRAL_VESPENEGEYSER).nonzero()
                             target = self.transformDistance(round(vespene_x.mean()),0 ,round(vespene_y.mean()), 0  )
-                            REWARDGL += 5
+                            self.rewards.add(refinery=5)
                         return actions.FunctionCall(_BUILD_REFINERY,[_NOT_QUEUED,target])
                             
 
@@ -443,17 +378,17 @@ class SmartAgent(base_agent.BaseAgent):
                             target = self.transformDistance(round(self.CommandCenterX.mean()), 29, round(self.CommandCenterY.mean()),24)
                         elif turrets_count == 1:
                             target = self.transformDistance(round(self.CommandCenterX.mean()), 24, round(self.CommandCenterY.mean()),29)
-                            REWARDGL += 5
+                            self.rewards.add(turret=5)
                         return actions.FunctionCall(_BUILD_TURRET,[_NOT_QUEUED,target])
 
             #elif smart_action == ACTION_BUILD_TECHLAB:
              #   if _BUILD_TECHLAB in obs.observation['available_actions']:
-              #      REWARDGL +=5
+              #      self.rewards.add(techlab=5)
                #     return actions.FunctionCall(_BUILD_TECHLAB, [_QUEUED])
 
             elif smart_action == ACTION_BUILD_REAPER:
                 if _TRAIN_REAPER in obs.observation['available_actions']:
-                    REWARDGL += 1
+                    self.rewards.add(reaper=1)
                     return actions.FunctionCall(_TRAIN_REAPER, [_QUEUED])
 
             elif smart_action == ACTION_SCOUT:
@@ -0,0 +1,116 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from qtable import TERMINAL_STATE
+
+
+#Packs the agent state into one small integer instead of str(numpy array)
+#Layout from the high bits down: cc, depots, barracks, engbays, turrets, refineries,
+#supply limit, army supply and then one bit per enemy quadrant in the lowest bits.
+#Counts that do not fit in their field are saturated, supply never goes over 200.
+
+STATE_FIELDS = [
+    ('cc_count', 5),
+    ('supply_depot_count', 5),
+    ('barracks_count', 5),
+    ('engbay_count', 5),
+    ('turrets_count', 5),
+    ('refinery_count', 5),
+    ('supply_limit', 8),
+    ('army_supply', 8),
+]
+
+
+class StateEncoder:
+    def __init__(self, cells=16):
+        self.cells = cells
+        self.bits = sum(bits for name, bits in STATE_FIELDS) + cells
+        self.width = (self.bits + 7) // 8  # bytes needed to store a key
+
+        self.shifts = []
+        shift = self.bits
+        for name, bits in STATE_FIELDS:
+            shift -= bits
+            self.shifts.append((shift, (1 << bits) - 1))
+
+    def encode(self, counts, enemy_squares):
+        #counts are the 8 STATE_FIELDS values, enemy_squares one entry per quadrant
+        key = self.enemyMask(enemy_squares)
+        for value, (shift, limit) in zip(counts, self.shifts):
+            key |= min(int(value), limit) << shift
+        return key
+
+    def enemyMask(self, enemy_squares):
+        bits = np.packbits(np.asarray(enemy_squares) != 0, bitorder='little')
+        return int.from_bytes(bits.tobytes(), 'little')
+
+    def decode(self, key):
+        #Gives back the old float state layout: 8 counts followed by the quadrants
+        state = np.zeros(len(STATE_FIELDS) + self.cells)
+        for i, (shift, limit) in enumerate(self.shifts):
+            state[i] = (key >> shift) & limit
+        for i in range(self.cells):
+            state[len(STATE_FIELDS) + i] = (key >> i) & 1
+        return state
+
+    def keysToBytes(self, keys):
+        #fixed width little endian bytes, width bytes per key, for the binary table files
+        return b''.join(key.to_bytes(self.width, 'little') for key in keys)
+
+    def keysFromBytes(self, data):
+        if self.width == 8:
+            return np.frombuffer(data, dtype='<u8').tolist()
+        width = self.width
+        return [int.from_bytes(data[i:i + width], 'little') for i in range(0, len(data), width)]
+
+    def fromString(self, state):
+        #Parses a key written by the old agents with str(current_state)
+        values = np.array(state.strip('[]').split(), dtype=np.float64)
+        if len(values) != len(STATE_FIELDS) + self.cells:
+            raise ValueError('state %r does not have %d values' % (state, len(STATE_FIELDS) + self.cells))
+        return self.encode(values[:len(STATE_FIELDS)], values[len(STATE_FIELDS):])
+
+
+DEFAULT_ENCODER = StateEncoder()
+
+
+def migrate_table(table, encoder=DEFAULT_ENCODER):
+    #Converts a Q-table keyed by str(current_state) to integer keys, tables that are
+    #already converted are returned as they are
+    if not any(isinstance(state, str) for state in table.index):
+        return table
+
+    table = table.drop(TERMINAL_STATE, errors='ignore')
+    table.index = [encoder.fromString(state) if isinstance(state, str) else state for state in table.index]
+    return table[~table.index.duplicated(keep='first')]
+
+
+def decode_table(table, encoder=DEFAULT_ENCODER):
+    #Expands the integer keys back into one column per state value for analysis
+    names = [name for name, bits in STATE_FIELDS] + ['enemy_%d' % i for i in range(encoder.cells)]
+    states = pd.DataFrame([encoder.decode(key) for key in table.index], columns=names, index=table.index)
+    return states.join(table)
+
+
+def state_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['migrate', 'decode'],
+                        help="migrate rewrites a string keyed table, decode dumps it to csv")
+    parser.add_argument('table', metavar='PATH', type=str, help="gzip pickled Q-table, e.g. Scout_data.gz")
+    parser.add_argument('out', metavar='PATH', type=str, nargs='?', help="output file, defaults to the input")
+    return parser.parse_args()
+
+
+def main():
+    args = state_parser()
+    table = pd.read_pickle(args.table, compression='gzip')
+
+    if args.command == 'migrate':
+        migrate_table(table).to_pickle(args.out or args.table, compression='gzip')
+    else:
+        decode_table(migrate_table(table)).to_csv(args.out or args.table + '.csv')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import importlib
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import numpy as np
+
+from checkpoint import QTableCheckpoint
+from headless_env import HeadlessEnv, load_agent, run_loop
+from shared_qtable import DEFAULT_CAPACITY, STRIPES, SharedQTable
+from state_key import DEFAULT_ENCODER
+
+
+#Trains N copies of an agent at once, one process each, all learning into one Q-table
+#
+#python train_parallel.py --workers 4 --episodes 50
+#python train_parallel.py --workers 4 --episodes 20 --scaling     1, 2, 4 workers one after another
+#python train_parallel.py --workers 8 --episodes 200 --out Scout_data
+#
+#Every worker runs the agent against its own headless_env.HeadlessEnv, so no StarCraft
+#II is needed, with agent.qlearn swapped for a shared_qtable.SharedQTable. The agent
+#is built with data_file=None (ScoutFinal.SmartAgent), it neither loads nor saves a
+#table of its own. --init BASE starts from an existing checkpoint, --out BASE writes
+#the shared table as a checkpoint snapshot when training is done.
+
+
+def worker(index, agent_path, handle, episodes, max_steps, seed, results):
+    random.seed(seed + index)
+    np.random.seed(seed + index)
+    agent = load_agent(agent_path)(data_file=None)
+    own = agent.qlearn
+    agent.qlearn = SharedQTable.attach(handle, own.actions, learning_rate=own.lr, reward_decay=own.gamma,
+                                       e_greedy=own.epsilon)
+    try:
+        with HeadlessEnv(max_steps=max_steps, seed=seed + index) as env:
+            frames, seconds = run_loop([agent], env, max_episodes=episodes)
+        results.put((index, episodes, frames, seconds))
+    finally:
+        agent.qlearn.close()
+
+
+def train(agent_path, workers, episodes, max_steps, seed=0, capacity=DEFAULT_CAPACITY, stripes=STRIPES,
+          init=None, out=None):
+    #runs workers processes with episodes episodes each, returns (episodes, frames, wall seconds, states)
+    actions = load_agent(agent_path)(data_file=None).qlearn.actions
+    encoder = getattr(importlib.import_module(agent_path.rsplit('.', 1)[0]), 'STATE_ENCODER', DEFAULT_ENCODER)
+    table = SharedQTable.create(actions, capacity, stripes, key_bits=encoder.bits)
+    try:
+        if init:
+            start = load_agent(agent_path)(data_file=None).qlearn
+            QTableCheckpoint(init, encoder).load(start)
+            table.set_rows(start.states, start.values[:len(start)])
+
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(i, agent_path, table.handle(), episodes, max_steps,
+                                                                  seed, results))
+                     for i in range(workers)]
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+        done = []
+        while len(done) < workers:
+            try:
+                done.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError('%d of %d workers died without reporting' % (workers - len(done), workers))
+        wall = time.perf_counter() - start_time
+        for process in processes:
+            process.join()
+
+        if out:
+            QTableCheckpoint(out, encoder).compact(table.to_qtable())
+        return sum(result[1] for result in done), sum(result[2] for result in done), wall, len(table)
+    finally:
+        table.close()
+
+
+def train_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent', type=str, default='ScoutFinal.SmartAgent',
+                        help="module.Class, constructed with data_file=None")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--episodes', type=int, default=20, help="episodes per worker")
+    parser.add_argument('--max-steps', type=int, default=1000, help="agent steps per episode")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help="shared table slots, a power of two")
+    parser.add_argument('--stripes', type=int, default=STRIPES, help="write locks")
+    parser.add_argument('--scaling', action='store_true', help="run 1, 2, 4 ... workers up to --workers")
+    parser.add_argument('--init', metavar='BASE', type=str, default=None, help="checkpoint to start from")
+    parser.add_argument('--out', metavar='BASE', type=str, default=None, help="checkpoint to write at the end")
+    return parser.parse_args()
+
+
+def main():
+    args = train_parser()
+    counts = [args.workers]
+    if args.scaling:
+        counts = sorted(set([1 << i for i in range(args.workers.bit_length()) if 1 << i <= args.workers]
+                            + [args.workers]))
+    print('cores: %d' % os.cpu_count())
+    print('%7s %9s %9s %9s %12s %8s %8s' % ('workers', 'episodes', 'steps', 'wall s', 'episodes/h', 'speedup',
+                                          'states'))
+    base_rate = None
+    for workers in counts:
+        out = args.out if workers == counts[-1] else None
+        episodes, frames, wall, states = train(args.agent, workers, args.episodes, args.max_steps, args.seed,
+                                               args.capacity, args.stripes, args.init, out)
+        rate = episodes / wall * 3600
+        base_rate = base_rate or rate
+        print('%7d %9d %9d %9.1f %12.0f %7.2fx %8d' % (workers, episodes, frames, wall, rate, rate / base_rate,
+                                                       states))
+    if args.out:
+        print('shared table written to %s' % args.out)
+
+if __name__ == '__main__':
+    main()